@@ -0,0 +1,156 @@
+"""
+This module renders many independent drawing scripts at once, e.g. in nightly jobs.
+
+The scripts are spread over a pool of worker processes. Every script runs on a dense canvas and an executor
+of its own, the way main.py runs a script: commands are executed in order and a malformed or rejected command
+is reported along with its line number without stopping the script. The final canvas is written to a file
+of the output directory named after the script. A summary gives the time taken by every script and its errors.
+
+Run this module to render a directory of scripts or the scripts listed in a manifest:
+python batch_render.py SCRIPTS -o OUTPUT_DIR [--workers N] [--report FILE]
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from primitives import Command
+from command_executor import SyncCommandExecutor
+import command_parser
+from canvas import MemoryLessCanvas
+
+# Suffix added to the script names to name the rendered files
+SUFFIX = '.out'
+
+
+def list_scripts(source: str, pattern: str = '*') -> List[str]:
+    """
+    Find the scripts to render
+    :param source: a directory, whose files matching the pattern are taken in name order, or a manifest file
+     listing one script path per line, relative to the manifest directory; blank lines and lines starting
+     with '#' are skipped
+    :param pattern: glob pattern of the script names within a directory
+    :return: script paths
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source))
+                if fnmatch.fnmatch(name, pattern) and os.path.isfile(os.path.join(source, name))]
+    base = os.path.dirname(source)
+    with open(source) as manifest:
+        entries = [line.strip() for line in manifest]
+    return [os.path.join(base, entry) for entry in entries if entry and not entry.startswith('#')]
+
+
+def render_script(script: str, output: str) -> Dict:
+    """
+    Worker side: run a script on a new canvas and write the final canvas to a file.
+    Printing, statistics and viewport commands have no effect and the script stops at the quit command
+    :param script: script path
+    :param output: rendered file path, left empty if the script doesn't create a canvas
+    :return: summary of the run: script and output paths, number of executed commands, errors and time taken
+    """
+    start = time.perf_counter()
+    canvas = MemoryLessCanvas()
+    executor = SyncCommandExecutor()
+    (executed, errors) = (0, [])
+    try:
+        # Undecodable bytes are left for the parser to reject, along with their line numbers
+        with open(script, errors='replace') as lines:
+            for (n, line) in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    command = command_parser.parse(line)
+                    if command.keyword == Command.Keyword.UNKNOWN:
+                        raise ValueError('Unknown command')
+                    if command.keyword == Command.Keyword.QUIT:
+                        break
+                    if command.keyword in (Command.Keyword.FLUSH, Command.Keyword.STATS,
+                                           Command.Keyword.PAN, Command.Keyword.ZOOM):
+                        continue
+                    executor.execute(canvas, command)
+                    executed += 1
+                except (TypeError, ValueError, OverflowError) as e:
+                    errors.append(f'line {n}: {e}')
+        with open(output, 'wb') as f:
+            if canvas.created():
+                f.write(canvas.to_bytes() + b'\n')
+    except OSError as e:
+        errors.append(f'{e.strerror or e}: {e.filename}')
+    except MemoryError:
+        errors.append('Out of memory')
+    except Exception as e:
+        # Whatever goes wrong is reported with the script rather than failing the whole batch
+        errors.append(f'{type(e).__name__}: {e}')
+    return {'script': script, 'output': output, 'commands': executed, 'errors': errors,
+            'seconds': time.perf_counter() - start}
+
+
+def render_all(scripts: List[str], output_dir: str, workers: Optional[int] = None) -> List[Dict]:
+    """
+    Render scripts in parallel
+    :param scripts: script paths, whose file names must be unique
+    :param output_dir: directory to write the rendered files to, created if missing
+    :param workers: number of worker processes, the number of CPUs by default
+    :return: summary of every script run (see render_script()), in the order of the scripts
+    """
+    outputs = [os.path.join(output_dir, os.path.basename(script) + SUFFIX) for script in scripts]
+    if len(set(outputs)) < len(outputs):
+        raise ValueError('Scripts must have distinct file names, their outputs would overwrite each other')
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    # Scripts are handed out a few at a time, which saves round trips to the workers while keeping them
+    # evenly loaded
+    chunk = max(1, min(16, len(scripts) // (workers * 8)))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(render_script, scripts, outputs, chunksize=chunk))
+
+
+def report(results: List[Dict], seconds: float, workers: int) -> str:
+    """
+    Human readable summary of a batch: totals, then the errors of every script having any
+    """
+    failed = [result for result in results if result['errors']]
+    busy = sum(result['seconds'] for result in results)
+    lines = [f'{len(results)} scripts rendered in {seconds:.2f}s by {workers} workers '
+             f'({len(results) / seconds if seconds else 0:.1f} scripts/s, {busy:.2f}s of work), '
+             f'{len(failed)} with errors']
+    for result in failed:
+        lines.append(f'{result["script"]} ({result["seconds"]:.3f}s):')
+        lines.extend(f'  {error}' for error in result['errors'])
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Render many drawing scripts in parallel, one file per script')
+    parser.add_argument('scripts', help='directory of scripts or manifest file listing one script path per line')
+    parser.add_argument('-o', '--output', metavar='DIR', required=True,
+                        help=f'directory to write the rendered canvases to, as SCRIPT_NAME{SUFFIX}')
+    parser.add_argument('--pattern', default='*', help='glob pattern of the scripts to take from a directory')
+    parser.add_argument('--workers', metavar='N', type=int, help='number of worker processes, one per CPU by default')
+    parser.add_argument('--report', metavar='FILE', help='also write the summary of every script as JSON to FILE')
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    try:
+        results = render_all(list_scripts(args.scripts, args.pattern), args.output, workers)
+    except (OSError, ValueError) as e:
+        print(f'Cannot render the scripts: {e}', file=sys.stderr)
+        return 1
+    seconds = time.perf_counter() - start
+
+    print(report(results, seconds, workers), file=sys.stderr)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'seconds': seconds, 'workers': workers, 'scripts': results}, f, indent=2)
+    return 1 if any(result['errors'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""
+Benchmark suite for the canvas backends and the command loop.
+
+Run it with `python -m bench`, see `python -m bench --help` for the options.
+"""
+
+from bench.backends import BACKENDS, register
+from bench.harness import BENCHMARKS, compare, run
@@ -0,0 +1,64 @@
+"""
+Command line entry point: python -m bench
+"""
+
+import argparse
+import json
+import sys
+
+from bench.backends import BACKENDS
+from bench.harness import BENCHMARKS, compare, run
+
+SIZES = [10, 100, 1000]
+# The full run goes up to the 10000x10000 canvases, which take minutes on the slower backends
+FULL_SIZES = SIZES + [10000]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Canvas benchmarks')
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS),
+                        help='backend to benchmark, may be repeated (default: all)')
+    parser.add_argument('--benchmark', action='append', choices=list(BENCHMARKS),
+                        help='benchmark to run, may be repeated (default: all)')
+    sizes = parser.add_mutually_exclusive_group()
+    sizes.add_argument('--sizes', metavar='N', type=int, nargs='+', default=SIZES,
+                       help='canvas sides to run the benchmarks with (default: %s)' % ' '.join(map(str, SIZES)))
+    sizes.add_argument('--full', dest='sizes', action='store_const', const=FULL_SIZES,
+                       help='full run, with every canvas side up to 10000: %s' % ' '.join(map(str, FULL_SIZES)))
+    parser.add_argument('--repeat', metavar='N', type=int, default=5,
+                        help='number of repetitions of every measurement')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the results as JSON to FILE')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='compare the results with those stored in BASELINE and fail on regressions')
+    parser.add_argument('--threshold', metavar='RATIO', type=float, default=0.1,
+                        help='tolerated slowdown when comparing, 0.1 meaning 10%% (default)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    def progress(result):
+        print('{backend:>10} {benchmark:>12} {size:>6}  {ops:>6} ops  best {best:.6f}s  median {median:.6f}s'
+              .format(**result), file=sys.stderr)
+
+    results = run(args.backend or sorted(BACKENDS), args.benchmark or list(BENCHMARKS), args.sizes,
+                  args.repeat, progress)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as stored:
+            baseline = json.load(stored)
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print('regression: {backend} {benchmark} {size}: {baseline:.6f}s -> {current:.6f}s (x{ratio:.2f})'
+                  .format(**regression))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Registry of the canvas backends the benchmarks run against.
+"""
+
+from typing import Callable, Dict
+from traits import Canvas
+from canvas import MemoryLessCanvas, TiledCanvas, RunLengthCanvas
+from parallel import SharedCanvas
+from indexed import IndexedCanvas
+from history import History
+from small import AdaptiveCanvas, ByteCanvas
+
+BACKENDS: Dict[str, Callable[[], Canvas]] = {
+    'dense': MemoryLessCanvas,
+    'tiled': TiledCanvas,
+    'rle': RunLengthCanvas,
+    'history': lambda: MemoryLessCanvas(History()),
+    'shared': SharedCanvas,
+    'indexed': IndexedCanvas,
+    'small': ByteCanvas,
+    'auto': AdaptiveCanvas,
+}
+
+
+def register(name: str, factory: Callable[[], Canvas]):
+    """
+    Make a backend available to the benchmarks
+    :param name: backend name, as used on the command line and in the results
+    :param factory: callable returning a new, not yet created, traits.Canvas implementation
+    :return:
+    """
+    BACKENDS[name] = factory
@@ -0,0 +1,193 @@
+"""
+Timing harness: every benchmark is a pair of an untimed setup, building the canvas state,
+and a timed operation on that state. The state is built again before every repetition
+so that operations changing the canvas (e.g. fill) are always measured under the same conditions.
+"""
+
+import gc
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import command_parser
+from command_executor import SyncCommandExecutor
+from traits import Canvas
+from bench import scenes
+from bench.backends import BACKENDS
+
+
+class Benchmark(NamedTuple):
+    setup: Callable[[Canvas, int], object]
+    operation: Callable[[Canvas, object], int]
+
+
+def _drawn(scene: Callable[[int], List[scenes.Segment]]):
+    def setup(canvas: Canvas, size: int):
+        canvas.create(size, size)
+        for segment in scene(size):
+            canvas.draw('line', *segment)
+    return setup
+
+
+def _draw(shape: str, scene: Callable[[int], List[scenes.Segment]]):
+    def setup(canvas: Canvas, size: int):
+        canvas.create(size, size)
+        return scene(size)
+
+    def operation(canvas: Canvas, segments: List[scenes.Segment]) -> int:
+        for segment in segments:
+            canvas.draw(shape, *segment)
+        return len(segments)
+    return Benchmark(setup, operation)
+
+
+def _fill(x: int, y: int):
+    def operation(canvas: Canvas, state) -> int:
+        canvas.fill(x, y, 'o')
+        return 1
+    return operation
+
+
+def _create(canvas: Canvas, size: int):
+    return size
+
+
+def _recreate(canvas: Canvas, size: int) -> int:
+    canvas.create(size, size)
+    return 1
+
+
+def _clear(canvas: Canvas, state) -> int:
+    canvas.clear()
+    return 1
+
+
+def _to_string(canvas: Canvas, state) -> int:
+    canvas.to_string()
+    return 1
+
+
+def _script(canvas: Canvas, size: int) -> List[str]:
+    return scenes.script(size)
+
+
+def _replay(canvas: Canvas, lines: List[str]) -> int:
+    executor = SyncCommandExecutor()
+    for line in lines:
+        executor.execute(canvas, command_parser.parse(line))
+    return len(lines)
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    'create': Benchmark(_create, _recreate),
+    'clear': Benchmark(_drawn(scenes.spiral), _clear),
+    'draw_line': _draw('line', scenes.spiral),
+    'draw_rect': _draw('rect', scenes.nested_rects),
+    'fill_spiral': Benchmark(_drawn(scenes.spiral), _fill(2, 2)),
+    'fill_maze': Benchmark(_drawn(scenes.maze), _fill(1, 1)),
+    'to_string': Benchmark(_drawn(scenes.spiral), _to_string),
+    'replay': Benchmark(_script, _replay),
+}
+
+
+def measure(factory: Callable[[], Canvas], benchmark: Benchmark, size: int, repeat: int) -> Dict:
+    """
+    Time a benchmark, building a new canvas before every repetition
+    :param factory: backend factory
+    :param benchmark: setup and operation to time
+    :param size: canvas side
+    :param repeat: number of repetitions
+    :return: number of operations per repetition, best and median time in seconds
+    """
+    timings = []
+    ops = 0
+    for _ in range(repeat):
+        canvas = factory()
+        state = benchmark.setup(canvas, size)
+        # Like timeit, keep the garbage collector from interfering with the measurement
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            ops = benchmark.operation(canvas, state)
+            timings.append(time.perf_counter() - start)
+        finally:
+            if collecting:
+                gc.enable()
+        close = getattr(canvas, 'close', None)
+        if close is not None:
+            close()
+        del canvas, state
+    return {
+        'ops': ops,
+        'best': min(timings),
+        'median': statistics.median(timings),
+    }
+
+
+def run(backends: Iterable[str], benchmarks: Iterable[str], sizes: Iterable[int], repeat: int = 5,
+        progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Run every benchmark against every backend and canvas size
+    :param backends: names of registered backends
+    :param benchmarks: names of benchmarks
+    :param sizes: canvas sides
+    :param repeat: number of repetitions of every measurement
+    :param progress: called with every result as soon as it is available
+    :return: JSON serializable results, along with a description of the environment
+    """
+    import numpy
+
+    results = []
+    for backend in backends:
+        for name in benchmarks:
+            for size in sizes:
+                result = {'backend': backend, 'benchmark': name, 'size': size, 'repeat': repeat}
+                result.update(measure(BACKENDS[backend], BENCHMARKS[name], size, repeat))
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+
+
+def _key(result: Dict):
+    return (result['backend'], result['benchmark'], result['size'])
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.1, floor: float = 1e-4) -> List[Dict]:
+    """
+    Find the measurements that got slower than the baseline.
+    Best times are compared, as they are the least sensitive to the noise of the machine
+    :param baseline: results previously returned by run()
+    :param current: results returned by run()
+    :param threshold: tolerated relative slowdown, 0.1 meaning 10%
+    :param floor: times in seconds below which measurements are too noisy to be compared
+    :return: one entry per regression with the baseline and the current best times and their ratio
+    """
+    reference = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = reference.get(_key(result))
+        if previous is None or max(previous['best'], result['best']) < floor:
+            continue
+        ratio = result['best'] / max(previous['best'], floor)
+        if ratio > 1 + threshold:
+            regressions.append({
+                'backend': result['backend'],
+                'benchmark': result['benchmark'],
+                'size': result['size'],
+                'baseline': previous['best'],
+                'current': result['best'],
+                'ratio': ratio,
+            })
+    return regressions
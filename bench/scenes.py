@@ -0,0 +1,73 @@
+"""
+Drawings used by the benchmarks, given as lists of coordinate rows (1-based, inclusive)
+so that they can be both drawn directly and turned into command scripts.
+"""
+
+from typing import List, Tuple
+
+Segment = Tuple[int, int, int, int]
+
+
+def spiral(size: int) -> List[Segment]:
+    """
+    Square spiral wall leaving a one cell wide corridor from the outer corner to the center,
+    the longest possible path for a fill started in the corridor
+    :param size: canvas side
+    :return: line segments
+    """
+    (x, y) = (1, 1)
+    segments = []
+    steps = ((1, 0), (0, 1), (-1, 0), (0, -1))
+    length = size - 1
+    turn = 0
+    while length > 0:
+        (dx, dy) = steps[turn % 4]
+        segments.append((x, y, x + dx * length, y + dy * length))
+        (x, y) = (x + dx * length, y + dy * length)
+        turn += 1
+        # Every turn but the first two sides shortens the next two sides by the corridor and the wall
+        if turn >= 3 and turn % 2 == 1:
+            length -= 2
+    return segments
+
+
+def maze(size: int) -> List[Segment]:
+    """
+    Comb of vertical walls alternately attached to the top and the bottom border,
+    splitting every row into short runs and forcing a fill to snake through all the columns
+    :param size: canvas side
+    :return: line segments
+    """
+    segments = []
+    for x in range(2, size + 1, 2):
+        if x % 4 == 2:
+            segments.append((x, 1, x, size - 1))
+        else:
+            segments.append((x, 2, x, size))
+    return segments
+
+
+def nested_rects(size: int) -> List[Segment]:
+    """
+    Concentric rectangles one cell apart
+    :param size: canvas side
+    :return: rectangle corners
+    """
+    return [(i, i, size + 1 - i, size + 1 - i) for i in range(1, (size + 1) // 2 + 1, 2)]
+
+
+def script(size: int) -> List[str]:
+    """
+    Command script drawing the spiral, the rectangles and the maze on top of each other with fills in between
+    :param size: canvas side
+    :return: command lines
+    """
+    lines = [f'C {size} {size}']
+    lines += ['L %d %d %d %d' % segment for segment in spiral(size)]
+    lines.append('B 2 2 o')
+    lines.append('C %d %d' % (size, size))
+    lines += ['R %d %d %d %d' % rect for rect in nested_rects(size)]
+    lines += ['L %d %d %d %d' % segment for segment in maze(size)]
+    lines.append('B 1 1 o')
+    lines.append('B 1 1 x')
+    return lines
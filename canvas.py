@@ -6,57 +6,276 @@ Concrete representation of the grid is up to each implementation.
 """
 
 from __future__ import annotations
-from typing import List
+import copy
+import functools
+import itertools
+import os
+import tempfile
+import time
+from abc import abstractmethod
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple, Union
 from traits import Canvas
+from history import Delta, GridDelta, History, ResizeDelta
+from viewport import Viewport
 import numpy as np
+import regions
+import snapshot
 
+ASCII_NEWLINE = 10
 ASCII_WHITESPACE = 32
+ASCII_DASH = 45
 ASCII_X = 120
+ASCII_BAR = 124
+
+# Number of points of inclined lines rasterized at once by batch drawing
+LINE_CHUNK = 2 ** 22
+
+# Number of runs per row a scanline fill paints one at a time before labeling the rest of the area at once
+SCANLINE_RUNS_PER_ROW = 4
+
+# Number of points of the bands of rows labeled at once by fills of fragmented areas
+FILL_BAND = 2 ** 22
+
+
+def _recorded(operation):
+    """
+    Decorator recording all the changes made by a canvas operation as a single history entry
+    """
+    @functools.wraps(operation)
+    def wrapper(self, *args, **kwargs):
+        if self.history is None or self._journal is not None:
+            # History is off or the changes are recorded as a part of an enclosing operation
+            return operation(self, *args, **kwargs)
+        self._journal = []
+        try:
+            return operation(self, *args, **kwargs)
+        finally:
+            (journal, self._journal) = (self._journal, None)
+            if journal:
+                self.history.push(Delta.concat(journal))
+    return wrapper
+
+
+class GridCanvas(Canvas):
+    """
+    Base class for canvases keeping one byte per point in a width x height grid.
+
+    Implements arguments validation, cropping to the visible area and changes tracking,
+    leaving the storage of the grid to a few primitives of the concrete implementation.
+    All primitives take 0-based coordinates already checked against the canvas dimensions.
+    """
 
-class MemoryLessCanvas(Canvas):
     def __init__(self):
-        self.data: np.array = np.asarray([], dtype='uint8')
+        self.dirty: Optional[Tuple[int, int]] = None
+        # Undo/redo is available to the implementations reporting their changes to the journal
+        self.history: Optional[History] = None
+        self._journal: Optional[List] = None
 
 
-    @property
-    def width(self) -> int:
+    @abstractmethod
+    def to_array(self) -> np.array:
         """
-        Canvas width getter
+        Canvas contents as a dense (height, width) uint8 array
         """
-        return self.data.shape[1]
+        pass
 
 
-    @property
-    def height(self) -> int:
+    @abstractmethod
+    def _point(self, x: int, y: int) -> int:
         """
-        Canvas height getter
+        Read a single point
+        :param x: x coordinate
+        :param y: y coordinate
+        :return: point color
         """
-        return self.data.shape[0]
+        pass
 
 
-    def create(self, width: int, height: int):
-        self.data = np.zeros((height, width), dtype='uint8') + ASCII_WHITESPACE
+    @abstractmethod
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        """
+        Paint the [left, right) span of a row
+        :param y: row index
+        :param left: first point of the span
+        :param right: point following the last one of the span
+        :param color: new color
+        """
+        pass
 
 
-    def created(self) -> bool:
-        return self.data.size != 0
+    @abstractmethod
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        """
+        Paint the [top, bottom) span of a column
+        :param x: column index
+        :param top: first point of the span
+        :param bottom: point following the last one of the span
+        :param color: new color
+        """
+        pass
 
 
-    def clear(self):
-        shape = self.data.shape
-        self.data = np.zeros(shape, dtype='uint8') + ASCII_WHITESPACE
+    def _paint_points(self, rows: np.array, cols: np.array, color: int):
+        """
+        Paint scattered points, e.g. those of an inclined line. Points are painted a row run at a time
+        unless the storage can do better
+        :param rows: 0-based rows of the points
+        :param cols: 0-based columns of the points
+        :param color: new color
+        """
+        if not rows.size:
+            return
+        order = np.lexsort((cols, rows))
+        (rows, cols) = (rows[order], cols[order])
+        breaks = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 1)) + 1
+        (starts, ends) = (np.r_[0, breaks], np.r_[breaks, rows.size])
+        for (y, left, right) in zip(rows[starts].tolist(), cols[starts].tolist(), (cols[ends - 1] + 1).tolist()):
+            self._paint_row(y, left, right, color)
+
+
+    @abstractmethod
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Bucket fill starting from a point of old_color; responsible for marking the changed rows dirty
+        :param x: x coordinate of the base point
+        :param y: y coordinate of the base point
+        :param old_color: base point color before repainting
+        :param new_color: point new color
+        """
+        pass
+
+
+    @abstractmethod
+    def _import(self, data: np.array):
+        """
+        Replace the canvas with a grid, its dimensions included; responsible for marking the rows dirty
+        :param data: uint8 array of shape (height, width), which may be kept by reference
+        """
+        pass
+
+
+    @abstractmethod
+    def _fork(self, twin: GridCanvas):
+        """
+        Let a shallow copy of the canvas share the storage of the grid until either of them changes it
+        :param twin: the copy, whose attributes are still the same objects as the canvas ones
+        """
+        pass
+
+
+    def _sample(self, ys: np.array, xs: np.array) -> np.array:
+        """
+        Read the points at the crossings of a few rows and columns, e.g. to render a viewport
+        :param ys: 0-based rows, sorted
+        :param xs: 0-based columns, sorted
+        :return: uint8 array of shape (len(ys), len(xs))
+        """
+        return self.to_array()[np.ix_(ys, xs)]
+
+
+    def view_to_bytes(self, view: Viewport) -> bytes:
+        """
+        Serialize the part of the canvas seen through a viewport. A zoomed out cell shows the most frequent
+        drawn color among a few points sampled evenly in its area, the highest one on ties, so that a drawing
+        shows up over blank points at moderate zoom levels while the cost only depends on the viewport size
+        """
+        (ys, xs, k) = view.samples(self.width, self.height)
+        points = self._sample(np.asarray(ys, dtype='int64'), np.asarray(xs, dtype='int64'))
+        (h, w) = (len(ys) // k, len(xs) // k)
+        frame = np.empty((h + 2, w + 3), dtype='uint8')
+        frame[0, :w + 2] = ASCII_DASH
+        frame[h + 1, :w + 2] = ASCII_DASH
+        _frame_rows(frame[1:h + 1], _dominant(points.reshape(h, k, w, k).transpose(0, 2, 1, 3).reshape(h, w, k * k)))
+        frame[:, w + 2] = ASCII_NEWLINE
+        return frame.reshape(-1)[:-1].tobytes()
+
+
+    def clone(self) -> GridCanvas:
+        """
+        Copy of the canvas sharing its storage with the original: nothing is copied up front and the parts
+        of the grid shared by both are only copied by the first of them to paint them. The copy starts with
+        an empty history of its own
+        """
+        twin = copy.copy(self)
+        twin.history = History(self.history.budget) if self.history is not None else None
+        twin._journal = None
+        twin.dirty = None
+        self._fork(twin)
+        twin._mark_dirty(0, twin.height)
+        return twin
+
+
+    def save(self, path: str, compression: int = snapshot.COMPRESSION_NONE):
+        snapshot.save(path, self.to_array(), compression)
+
+
+    def load(self, path: str):
+        self._import(snapshot.load(path))
 
 
     def to_string(self) -> str:
-        (h, w) = self.data.shape
-        bar = ''
-        for i in range(w + 2):
-            bar += '-'
+        # Canvas points are single bytes, latin-1 maps them to the same code points chr() does
+        return self.to_bytes().decode('latin-1')
+
+
+    def take_dirty_rows(self) -> Tuple[int, int]:
+        """
+        Changes are always tracked, so this never returns None
+        :return: [top, bottom) range of the rows changed since the previous call, (0, 0) if nothing changed
+        """
+        dirty = self.dirty
+        self.dirty = None
+        return dirty if dirty is not None else (0, 0)
+
 
-        def f(l: List) -> str:
-            return '|' + ''.join(list(map(lambda x: chr(x), l))) + '|' + '\n'
+    def undo(self):
+        if self.history is None:
+            raise ValueError('Undo history is not enabled')
+        delta = self.history.undo()
+        (history, self.history) = (self.history, None)
+        try:
+            delta.revert(self)
+        finally:
+            self.history = history
 
-        return bar + '\n' + ''.join(list(map(f, self.data.tolist()))) + bar
+
+    def redo(self):
+        if self.history is None:
+            raise ValueError('Undo history is not enabled')
+        delta = self.history.redo()
+        (history, self.history) = (self.history, None)
+        try:
+            delta.apply(self)
+        finally:
+            self.history = history
+
+
+    def _record(self, index: np.array, before: np.array, color: int):
+        """
+        Report changed points to the journal of the current operation
+        :param index: flat indices of the points
+        :param before: colors of the points before the change
+        :param color: the new color of the points
+        """
+        if index.size:
+            if self.width * self.height < 2 ** 31:
+                index = index.astype('int32')
+            self._journal.append((index, before.copy(), np.full(index.size, color, dtype='uint8')))
+
+
+    def _mark_dirty(self, top: int, bottom: int):
+        """
+        Extend the range of rows changed since the last take_dirty_rows() call
+        :param top: first changed row (0-based)
+        :param bottom: row following the last changed one (0-based)
+        """
+        if top >= bottom:
+            return
+        if self.dirty is not None:
+            top = min(top, self.dirty[0])
+            bottom = max(bottom, self.dirty[1])
+        self.dirty = (top, bottom)
 
 
     def draw(self, shape, *argv):
@@ -66,18 +285,23 @@ class MemoryLessCanvas(Canvas):
             return self.draw_rect(*argv)
 
 
+    @_recorded
     def draw_line(self, *argv):
         if len(argv) < 4:
             return
-        (h, w) = self.data.shape
+        (h, w) = (self.height, self.width)
         x1 = argv[0]
         y1 = argv[1]
         x2 = argv[2]
         y2 = argv[3]
 
-        # Check if the line is either horizontal or vertical, throw exception otherwise
+        # Inclined lines are rasterized point by point
         if not (x1 == x2 or y1 == y2):
-            raise ValueError('Only horizontal or vertical lines are currently supported, try again')
+            (rows, cols) = _line_points(np.array([[x1, y1, x2, y2]]), w, h)
+            if rows.size:
+                self._paint_points(rows, cols, ASCII_X)
+                self._mark_dirty(int(rows.min()), int(rows.max()) + 1)
+            return
 
         # Check if the line is horizontal and can potentially cross the visible area
         if y1 == y2 and 0 < y1 <= h:
@@ -90,8 +314,8 @@ class MemoryLessCanvas(Canvas):
             # Crop line segments outside of the visible area
             left = max(left, 0)
             right = min(right, w)
-            for j in range(left, right):
-                self.data[y][j] = ASCII_X
+            self._paint_row(y, left, right, ASCII_X)
+            self._mark_dirty(y, y + 1)
 
         # Check if the line is vertical and can be draw (at least partially)
         if x1 == x2 and 0 < x1 <= w:
@@ -104,14 +328,15 @@ class MemoryLessCanvas(Canvas):
             # Crop line segments outside of the visible area
             top = max(top, 0)
             bottom = min(bottom, h)
-            for i in range(top, bottom):
-                self.data[i][x] = ASCII_X
+            self._paint_column(x, top, bottom, ASCII_X)
+            self._mark_dirty(top, bottom)
 
 
+    @_recorded
     def draw_rect(self, *argv):
         if len(argv) < 4:
             return
-        (h, w) = self.data.shape
+        (h, w) = (self.height, self.width)
         x1 = argv[0]
         y1 = argv[1]
         x2 = argv[2]
@@ -131,8 +356,9 @@ class MemoryLessCanvas(Canvas):
         self.draw_line(x1, y2, x1, y1)
 
 
+    @_recorded
     def fill(self, x: int, y: int, color: str):
-        (h, w) = self.data.shape
+        (h, w) = (self.height, self.width)
 
         # If the base point is outside the visible area simply return
         if not (0 < x <= w and 0 < y <= h):
@@ -143,43 +369,1166 @@ class MemoryLessCanvas(Canvas):
         y -= 1  # Convert to 0-based coordinates
 
         # If the current color of the base point matches the new color we just return
-        if self.data[y][x] == c:
+        old = self._point(x, y)
+        if old == c:
             return
 
-        self._paint_neighbours(x, y, self.data[y][x], c, np.zeros_like(self.data, dtype='uint8'))
+        self._flood(x, y, old, c)
+
+
+class MemoryLessCanvas(GridCanvas):
+    def __init__(self, history: Optional[History] = None):
+        """
+        :param history: undo/redo history to record the changes to, if any
+        """
+        super().__init__()
+        self.data: np.array = np.asarray([], dtype='uint8')
+        self.history = history
+        # Ownership token of the grid: the number of canvases sharing it, the same list object for all of them
+        self._owners = [1]
+
+
+    @property
+    def width(self) -> int:
+        """
+        Canvas width getter
+        """
+        return self.data.shape[1]
+
+
+    @property
+    def height(self) -> int:
+        """
+        Canvas height getter
+        """
+        return self.data.shape[0]
+
+
+    def create(self, width: int, height: int):
+        before = self.data
+        data = np.full((height, width), ASCII_WHITESPACE, dtype='uint8')
+        self._unshare()
+        self.data = data
+        self._mark_dirty(0, height)
+        if self.history is not None:
+            # The previous grid is replaced rather than modified, so it can be kept as is
+            self.history.push(ResizeDelta(before, width, height))
+
+
+    def created(self) -> bool:
+        return self.data.size != 0
+
+
+    @_recorded
+    def clear(self):
+        if self._journal is not None:
+            flat = self.data.reshape(-1)
+            changed = np.flatnonzero(flat != ASCII_WHITESPACE)
+            self._record(changed, flat[changed], ASCII_WHITESPACE)
+        self._writable().fill(ASCII_WHITESPACE)
+        self._mark_dirty(0, self.height)
+
+
+    def to_array(self) -> np.array:
+        return self.data.copy()
+
+
+    def save(self, path: str, compression: int = snapshot.COMPRESSION_NONE):
+        # Written straight from the grid, no copy needed
+        snapshot.save(path, self.data, compression)
+
+
+    def _import(self, data: np.array):
+        before = self.data
+        self._apply_grid(data)
+        if self.history is not None:
+            self.history.push(GridDelta(before, data))
+
+
+    def _fork(self, twin: MemoryLessCanvas):
+        # Both canvases hold the same grid and ownership token: whichever paints first copies the grid
+        # and leaves the other one its sole owner, painting it in place
+        self._owners[0] += 1
+
+
+    def restore(self, backup: MemoryLessCanvas):
+        # Recorded as a replacement of the grid, like a loaded snapshot. The clone isn't used anymore,
+        # so its grid is taken over along with its share of it rather than copied
+        owners = backup._owners
+        backup._owners = [1]
+        self._import(backup.data)
+        self._owners = owners
+
+
+    def _writable(self) -> np.array:
+        """
+        The grid, copied first if it is shared with other canvases or read-only
+        """
+        if self._owners[0] > 1:
+            self._owners[0] -= 1
+            self._owners = [1]
+            self.data = self.data.copy()
+        elif not self.data.flags.writeable:
+            self.data = self.data.copy()
+        return self.data
+
+
+    def _unshare(self):
+        """
+        Leave the grid to the canvases sharing it, before it is replaced as a whole
+        """
+        if self._owners[0] > 1:
+            self._owners[0] -= 1
+            if self.history is not None:
+                # The history keeps the grid by reference, the other canvases must not paint it in place anymore
+                self.data.flags.writeable = False
+        self._owners = [1]
+
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize canvas contents framed with borders straight from the data buffer
+        :return: the same contents as to_string() as a bytes object
+        """
+        (h, w) = self.data.shape
+
+        # Every output line is the row itself with the side borders and the line break around it,
+        # so the whole frame is a (h + 2) x (w + 3) byte matrix
+        frame = np.empty((h + 2, w + 3), dtype='uint8')
+        frame[0, :w + 2] = ASCII_DASH
+        frame[h + 1, :w + 2] = ASCII_DASH
+        _frame_rows(frame[1:h + 1], self.data)
+        frame[:, w + 2] = ASCII_NEWLINE
+
+        # No line break after the bottom border
+        return frame.reshape(-1)[:-1].tobytes()
+
+
+    def rows_to_bytes(self, top: int, bottom: int) -> bytes:
+        rows = self.data[top:bottom]
+        frame = np.empty((rows.shape[0], rows.shape[1] + 3), dtype='uint8')
+        _frame_rows(frame, rows)
+        return frame.tobytes()
+
+
+    def _sample(self, ys: np.array, xs: np.array) -> np.array:
+        return self.data[np.ix_(ys, xs)]
+
+
+    @_recorded
+    def draw_many(self, shape, coords):
+        """
+        Batch drawing method: rasterizes all the shapes in one vectorized pass.
+        The whole batch is validated before anything is drawn
+        :param shape: 'line' or 'rect'
+        :param coords: integer array-like of shape (N, 4), one (x1, y1, x2, y2) row per shape
+        """
+        coords = np.asarray(coords, dtype='int64').reshape(-1, 4)
+        (x1, y1, x2, y2) = coords.T
+
+        inclined = None
+        if shape == 'line':
+            straight = (x1 == x2) | (y1 == y2)
+            (segments, inclined) = (coords[straight], coords[~straight])
+        elif shape == 'rect':
+            # Check if the provided coordinates are consistent
+            if ((x1 > x2) | (y1 > y2)).any():
+                raise ValueError('Rectangle must have a non-negative area, try again')
+            segments = np.concatenate([
+                np.stack([x1, y1, x2, y1], axis=1),
+                np.stack([x2, y1, x2, y2], axis=1),
+                np.stack([x2, y2, x1, y2], axis=1),
+                np.stack([x1, y2, x1, y1], axis=1),
+            ])
+        else:
+            raise ValueError(f'Unknown shape {shape}')
+
+        index = _segments_mask(segments, self.width, self.height)
+        if inclined is not None and inclined.size:
+            # Points of long batches are gathered a chunk at a time into a mask, which bounds the memory used
+            (w, h) = (self.width, self.height)
+            spans = np.abs(inclined[:, 2:].astype('float64') - inclined[:, :2]).max(axis=1)
+            lengths = np.minimum(spans + 1, max(w, h))
+            chunks = np.flatnonzero(np.diff(np.cumsum(lengths) // LINE_CHUNK)) + 1
+            if isinstance(index, tuple) and chunks.size:
+                mask = np.zeros((h, w), dtype='bool')
+                mask[index] = True
+                index = mask
+            for part in np.split(inclined, chunks):
+                (rows, cols) = _line_points(part, w, h)
+                if isinstance(index, tuple):
+                    index = (np.concatenate([index[0], rows]), np.concatenate([index[1], cols]))
+                else:
+                    index[rows, cols] = True
+        if self._journal is not None:
+            flat = np.ravel_multi_index(index, self.data.shape) if isinstance(index, tuple) else np.flatnonzero(index)
+            before = self.data.reshape(-1)[flat]
+            changed = before != ASCII_X
+            self._record(flat[changed], before[changed], ASCII_X)
+        self._writable()[index] = ASCII_X
+
+        rows = index[0] if isinstance(index, tuple) else np.flatnonzero(index.any(axis=1))
+        if rows.size:
+            self._mark_dirty(int(rows.min()), int(rows.max()) + 1)
+
+
+    def _point(self, x: int, y: int) -> int:
+        return int(self.data[y, x])
+
+
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        span = self._writable()[y, left:right]
+        if self._journal is not None:
+            changed = np.flatnonzero(span != color)
+            self._record(y * self.width + left + changed, span[changed], color)
+        span[:] = color
+
+
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        span = self._writable()[top:bottom, x]
+        if self._journal is not None:
+            changed = np.flatnonzero(span != color)
+            self._record((top + changed) * self.width + x, span[changed], color)
+        span[:] = color
 
 
-    def _paint_neighbours(self, x: int, y: int, old_color: int, new_color: int, visited: np.array):
+    def _paint_points(self, rows: np.array, cols: np.array, color: int):
+        data = self._writable()
+        if self._journal is not None:
+            before = data[rows, cols]
+            changed = before != color
+            self._record(rows[changed] * self.width + cols[changed], before[changed], color)
+        data[rows, cols] = color
+
+
+    def _apply_points(self, index: np.array, colors: np.array):
+        """
+        Set the colors of points given by their flat indices, used to replay history deltas
+        """
+        if index.size:
+            self._writable().reshape(-1)[index] = colors
+            rows = index // self.width
+            self._mark_dirty(int(rows.min()), int(rows.max()) + 1)
+
+
+    def _apply_grid(self, data: np.array):
         """
-        Auxiliary method called recursively to paint the immediate neighbours of a point
+        Replace the grid as a whole, used to replay history deltas
+        """
+        self._unshare()
+        self.data = data
+        self._mark_dirty(0, self.height if data.size else 0)
+
+
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Iterative scanline flood fill (4-connected).
+        The area being filled is made of the points of either the old or the new color connected to the base point,
+        which matches the semantics of the original recursive implementation.
+        Every horizontal run of such points is painted with a single slice assignment; the frontier holds one entry
+        per run of the neighbouring rows instead of one entry per point.
+        Painting keeps points inside the area, so the runs of a row are found once, the first time the fill
+        reaches it, and its neighbours are then looked up by bisection: the cost is linear in the number
+        of rows reached and of runs painted rather than in runs times the canvas width.
+        An area made of many more runs than rows, like a maze, would still take a Python step per run:
+        past a few runs per row, the rest of it is filled by _flood_bands() instead.
         No arguments boundary checks required here (all done in calling method)
-        :param x: x coordinate
-        :param y: y coordinate
-        :param old_color: point color before repainting
+        :param x: x coordinate of the base point (0-based)
+        :param y: y coordinate of the base point (0-based)
+        :param old_color: base point color before repainting
         :param new_color: point new color
-        :param visited: np.array of the same shape as the canvas that tracks visited points
         """
         (h, w) = self.data.shape
+        data = self._writable()
+        # Runs of the area in every row reached so far: (left ends, right ends)
+        runs: Dict[int, Tuple[List[int], List[int]]] = {}
+
+        def row_runs(row: int) -> Tuple[List[int], List[int]]:
+            if row not in runs:
+                inside = _inside(data[row], old_color, new_color).view('int8')
+                edges = np.diff(np.concatenate(([0], inside, [0])))
+                runs[row] = (np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist())
+            return runs[row]
+
+        # Runs already painted during this call identified by (row, run index)
+        painted = set()
+        (top, bottom) = (y, y + 1)
+        budget = SCANLINE_RUNS_PER_ROW * h
+        stack = [(y, bisect_right(row_runs(y)[0], x) - 1)]
+        while stack:
+            (y, i) = stack.pop()
+            if (y, i) in painted:
+                continue
+            if len(painted) == budget:
+                # Painted points are still inside the area, which is found again as a whole
+                self._mark_dirty(top, bottom)
+                return self._flood_bands(runs[y][0][i], y, old_color, new_color)
+            painted.add((y, i))
+            (left, right) = (runs[y][0][i], runs[y][1][i])
+            self._paint_row(y, left, right, new_color)
+            top = min(top, y)
+            bottom = max(bottom, y + 1)
+
+            for ny in (y - 1, y + 1):
+                if ny < 0 or ny >= h:
+                    continue
+                (starts, ends) = row_runs(ny)
+                # The runs of the neighbouring row overlapping [left, right)
+                j = bisect_right(ends, left)
+                while j < len(starts) and starts[j] < right:
+                    if (ny, j) not in painted:
+                        stack.append((ny, j))
+                    j += 1
+
+        self._mark_dirty(top, bottom)
+
+
+    def _flood_bands(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Fill with whole-array operations, whatever the number of runs of the area: the runs of bands
+        of rows are labeled (see regions module), the regions of the bands are joined at their boundaries,
+        then the runs of the area are painted band by band. Bands are labeled again rather than kept
+        for the painting pass, which bounds the memory taken by fills of large canvases
+        :param x: x coordinate of a point of the area (0-based)
+        :param y: y coordinate of a point of the area (0-based)
+        :param old_color: base point color before repainting
+        :param new_color: point new color
+        """
+        (h, w) = self.data.shape
+        step = max(1, FILL_BAND // w)
+        bands = [(top, min(top + step, h)) for top in range(0, h, step)]
+
+        def label(top: int, bottom: int):
+            return regions.label_runs(_inside(self.data[top:bottom], old_color, new_color))
+
+        summaries = []
+        seed = None
+        for (i, (top, bottom)) in enumerate(bands):
+            (rows, starts, ends, labels) = label(top, bottom)
+            (first, last) = (rows == 0, rows == bottom - top - 1)
+            summaries.append((rows.size, (starts[first], ends[first], labels[first]),
+                              (starts[last], ends[last], labels[last])))
+            if top <= y < bottom:
+                seed = (i, int(labels[regions.run_at(rows, starts, ends, x, y - top)]))
+        (offsets, area) = regions.join_bands(summaries, seed)
+
+        for (i, (top, bottom)) in enumerate(bands):
+            selected = area[(area >= offsets[i]) & (area < offsets[i + 1])] - offsets[i]
+            if not selected.size:
+                continue
+            (rows, starts, ends, labels) = label(top, bottom)
+            pick = np.isin(labels, selected)
+            cover = np.zeros((bottom - top, w), dtype='uint8')
+            regions.paint_runs(cover, rows[pick], starts[pick], ends[pick], 1)
+            (ys, xs) = np.nonzero(cover)
+            self._paint_points(ys + top, xs, new_color)
+            self._mark_dirty(top + int(ys[0]), top + int(ys[-1]) + 1)
+
+
+class MappedCanvas(MemoryLessCanvas):
+    """
+    Canvas kept in a memory-mapped file.
+
+    The OS pages the grid in and out on demand, so canvases larger than RAM can be drawn on,
+    and the drawing survives the process: constructing a MappedCanvas over an existing file maps it back
+    without reading it. The file is in the snapshot format (see snapshot module).
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0):
+        """
+        :param path: canvas file, mapped right away if it exists
+        :param flush_interval: if positive, changes are written back to the file at most every that many seconds
+        """
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flushed_at = time.monotonic()
+        if os.path.exists(path):
+            self._map()
+
+
+    def create(self, width: int, height: int):
+        # Checks the dimensions before the file is touched
+        header = snapshot.pack_header(width, height)
+        # The new file is built next to the canvas one and moved in place once complete,
+        # so a failure leaves the previous drawing as it was
+        (fd, temporary) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                # Extending the file doesn't allocate any memory, it is zero-filled by the OS
+                f.truncate(snapshot.HEADER.size + width * height)
+            # Drop the previous mapping before the file gets replaced
+            self.data = np.asarray([], dtype='uint8')
+            os.replace(temporary, self.path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        self._map()
+        self.data.fill(ASCII_WHITESPACE)
+
+
+    def _import(self, data: np.array):
+        self.create(data.shape[1], data.shape[0])
+        self.data[...] = data
+
+
+    def clone(self) -> MemoryLessCanvas:
+        """
+        In-memory copy of the canvas; the file stays with this canvas, so the grid is copied right away
+        """
+        twin = MemoryLessCanvas()
+        twin._apply_grid(np.array(self.data))
+        return twin
+
+
+    def flush(self):
+        """
+        Write the changes back to the file
+        """
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.flushed_at = time.monotonic()
+
+
+    def close(self):
+        """
+        Flush the changes and unmap the file
+        """
+        self.flush()
+        self.data = np.asarray([], dtype='uint8')
+
+
+    def _map(self):
+        with open(self.path, 'rb') as f:
+            (width, height, compression) = snapshot.read_header(f)
+        if compression != snapshot.COMPRESSION_NONE:
+            raise ValueError('Compressed canvas files cannot be mapped')
+        if width * height == 0:
+            # Nothing to map - the canvas is not created
+            self.data = np.asarray([], dtype='uint8')
+        else:
+            self.data = np.memmap(self.path, dtype='uint8', mode='r+', offset=snapshot.HEADER.size,
+                                  shape=(height, width))
+        self._mark_dirty(0, height)
+
+
+    def _mark_dirty(self, top: int, bottom: int):
+        super()._mark_dirty(top, bottom)
+        if self.flush_interval > 0 and time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+
+class TiledCanvas(GridCanvas):
+    """
+    Sparse canvas for very large dimensions.
+
+    The grid is split into square tiles allocated on first write. A tile is either missing, which stands for
+    a blank tile, a single color shared by all its points or a dense uint8 array, so memory scales with
+    the drawn area rather than with the declared canvas size.
+    """
+
+    def __init__(self, tile_size: int = 128):
+        """
+        :param tile_size: tile side length
+        """
+        super().__init__()
+        self.tile_size = tile_size
+        self.tiles: Dict[Tuple[int, int], Union[int, np.array]] = {}
+        self._width = 0
+        self._height = 0
+
+
+    @property
+    def width(self) -> int:
+        """
+        Canvas width getter
+        """
+        return self._width
+
+
+    @property
+    def height(self) -> int:
+        """
+        Canvas height getter
+        """
+        return self._height
+
+
+    def create(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self.tiles = {}
+        self._mark_dirty(0, height)
+
+
+    def created(self) -> bool:
+        return self._width * self._height != 0
+
+
+    def clear(self):
+        self.tiles = {}
+        self._mark_dirty(0, self._height)
+
+
+    def to_array(self) -> np.array:
+        data = np.full((self._height, self._width), ASCII_WHITESPACE, dtype='uint8')
+        self._blit(data, 0, self._height)
+        return data
+
+
+    def _import(self, data: np.array):
+        """
+        Split a grid into tiles, keeping uniform ones as a single color and leaving the blank ones out
+        """
+        (h, w) = data.shape
+        self.create(w, h)
+        t = self.tile_size
+        for ty in range((h - 1) // t + 1 if h else 0):
+            for tx in range((w - 1) // t + 1 if w else 0):
+                tile = data[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t]
+                color = int(tile[0, 0])
+                if not (tile == color).all():
+                    self.tiles[(ty, tx)] = tile.copy()
+                elif color != ASCII_WHITESPACE:
+                    self.tiles[(ty, tx)] = color
+
+
+    def to_bytes(self) -> bytes:
+        (h, w) = (self._height, self._width)
+        frame = np.empty((h + 2, w + 3), dtype='uint8')
+        frame[0, :w + 2] = ASCII_DASH
+        frame[h + 1, :w + 2] = ASCII_DASH
+        self._frame(frame[1:h + 1], 0, h)
+        frame[:, w + 2] = ASCII_NEWLINE
+        return frame.reshape(-1)[:-1].tobytes()
+
+
+    def rows_to_bytes(self, top: int, bottom: int) -> bytes:
+        bottom = min(bottom, self._height)
+        frame = np.empty((max(bottom - top, 0), self._width + 3), dtype='uint8')
+        self._frame(frame, top, bottom)
+        return frame.tobytes()
+
+
+    def _frame(self, frame: np.array, top: int, bottom: int):
+        """
+        Lay out a range of rows as output lines; only the allocated tiles are visited
+        """
+        _frame_rows(frame, ASCII_WHITESPACE)
+        self._blit(frame[:, 1:self._width + 1], top, bottom)
+
+
+    def _blit(self, out: np.array, top: int, bottom: int):
+        """
+        Copy the tiles overlapping the [top, bottom) range of rows into an array of the canvas width
+        """
+        t = self.tile_size
+        for ((ty, tx), tile) in self.tiles.items():
+            y0 = ty * t
+            if y0 >= bottom or y0 + t <= top:
+                continue
+            (first, last) = (max(top, y0), min(bottom, y0 + t, self._height))
+            x0 = tx * t
+            x1 = min(x0 + t, self._width)
+            if isinstance(tile, int):
+                out[first - top:last - top, x0:x1] = tile
+            else:
+                out[first - top:last - top, x0:x1] = tile[first - y0:last - y0]
+
+
+    def _sample(self, ys: np.array, xs: np.array) -> np.array:
+        """
+        Visit the tiles the sampled points fall into, uniform and missing ones without looking at their points
+        """
+        out = np.full((ys.size, xs.size), ASCII_WHITESPACE, dtype='uint8')
+        t = self.tile_size
+        for (ty, r0, r1) in _groups(ys // t):
+            for (tx, c0, c1) in _groups(xs // t):
+                tile = self.tiles.get((ty, tx))
+                if tile is None:
+                    continue
+                if isinstance(tile, int):
+                    out[r0:r1, c0:c1] = tile
+                else:
+                    out[r0:r1, c0:c1] = tile[np.ix_(ys[r0:r1] - ty * t, xs[c0:c1] - tx * t)]
+        return out
+
+
+    def _fork(self, twin: TiledCanvas):
+        # Dense tiles shared by several canvases are read-only: they are copied by the canvas painting them first
+        twin.tiles = dict(self.tiles)
+        for tile in self.tiles.values():
+            if not isinstance(tile, int):
+                tile.flags.writeable = False
+
+
+    def restore(self, backup: TiledCanvas):
+        (self._width, self._height, self.tiles) = (backup.width, backup.height, backup.tiles)
+        self._mark_dirty(0, self._height)
+
+
+    def _tile_shape(self, ty: int, tx: int) -> Tuple[int, int]:
+        t = self.tile_size
+        return min(t, self._height - ty * t), min(t, self._width - tx * t)
+
+
+    def _writable_tile(self, ty: int, tx: int, color: int) -> Optional[np.array]:
+        """
+        Get a dense tile to be painted with the color, allocating it if necessary
+        :return: the tile or None if it is uniformly painted with the color already
+        """
+        tile = self.tiles.get((ty, tx), ASCII_WHITESPACE)
+        if isinstance(tile, int):
+            if tile == color:
+                return None
+            tile = np.full(self._tile_shape(ty, tx), tile, dtype='uint8')
+            self.tiles[(ty, tx)] = tile
+        elif not tile.flags.writeable:
+            # Shared with a clone
+            tile = self.tiles[(ty, tx)] = tile.copy()
+        return tile
+
+
+    def _point(self, x: int, y: int) -> int:
+        t = self.tile_size
+        tile = self.tiles.get((y // t, x // t), ASCII_WHITESPACE)
+        return tile if isinstance(tile, int) else int(tile[y % t, x % t])
+
+
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        t = self.tile_size
+        for tx in range(left // t, (right - 1) // t + 1):
+            tile = self._writable_tile(y // t, tx, color)
+            if tile is not None:
+                tile[y % t, max(left - tx * t, 0):right - tx * t] = color
+
+
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        t = self.tile_size
+        for ty in range(top // t, (bottom - 1) // t + 1):
+            tile = self._writable_tile(ty, x // t, color)
+            if tile is not None:
+                tile[max(top - ty * t, 0):bottom - ty * t, x % t] = color
+
+
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Tile-aware flood fill with the same semantics as MemoryLessCanvas.
+        Tiles are visited one at a time: a uniform tile of either color is repainted as a whole,
+        a dense one is filled from the points the area entered it through. The points of the area reaching
+        the tile edges become the seeds of the neighbouring tiles.
+        """
+        t = self.tile_size
+        (rows, cols) = ((self._height - 1) // t + 1, (self._width - 1) // t + 1)
+        (top, bottom) = (y, y + 1)
+
+        # Points already reached, per tile: True for a whole uniform tile, a boolean mask for a dense one
+        visited: Dict[Tuple[int, int], Union[bool, np.array]] = {}
+        pending: Dict[Tuple[int, int], List[Tuple[int, int]]] = {(y // t, x // t): [(x % t, y % t)]}
+        while pending:
+            (key, seeds) = pending.popitem()
+            (ty, tx) = key
+            (th, tw) = self._tile_shape(ty, tx)
+            tile = self.tiles.get(key, ASCII_WHITESPACE)
+
+            if isinstance(tile, int):
+                if key in visited or not (tile == old_color or tile == new_color):
+                    continue
+                visited[key] = True
+                self.tiles[key] = new_color
+                edges = (range(tw), range(tw), range(th), range(th))
+                (first, last) = (0, th)
+            else:
+                if not tile.flags.writeable:
+                    tile = self.tiles[key] = tile.copy()
+                seen = visited.get(key)
+                if seen is None:
+                    seen = visited[key] = np.zeros((th, tw), dtype='bool')
+                reached = ~seen
+                _flood_mask(_inside(tile, old_color, new_color), seen, seeds)
+                reached &= seen
+                touched = np.flatnonzero(reached.any(axis=1))
+                if not touched.size:
+                    continue
+                tile[reached] = new_color
+                if seen.all():
+                    self.tiles[key] = new_color
+                edges = (np.flatnonzero(reached[0]).tolist(), np.flatnonzero(reached[-1]).tolist(),
+                         np.flatnonzero(reached[:, 0]).tolist(), np.flatnonzero(reached[:, -1]).tolist())
+                (first, last) = (int(touched[0]), int(touched[-1]) + 1)
+
+            top = min(top, ty * t + first)
+            bottom = max(bottom, ty * t + last)
+
+            # Enter the neighbouring tiles through the points across the shared edges
+            (up, down, left, right) = edges
+            for (ny, nx, points, across) in ((ty - 1, tx, up, t - 1), (ty + 1, tx, down, 0),
+                                             (ty, tx - 1, left, t - 1), (ty, tx + 1, right, 0)):
+                if not (points and 0 <= ny < rows and 0 <= nx < cols) or visited.get((ny, nx)) is True:
+                    continue
+                if not isinstance(self.tiles.get((ny, nx), ASCII_WHITESPACE), np.ndarray):
+                    # Any point is as good as the others to enter a uniform tile
+                    points = points[:1]
+                if ny != ty:
+                    pending.setdefault((ny, nx), []).extend((i, across) for i in points)
+                else:
+                    pending.setdefault((ny, nx), []).extend((across, i) for i in points)
+
+        self._mark_dirty(top, bottom)
+
+
+class RunLengthCanvas(GridCanvas):
+    """
+    Run-length encoded canvas for drawings made of a few long lines and large uniform areas.
+
+    Each row is kept as a list of runs of a single color, described by the exclusive end of every run
+    and its color; a blank row isn't stored at all. Rows are replaced rather than changed, so clones share
+    the rows neither of them has painted. Painting a span of a row splices the runs it covers
+    and fills work on whole runs, so memory and drawing costs follow the number of runs of the scene
+    rather than its area.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Per row: None for a blank row, (ends, colors) of its runs otherwise
+        self.rows: List[Optional[Tuple[List[int], List[int]]]] = []
+        self._width = 0
+        self._height = 0
+
+
+    @property
+    def width(self) -> int:
+        """
+        Canvas width getter
+        """
+        return self._width
+
+
+    @property
+    def height(self) -> int:
+        """
+        Canvas height getter
+        """
+        return self._height
+
+
+    def create(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self.rows = [None] * height
+        self._mark_dirty(0, height)
+
+
+    def created(self) -> bool:
+        return self._width * self._height != 0
+
+
+    def clear(self):
+        self.rows = [None] * self._height
+        self._mark_dirty(0, self._height)
+
+
+    def runs(self) -> int:
+        """
+        Number of runs stored, blank rows excluded
+        """
+        return sum(len(row[0]) for row in self.rows if row is not None)
+
+
+    def to_array(self) -> np.array:
+        data = np.full((self._height, self._width), ASCII_WHITESPACE, dtype='uint8')
+        self._blit(data, 0, self._height)
+        return data
+
+
+    def _import(self, data: np.array):
+        """
+        Encode a grid: the runs of all the rows are found at once, then split by row
+        """
+        (h, w) = data.shape
+        self.create(w, h)
+        if not data.size:
+            return
+        # A run ends where the next point has another color and at the end of every row
+        (rows, cols) = np.nonzero(data[:, 1:] != data[:, :-1])
+        rows = np.concatenate([rows, np.arange(h)])
+        ends = np.concatenate([cols + 1, np.full(h, w)])
+        order = np.lexsort((ends, rows))
+        (rows, ends) = (rows[order], ends[order])
+        colors = data[rows, ends - 1]
+        bounds = np.cumsum(np.bincount(rows, minlength=h))[:-1]
+        for (y, (row_ends, row_colors)) in enumerate(zip(np.split(ends, bounds), np.split(colors, bounds))):
+            if row_ends.size > 1 or row_colors[0] != ASCII_WHITESPACE:
+                self.rows[y] = (row_ends.tolist(), row_colors.tolist())
+
+
+    def to_bytes(self) -> bytes:
+        (h, w) = (self._height, self._width)
+        frame = np.empty((h + 2, w + 3), dtype='uint8')
+        frame[0, :w + 2] = ASCII_DASH
+        frame[h + 1, :w + 2] = ASCII_DASH
+        _frame_rows(frame[1:h + 1], ASCII_WHITESPACE)
+        self._blit(frame[1:h + 1, 1:w + 1], 0, h)
+        frame[:, w + 2] = ASCII_NEWLINE
+        return frame.reshape(-1)[:-1].tobytes()
+
+
+    def rows_to_bytes(self, top: int, bottom: int) -> bytes:
+        bottom = min(bottom, self._height)
+        frame = np.empty((max(bottom - top, 0), self._width + 3), dtype='uint8')
+        _frame_rows(frame, ASCII_WHITESPACE)
+        self._blit(frame[:, 1:self._width + 1], top, bottom)
+        return frame.tobytes()
+
+
+    def _blit(self, out: np.array, top: int, bottom: int):
+        """
+        Expand the runs of the non-blank rows of the [top, bottom) range into an array of the canvas width,
+        all of them at once
+        """
+        drawn = [(y, row) for (y, row) in enumerate(self.rows[top:bottom]) if row is not None]
+        if not drawn:
+            return
+        w = self._width
+        counts = np.array([len(ends) for (_, (ends, _)) in drawn])
+        ends = np.fromiter(itertools.chain.from_iterable(ends for (_, (ends, _)) in drawn), dtype='int64',
+                           count=int(counts.sum()))
+        colors = np.fromiter(itertools.chain.from_iterable(colors for (_, (_, colors)) in drawn), dtype='uint8',
+                             count=ends.size)
+        # Every row ends at the canvas width, so the ends of all the rows laid out one after another are increasing
+        ends += np.repeat(np.arange(counts.size) * w, counts)
+        lengths = np.diff(ends, prepend=0)
+        out[[y for (y, _) in drawn]] = np.repeat(colors, lengths).reshape(-1, w)
+
+
+    def _sample(self, ys: np.array, xs: np.array) -> np.array:
+        out = np.full((ys.size, xs.size), ASCII_WHITESPACE, dtype='uint8')
+        for (i, y) in enumerate(ys.tolist()):
+            row = self.rows[y]
+            if row is not None:
+                (ends, colors) = row
+                out[i] = np.asarray(colors, dtype='uint8')[np.searchsorted(ends, xs, side='right')]
+        return out
+
+
+    def _fork(self, twin: RunLengthCanvas):
+        twin.rows = list(self.rows)
+
+
+    def restore(self, backup: RunLengthCanvas):
+        (self._width, self._height, self.rows) = (backup.width, backup.height, backup.rows)
+        self._mark_dirty(0, self._height)
+
+
+    def _point(self, x: int, y: int) -> int:
+        row = self.rows[y]
+        if row is None:
+            return ASCII_WHITESPACE
+        (ends, colors) = row
+        return colors[bisect_right(ends, x)]
+
+
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        self._splice(y, left, right, color)
+
+
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        for y in range(top, bottom):
+            self._splice(y, x, x + 1, color)
+
+
+    def _splice(self, y: int, left: int, right: int, color: int):
+        """
+        Replace the runs covering the [left, right) span of a row with a single run of the color,
+        merging it with the neighbouring runs of the same color
+        """
+        row = self.rows[y]
+        if row is None:
+            if color == ASCII_WHITESPACE:
+                return
+            row = ([self._width], [ASCII_WHITESPACE])
+        (ends, colors) = row
+        # Runs containing the first and the last point of the span
+        i = bisect_right(ends, left)
+        j = bisect_right(ends, right - 1)
+        (new_ends, new_colors) = ([right], [color])
+        if (ends[i - 1] if i else 0) < left:
+            new_ends.insert(0, left)
+            new_colors.insert(0, colors[i])
+        if ends[j] > right:
+            new_ends.append(ends[j])
+            new_colors.append(colors[j])
+        # Rows are never changed in place, so that clones can share them
+        ends = ends[:i] + new_ends + ends[j + 1:]
+        colors = colors[:i] + new_colors + colors[j + 1:]
+
+        # Only the new runs and the ones right around them may have the same color as a neighbour
+        k = min(i + len(new_ends), len(ends) - 1) - 1
+        while k >= max(i - 1, 0):
+            if colors[k] == colors[k + 1]:
+                del ends[k]
+                del colors[k]
+            k -= 1
+        self.rows[y] = None if len(ends) == 1 and colors[0] == ASCII_WHITESPACE else (ends, colors)
+
+
+    def _segments(self, y: int, old_color: int, new_color: int) -> Tuple[List[int], List[int]]:
+        """
+        Find the spans of a row made of consecutive runs of either color
+        :return: (starts, ends) of the spans, ends being exclusive
+        """
+        row = self.rows[y]
+        if row is None:
+            row = ([self._width], [ASCII_WHITESPACE])
+        (starts, ends) = ([], [])
+        start = 0
+        for (end, color) in zip(*row):
+            if color == old_color or color == new_color:
+                if ends and ends[-1] == start:
+                    ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            start = end
+        return starts, ends
+
+
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Run based flood fill with the same semantics as MemoryLessCanvas: the area is explored span by span,
+        a span being a sequence of runs of either color, then every span reached is spliced as a whole
+        """
+        segments = {y: self._segments(y, old_color, new_color)}
+        visited: Dict[int, set] = {}
+        stack = [(y, bisect_right(segments[y][1], x))]
+        while stack:
+            (row, k) = stack.pop()
+            seen = visited.setdefault(row, set())
+            if k in seen:
+                continue
+            seen.add(k)
+            (left, right) = (segments[row][0][k], segments[row][1][k])
+            for other in (row - 1, row + 1):
+                if not 0 <= other < self._height:
+                    continue
+                if other not in segments:
+                    segments[other] = self._segments(other, old_color, new_color)
+                (starts, ends) = segments[other]
+                # Spans sharing at least one column with this one
+                for n in range(bisect_right(ends, left), bisect_left(starts, right)):
+                    if n not in visited.get(other, ()):
+                        stack.append((other, n))
+
+        for (row, seen) in visited.items():
+            (starts, ends) = segments[row]
+            for k in seen:
+                self._splice(row, starts[k], ends[k], new_color)
+        self._mark_dirty(min(visited), max(visited) + 1)
+
+
+def _frame_rows(frame: np.array, rows: Union[np.array, int]):
+    """
+    Lay out canvas rows as output lines: side borders around each row followed by a line break
+    :param frame: uint8 array of shape (n, width + 3) receiving the lines
+    :param rows: uint8 array of shape (n, width) - the canvas rows, or a single color for all their points
+    """
+    w = frame.shape[1] - 3
+    frame[:, 0] = ASCII_BAR
+    frame[:, 1:w + 1] = rows
+    frame[:, w + 1] = ASCII_BAR
+    frame[:, w + 2] = ASCII_NEWLINE
+
+
+def _dominant(cells: np.array) -> np.array:
+    """
+    Vectorized viewport.dominant: the most frequent non-blank color of every cell, the highest one on ties
+    :param cells: uint8 array of shape (h, w, n) - the colors of n points sampled in every cell
+    :return: uint8 array of shape (h, w)
+    """
+    if cells.shape[2] == 1:
+        return cells[:, :, 0]
+    counts = (cells[:, :, :, None] == cells[:, :, None, :]).sum(axis=3, dtype='int32')
+    counts[cells == ASCII_WHITESPACE] = 0
+    best = np.argmax(counts * 256 + cells, axis=2)
+    return np.take_along_axis(cells, best[:, :, None], axis=2)[:, :, 0]
+
+
+def _groups(values: np.array) -> List[Tuple[int, int, int]]:
+    """
+    Split a sorted array into runs of equal values
+    :return: (value, start, stop) of every run
+    """
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if values.size else values
+    stops = np.r_[starts[1:], values.size]
+    return list(zip(values[starts].tolist(), starts.tolist(), stops.tolist()))
+
+
+def _clip_segments(segments: np.array, width: int, height: int) -> Tuple[np.array, np.array, np.array, np.array]:
+    """
+    Crop a batch of horizontal or vertical segments to the visible area.
+    Each visible segment is described as a run along its own axis
+    :param segments: int array of shape (N, 4), one (x1, y1, x2, y2) row per segment, 1-based coordinates
+    :param width: canvas width
+    :param height: canvas height
+    :return: (horizontal, fixed, start, stop) - orientation flag, 0-based row (column) of a horizontal (vertical)
+     segment and the 0-based half-open range it covers along its axis
+    """
+    (x1, y1, x2, y2) = segments.T
+    horizontal = y1 == y2
+    vertical = (x1 == x2) & ~horizontal
+
+    fixed = np.where(horizontal, y1, x1)
+    first = np.maximum(np.where(horizontal, np.minimum(x1, x2), np.minimum(y1, y2)), 1)
+    last = np.minimum(np.where(horizontal, np.maximum(x1, x2), np.maximum(y1, y2)),
+                      np.where(horizontal, width, height))
+    visible = (horizontal & (0 < y1) & (y1 <= height)) | (vertical & (0 < x1) & (x1 <= width))
+    visible &= first <= last
+
+    # switch from 1-based to 0-based indexing
+    return horizontal[visible], fixed[visible] - 1, first[visible] - 1, last[visible]
+
+
+def _line_points(segments: np.array, width: int, height: int) -> Tuple[np.array, np.array]:
+    """
+    Rasterize a batch of segments of any direction cropped to the visible area (Bresenham's algorithm).
+    Every step along the major axis of a segment is one point and the coordinate along the other axis
+    is the exact one rounded half up. The endpoints are taken in increasing major axis order, so that
+    a segment is drawn the same whichever end it starts from. Only the visible part of a segment is generated:
+    the range of its steps falling inside the canvas is solved for directly
+    :param segments: int array of shape (N, 4), one (x1, y1, x2, y2) row per segment, 1-based coordinates
+    :param width: canvas width
+    :param height: canvas height
+    :return: (rows, cols) 0-based int64 arrays of the segment points
+    """
+    segments = np.asarray(segments).reshape(-1, 4)
+    if segments.size and np.abs(segments).max() >= 2 ** 28:
+        # The intermediate products would overflow int64, Python ints are used instead
+        segments = segments.astype(object)
+    (x1, y1, x2, y2) = segments.T
+    steep = np.abs(y2 - y1) > np.abs(x2 - x1)
+    (a1, a2) = (np.where(steep, y1, x1), np.where(steep, y2, x2))
+    (b1, b2) = (np.where(steep, x1, y1), np.where(steep, x2, y2))
+    swap = a1 > a2
+    (a1, a2, b1, b2) = (np.where(swap, a2, a1), np.where(swap, a1, a2), np.where(swap, b2, b1), np.where(swap, b1, b2))
+    (size_a, size_b) = (np.where(steep, height, width), np.where(steep, width, height))
+
+    # Point t of a segment is (a1 + t, b1 + sign * q(t)) with q(t) = floor((2 * t * |db| + d) / (2 * d)),
+    # a non-decreasing function, so the steps inside the canvas along either axis form a range
+    d = a2 - a1
+    db = b2 - b1
+    sign = (db > 0).astype('int64') - (db < 0)
+    slope = np.abs(db)
+    first = np.maximum(1 - a1, 0)
+    last = np.minimum(size_a - a1, d)
+    (q_first, q_last) = (np.where(sign >= 0, 1 - b1, b1 - size_b), np.where(sign >= 0, size_b - b1, b1 - 1))
+    denominator = np.maximum(2 * slope, 1)
+    # The first step with q >= q_first and the last one with q <= q_last, -(-n // m) being the ceiling of n / m
+    # (along a flat segment, q is always 0 and the segment is either entirely visible or not at all)
+    q_start = np.where(q_first <= 0, 0, -((d - 2 * d * q_first) // denominator))
+    q_stop = np.where(q_last < 0, -1, -((d - 2 * d * (q_last + 1)) // denominator) - 1)
+    (first, last) = (np.where(slope > 0, np.maximum(first, q_start), np.where(q_first <= 0, first, last + 1)),
+                     np.where(slope > 0, np.minimum(last, q_stop), np.where(q_last >= 0, last, first - 1)))
+    counts = np.maximum(last - first + 1, 0).astype('int64')
+
+    total = int(counts.sum())
+    segment = np.repeat(np.arange(counts.size), counts)
+    t = np.repeat(first, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+    q = (2 * t * slope[segment] + d[segment]) // np.maximum(2 * d[segment], 1)
+    a = (a1[segment] + t - 1).astype('int64')
+    b = (b1[segment] + sign[segment] * q - 1).astype('int64')
+    steep = steep[segment]
+    return np.where(steep, a, b), np.where(steep, b, a)
+
+
+def _segments_mask(segments: np.array, width: int, height: int) -> Tuple:
+    """
+    Rasterize a batch of horizontal or vertical segments cropped to the visible area
+    :param segments: int array of shape (N, 4), one (x1, y1, x2, y2) row per segment, 1-based coordinates
+    :param width: canvas width
+    :param height: canvas height
+    :return: index suitable for the canvas data array: either (rows, cols) arrays of the segment points
+     or a boolean mask of the canvas shape
+    """
+    (horizontal, fixed, start, stop) = _clip_segments(segments, width, height)
+    lengths = stop - start
+    total = int(lengths.sum())
+
+    if total <= width * height // 4:
+        # Sparse scene: expand the runs into points, every point is the start of its run plus its offset within it
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        along = np.repeat(start, lengths) + offsets
+        across = np.repeat(fixed, lengths)
+        is_horizontal = np.repeat(horizontal, lengths)
+        return np.where(is_horizontal, across, along), np.where(is_horizontal, along, across)
+
+    # Dense scene: mark the ends of the runs and integrate along each axis,
+    # which costs O(width * height + N) no matter how long the segments are
+    def coverage(fixed, start, stop, n, m):
+        marks = np.bincount(fixed * (m + 1) + start, minlength=n * (m + 1)) \
+            - np.bincount(fixed * (m + 1) + stop, minlength=n * (m + 1))
+        return np.cumsum(marks.reshape(n, m + 1), axis=1)[:, :m] > 0
+
+    vertical = ~horizontal
+    return coverage(fixed[horizontal], start[horizontal], stop[horizontal], height, width) \
+        | coverage(fixed[vertical], start[vertical], stop[vertical], width, height).T
+
 
-        self.data[y][x] = new_color
-        visited[y][x] = True
+def _inside(segment: np.array, old_color: int, new_color: int) -> np.array:
+    """
+    Mask of the points that belong to the area being filled
+    :param segment: slice of the canvas
+    :param old_color: color before repainting
+    :param new_color: color after repainting
+    :return: boolean np.array of the same shape as the segment
+    """
+    return (segment == old_color) | (segment == new_color)
 
-        # Check the point to the left
-        if x > 0 and (not visited[y][x - 1]) \
-                and (self.data[y][x - 1] == old_color or self.data[y][x - 1] == new_color):
-            self._paint_neighbours(x - 1, y, old_color, new_color, visited)
 
-        # Check the point above
-        if y > 0 and (not visited[y - 1][x]) \
-                and (self.data[y - 1][x] == old_color or self.data[y - 1][x] == new_color):
-            self._paint_neighbours(x, y - 1, old_color, new_color, visited)
+def _run_starts(inside: np.array) -> List[int]:
+    """
+    Find the starting points of the runs of True values in a 1-dimensional mask.
+    Runs are skipped with argmax/argmin, so the cost depends on the number of runs rather than on the segment length
+    :param inside: 1-dimensional boolean mask
+    :return: list of 0-based offsets
+    """
+    starts = []
+    n = inside.size
+    i = 0
+    while i < n:
+        k = int(inside[i:].argmax())
+        if not inside[i + k]:
+            break
+        i += k
+        starts.append(i)
+        k = int(inside[i:].argmin())
+        if inside[i + k]:
+            break
+        i += k
+    return starts
 
-        # Check the point to the right
-        if x < w - 1 and (not visited[y][x + 1]) \
-                and (self.data[y][x + 1] == old_color or self.data[y][x + 1] == new_color):
-            self._paint_neighbours(x + 1, y, old_color, new_color, visited)
 
-        # Check the point below
-        if y < h - 1 and (not visited[y + 1][x]) \
-                and (self.data[y + 1][x] == old_color or self.data[y + 1][x] == new_color):
-            self._paint_neighbours(x, y + 1, old_color, new_color, visited)
+def _flood_mask(inside: np.array, visited: np.array, seeds: List[Tuple[int, int]]):
+    """
+    Iterative scanline flood over a small boolean mask (4-connected)
+    :param inside: mask of the points that belong to the area
+    :param visited: mask of the points reached so far, updated in place
+    :param seeds: (x, y) points to start from; the ones outside the area or visited already are skipped
+    """
+    (h, w) = inside.shape
+    stack = list(seeds)
+    while stack:
+        (x, y) = stack.pop()
+        free = inside[y] & ~visited[y]
+        if not free[x]:
+            continue
+        k = int(free[x::-1].argmin())
+        left = x - k + 1 if not free[x - k] else 0
+        k = int(free[x:].argmin())
+        right = x + k if not free[x + k] else w
+        visited[y, left:right] = True
+        for ny in (y - 1, y + 1):
+            if 0 <= ny < h:
+                for start in _run_starts(inside[ny, left:right] & ~visited[ny, left:right]):
+                    stack.append((left + start, ny))
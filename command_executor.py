@@ -2,17 +2,62 @@
 This module contains concrete implementations of the CommandExecutor interface.
 """
 
-from traits import CommandExecutor, Canvas
-from primitives import Command
-from functools import reduce
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, List, Optional
+from traits import CommandExecutor, Canvas, Writer
+from primitives import Command, NotUndoableError
+from viewport import Viewport
 
+# Commands moving the viewport of the writer rather than changing the canvas
+NAVIGATION = {Command.Keyword.PAN, Command.Keyword.ZOOM}
 
-def is_int(c) -> bool:
+# Commands a batch may hold, see SyncCommandExecutor.execute_many()
+BATCHED = {Command.Keyword.CREATE, Command.Keyword.LINE, Command.Keyword.RECT, Command.Keyword.FILL}
+
+
+def int_args(args: List, count: int) -> List[int]:
+    """
+    Check the number and the type of the leading arguments of a command
+    :param args: command arguments, either ints already or their text form
+    :param count: number of int arguments expected
+    :return: the arguments converted to ints
+    """
+    if len(args) < count:
+        raise ValueError('Insufficient number of arguments')
     try:
-        int(c)
-    except ValueError as e:
-        return False
-    return True
+        return [arg if type(arg) is int else int(arg) for arg in args[:count]]
+    except ValueError:
+        raise TypeError('Arguments must be of type int')
+
+
+def path_arg(args: List) -> str:
+    """
+    Check the file path argument of a command
+    """
+    if not args:
+        raise ValueError('Insufficient number of arguments')
+    if not isinstance(args[0], str) or not args[0]:
+        raise TypeError('Argument must be a file path')
+    return args[0]
+
+
+def navigate(view: Optional[Viewport], command: Command) -> Viewport:
+    """
+    Apply a pan or zoom command to a viewport
+    :param view: the viewport to move, None to start from a default one at the top left of the canvas
+    :param command: one of the NAVIGATION commands
+    :return: the viewport
+    """
+    if command.keyword == Command.Keyword.PAN:
+        (dx, dy) = int_args(command.args, 2)
+        view = view if view is not None else Viewport()
+        view.pan(dx, dy)
+    elif command.keyword == Command.Keyword.ZOOM:
+        (zoom,) = int_args(command.args, 1)
+        view = view if view is not None else Viewport()
+        view.set_zoom(zoom)
+    return view
 
 
 class IdentityExecutor(CommandExecutor):
@@ -22,43 +67,54 @@ class IdentityExecutor(CommandExecutor):
 
 class SyncCommandExecutor(CommandExecutor):
     def execute(self, canvas: Canvas, command: Command):
+        if command.keyword == Command.Keyword.UNDO:
+            canvas.undo()
+            return 0
+
+        if command.keyword == Command.Keyword.REDO:
+            canvas.redo()
+            return 0
+
+        if command.keyword == Command.Keyword.LOAD:
+            path = path_arg(command.args)
+            try:
+                canvas.load(path)
+            except OSError as e:
+                raise ValueError(f'Cannot load {path}: {e.strerror or e}')
+            return 0
+
         if not canvas.created() and command.keyword != Command.Keyword.CREATE:
             raise ValueError('Canvas must first be created')
 
+        if command.keyword == Command.Keyword.SAVE:
+            # The snapshot module pulls NumPy in, most sessions never save
+            import snapshot
+            path = path_arg(command.args)
+            try:
+                canvas.save(path, snapshot.compression_for(path))
+            except OSError as e:
+                raise ValueError(f'Cannot save {path}: {e.strerror or e}')
+            return 0
+
         if command.keyword == Command.Keyword.CREATE:
-            if len(command.args) < 2:
-                raise ValueError('Insufficient number of arguments')
-            typecheck = reduce(lambda a, b: a and is_int(b), command.args)
-            if not typecheck:
-                raise TypeError('Arguments must be of type int')
-            canvas.create(width=int(command.args[0]), height=int(command.args[1]))
+            (width, height) = int_args(command.args, 2)
+            canvas.create(width=width, height=height)
             return 0
 
         if command.keyword == Command.Keyword.LINE:
-            if len(command.args) < 4:
-                raise ValueError('Insufficient number of arguments')
-            typecheck = reduce(lambda a, b: a and is_int(b), command.args)
-            if not typecheck:
-                raise TypeError('Arguments must be of type int')
-            canvas.draw('line', *list(map(int, command.args)))
+            canvas.draw('line', *int_args(command.args, 4))
             return 0
 
         if command.keyword == Command.Keyword.RECT:
-            if len(command.args) < 4:
-                raise ValueError('Insufficient number of arguments')
-            typecheck = reduce(lambda a, b: a and is_int(b), command.args)
-            if not typecheck:
-                raise TypeError('Arguments must be of type int')
-            canvas.draw('rect', *list(map(int, command.args)))
+            canvas.draw('rect', *int_args(command.args, 4))
             return 0
 
         if command.keyword == Command.Keyword.FILL:
             if len(command.args) < 3:
                 raise ValueError('Insufficient number of arguments')
             try:
-                x = int(command.args[0])
-                y = int(command.args[1])
-            except ValueError as e:
+                (x, y) = int_args(command.args, 2)
+            except TypeError:
                 raise TypeError('First two arguments must be of type int')
             color = command.args[2]
             if len(color) > 1:
@@ -66,7 +122,187 @@ class SyncCommandExecutor(CommandExecutor):
             canvas.fill(x=x, y=y, color=color)
             return 0
 
+    def execute_many(self, canvas: Canvas, commands) -> int:
+        """
+        Execute a batch of commands as a whole, e.g. to import a prebuilt drawing.
+        The batch is validated up front with array operations over all of its commands, so that a malformed
+        command rejects the batch before anything is drawn, and every run of lines or rectangles is then drawn
+        by a single draw_many() call. Should anything fail halfway, the canvas is rolled back to a clone taken
+        before the batch, and its undo history, if any, to the state it had then. The canvas is left to be
+        rendered once, by the caller
+        :param canvas: the application state
+        :param commands: canvas creations, lines, rectangles and fills, either as a command buffer
+         (see command_parser.compile_script()) or as Commands
+        :return: number of commands executed
+        :raise NotUndoableError: once the whole batch has been executed, if a part of it was too large
+         to be kept in the undo history
+        """
+        # NumPy is only needed by batches, the command parser imports it lazily as well
+        import numpy as np
+        import command_parser
+
+        if isinstance(commands, np.ndarray):
+            if commands.dtype != np.dtype(command_parser.COMMAND_DTYPE):
+                raise TypeError('Commands must be a command buffer')
+            buffer = commands.reshape(-1)
+        else:
+            buffer = command_parser.compile_commands(commands)
+        if not buffer.size:
+            return 0
+
+        keywords = buffer['keyword']
+        (x1, y1, x2, y2) = buffer['args'].T
+        create = keywords == Command.Keyword.CREATE.value
+        # Every other command needs a canvas: the one made by the latest creation before it, if any
+        latest = np.maximum.accumulate(np.where(create, np.arange(buffer.size), -1))
+        sized = (x1 != 0) & (y1 != 0)
+        created = np.where(latest >= 0, sized[np.maximum(latest, 0)], canvas.created())
+        checks = [
+            (~np.isin(keywords, [keyword.value for keyword in BATCHED]), None),
+            (create & ((x1 < 0) | (y1 < 0)), 'Canvas dimensions must not be negative'),
+            (~create & ~created, 'Canvas must first be created'),
+            ((keywords == Command.Keyword.RECT.value) & ((x1 > x2) | (y1 > y2)),
+             'Rectangle must have a non-negative area, try again'),
+            ((keywords == Command.Keyword.FILL.value) & (buffer['color'] == 0),
+             'Color symbol must be a single character'),
+        ]
+        failed = [(int(np.argmax(mask)), message) for (mask, message) in checks if mask.any()]
+        if failed:
+            (i, message) = min(failed, key=lambda error: error[0])
+            if message is None:
+                message = f'{Command.Keyword(int(keywords[i])).name.lower()} commands cannot be batched'
+            raise ValueError(f'command {i + 1}: {message}')
+
+        backup = canvas.clone()
+        history = getattr(canvas, 'history', None)
+        checkpoint = history.checkpoint() if history is not None else None
+        oversized = None
+        try:
+            starts = np.flatnonzero(np.r_[True, keywords[1:] != keywords[:-1]])
+            for (start, end) in zip(starts.tolist(), np.r_[starts[1:], buffer.size].tolist()):
+                keyword = Command.Keyword(int(keywords[start]))
+                try:
+                    if keyword == Command.Keyword.LINE:
+                        canvas.draw_many('line', buffer['args'][start:end])
+                    elif keyword == Command.Keyword.RECT:
+                        canvas.draw_many('rect', buffer['args'][start:end])
+                    else:
+                        for record in buffer[start:end]:
+                            self.execute(canvas, command_parser.to_command(record))
+                except NotUndoableError as e:
+                    # The run has been drawn, only it cannot be undone: the batch goes on
+                    oversized = e
+        except BaseException:
+            # Interrupted batches are rolled back as well
+            try:
+                canvas.restore(backup)
+            except NotUndoableError:
+                pass
+            if history is not None:
+                # Neither the commands of the batch nor the rollback are left to undo
+                history.rollback(checkpoint)
+            raise
+        finally:
+            # Clones of canvases in shared memory hold a block of their own
+            if hasattr(backup, 'close'):
+                backup.close()
+        if oversized is not None:
+            raise oversized
+        return int(buffer.size)
+
 
 class AsyncCommandExecutor(CommandExecutor):
+    """
+    Pipelined command processor.
+
+    run() connects three tasks: the reader pulls commands from the source into a bounded queue,
+    the executor applies them to the canvas, or to the viewport of the writer, and the renderer prints
+    the canvas whenever it has changed.
+    Frames pile up while the renderer is busy are coalesced, so only the latest state is printed.
+
+    Executing and rendering happen in a single worker thread: the event loop stays responsive
+    while a heavy fill or render is in progress and the canvas is never accessed concurrently.
+    """
+
+    def __init__(self, executor: Optional[CommandExecutor] = None, queue_size: int = 64):
+        """
+        :param executor: executor applying the commands, SyncCommandExecutor by default
+        :param queue_size: maximum number of parsed commands waiting to be executed
+        """
+        self.executor = executor if executor is not None else SyncCommandExecutor()
+        self.queue_size = queue_size
+
     def execute(self, canvas: Canvas, command: Command):
-        pass
+        return self.executor.execute(canvas, command)
+
+    def execute_many(self, canvas: Canvas, commands) -> int:
+        return self.executor.execute_many(canvas, commands)
+
+    async def run(self, canvas: Canvas, commands: AsyncIterator[Command], writer: Writer,
+                  on_error: Optional[Callable[[Exception], None]] = None):
+        """
+        Process a stream of commands until it is exhausted or the quit command is met
+        :param canvas: the application state
+        :param commands: source of the commands
+        :param writer: writer printing the canvas
+        :param on_error: callback for commands rejected by the executor
+        """
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(self.queue_size)
+        frame = asyncio.Event()
+        state = {'pending': False, 'done': False}
+
+        def move(command: Command):
+            # Run in the worker thread as well, so the viewport never changes during a render
+            writer.viewport = navigate(writer.viewport, command)
+
+        async def read():
+            async for command in commands:
+                await queue.put(command)
+                if command.keyword == Command.Keyword.QUIT:
+                    break
+            await queue.put(Command(Command.Keyword.QUIT))
+
+        async def execute(pool: ThreadPoolExecutor):
+            while True:
+                command = await queue.get()
+                if command.keyword == Command.Keyword.QUIT:
+                    break
+                if command.keyword in NAVIGATION:
+                    (action, args) = (move, (command,))
+                else:
+                    (action, args) = (self.executor.execute, (canvas, command))
+                if command.keyword != Command.Keyword.FLUSH:
+                    try:
+                        await loop.run_in_executor(pool, action, *args)
+                    except NotUndoableError as e:
+                        # The command went through, it is rendered as any other
+                        if on_error is not None:
+                            on_error(e)
+                    except (TypeError, ValueError) as e:
+                        if on_error is not None:
+                            on_error(e)
+                        continue
+                state['pending'] = True
+                frame.set()
+            state['done'] = True
+            frame.set()
+
+        async def render(pool: ThreadPoolExecutor):
+            while True:
+                if not state['pending']:
+                    if state['done']:
+                        break
+                    await frame.wait()
+                    frame.clear()
+                    continue
+                state['pending'] = False
+                if canvas.created():
+                    await loop.run_in_executor(pool, writer.render, canvas)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            reader = asyncio.ensure_future(read())
+            try:
+                await asyncio.gather(execute(pool), render(pool))
+            finally:
+                reader.cancel()
@@ -0,0 +1,325 @@
+"""
+This module turns text commands into Command objects.
+
+Parsing is driven by a table mapping each command letter to its keyword and arguments, and the arguments
+are converted to their final types once, here. A whole script can also be compiled into a compact
+NumPy buffer holding one fixed-size record per command. NumPy is only imported by the compiling functions,
+parsing single commands doesn't need it.
+"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
+
+from primitives import Command
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# letter -> (keyword, number of int arguments, whether a color argument follows them)
+COMMANDS = {
+    'C': (Command.Keyword.CREATE, 2, False),
+    'L': (Command.Keyword.LINE, 4, False),
+    'R': (Command.Keyword.RECT, 4, False),
+    'B': (Command.Keyword.FILL, 2, True),
+    'Q': (Command.Keyword.QUIT, 0, False),
+    'F': (Command.Keyword.FLUSH, 0, False),
+    'U': (Command.Keyword.UNDO, 0, False),
+    'Y': (Command.Keyword.REDO, 0, False),
+    'I': (Command.Keyword.STATS, 0, False),
+    'S': (Command.Keyword.SAVE, 0, False),
+    'O': (Command.Keyword.LOAD, 0, False),
+    'P': (Command.Keyword.PAN, 2, False),
+    'Z': (Command.Keyword.ZOOM, 1, False),
+}
+
+# Commands whose only argument is a file path: the rest of the line, spaces included.
+# Paths don't fit into command buffers, so these commands can only be parsed one at a time
+PATHS = {Command.Keyword.SAVE, Command.Keyword.LOAD}
+
+# Commands are case insensitive
+_TABLE = {**COMMANDS, **{letter.lower(): spec for (letter, spec) in COMMANDS.items()}}
+_LETTERS = {keyword: letter for (letter, (keyword, _, _)) in COMMANDS.items()}
+
+# Byte-indexed lookup tables for the vectorized parser: keyword value (0 for unknown letters),
+# number of int arguments and whether a color follows them
+_KEYWORD = [0] * 256
+_COUNT = [0] * 256
+_COLORED = [False] * 256
+for (_letter, (_keyword, _count, _colored)) in _TABLE.items():
+    if _keyword in PATHS:
+        continue
+    _KEYWORD[ord(_letter)] = _keyword.value
+    _COUNT[ord(_letter)] = _count
+    _COLORED[ord(_letter)] = _colored
+
+# Whitespace as str.split() sees it within the latin-1 range
+_SPACE = [chr(c).isspace() for c in range(256)]
+_NEWLINE = ord('\n')
+_MINUS = ord('-')
+_PLUS = ord('+')
+_ZERO = ord('0')
+
+# One record per command: keyword value, up to four int arguments and the color code (0 if none),
+# as a NumPy dtype specification
+COMMAND_DTYPE = [('keyword', 'u1'), ('args', 'i8', (4,)), ('color', 'u1')]
+
+
+def _parse_tokens(tokens: List[str]) -> Tuple[Command.Keyword, List[int], str]:
+    """
+    Validate and convert the tokens of a command
+    :param tokens: whitespace-separated parts of the command, the first one being the command letter
+    :return: (keyword, int arguments, color - empty if the command takes none)
+    """
+    if not tokens:
+        return Command.Keyword.UNKNOWN, [], ''
+    spec = _TABLE.get(tokens[0])
+    if spec is None:
+        return Command.Keyword.UNKNOWN, [], ''
+    (keyword, count, colored) = spec
+    if len(tokens) <= count + colored:
+        raise ValueError('Insufficient number of arguments')
+    try:
+        args = [int(token) for token in tokens[1:count + 1]]
+    except ValueError:
+        raise TypeError('Arguments must be of type int')
+    if not colored:
+        return keyword, args, ''
+    color = tokens[count + 1]
+    if len(color) > 1:
+        raise ValueError('Color symbol must be a single character')
+    if ord(color) > 255:
+        # Points are stored as single bytes
+        raise ValueError('Color symbol must be a single byte character')
+    return keyword, args, color
+
+
+def parse(line: str) -> Command:
+    """
+    Parse a single command
+    :param line: command text
+    :return: the command, of the UNKNOWN keyword if the command letter is not recognized
+    """
+    tokens = line.split()
+    if tokens and tokens[0] in _TABLE and _TABLE[tokens[0]][0] in PATHS:
+        if len(tokens) < 2:
+            raise ValueError('Insufficient number of arguments')
+        return Command(_TABLE[tokens[0]][0], line.split(None, 1)[1].strip())
+    (keyword, args, color) = _parse_tokens(tokens)
+    if color:
+        return Command(keyword, *args, color)
+    return Command(keyword, *args)
+
+
+def compile_script(lines: Iterable[str]) -> np.array:
+    """
+    Parse a whole script into a command buffer; blank lines are skipped
+    :param lines: command lines, with or without the line breaks
+    :return: structured array of COMMAND_DTYPE
+    """
+    return compile_text(''.join(line if line.endswith('\n') else line + '\n' for line in lines))
+
+
+def compile_text(text: str) -> np.array:
+    """
+    Parse a whole script into a command buffer; blank lines are skipped.
+    The text is tokenized and the numbers are converted with NumPy operations over the whole text
+    rather than line by line; the errors are the same as parse() would raise, prefixed with the line number
+    :param text: command lines separated with line breaks
+    :return: structured array of COMMAND_DTYPE
+    """
+    import numpy as np
+    try:
+        buf = np.frombuffer(text.encode('latin-1') + b'\n', dtype='uint8')
+    except UnicodeEncodeError:
+        # Points are single bytes anyway, whatever doesn't fit is left to the line by line parser to report
+        return _compile_lines(text.split('\n'))
+
+    # Tokens are the runs of non-space bytes, a line is the range between two line breaks
+    space = np.array(_SPACE)[buf]
+    starts = np.flatnonzero(~space & np.concatenate(([True], space[:-1])))
+    ends = np.flatnonzero(~space & np.concatenate((space[1:], [True]))) + 1
+    line = np.cumsum(buf == _NEWLINE, dtype=np.int32 if buf.size < 2 ** 31 else np.int64)[starts]
+    first = np.ones(starts.size, dtype='bool')
+    first[1:] = line[1:] != line[:-1]
+    ordinal = np.arange(starts.size) - np.maximum.accumulate(np.where(first, np.arange(starts.size), 0))
+    command = np.cumsum(first) - 1
+
+    # Commands: the first token of a line must be one of the known letters
+    lines = line[first]
+    letters = np.where(ends[first] - starts[first] == 1, buf[starts[first]], 0)
+    keyword = np.array(_KEYWORD, dtype='uint8')[letters]
+    count = np.array(_COUNT, dtype='int64')[letters]
+    colored = np.array(_COLORED)[letters]
+    given = np.diff(np.append(np.flatnonzero(first), starts.size)) - 1
+
+    # Numbers: the tokens following the letter, as many as the command takes
+    numeric = (ordinal >= 1) & (ordinal <= count[command])
+    (values, malformed, overflow) = _parse_ints(buf, starts[numeric], ends[numeric])
+    bad_int = np.zeros(lines.size, dtype='bool')
+    bad_int[command[numeric][malformed]] = True
+    out_of_range = np.zeros(lines.size, dtype='bool')
+    out_of_range[command[numeric][overflow]] = True
+
+    # Colors: the token following the numbers, a single byte
+    paint = (ordinal == count[command] + 1) & colored[command]
+    color = np.zeros(lines.size, dtype='uint8')
+    color[command[paint]] = buf[starts[paint]]
+    bad_color = np.zeros(lines.size, dtype='bool')
+    bad_color[command[paint]] = ends[paint] - starts[paint] != 1
+
+    # The first erroneous line is reported, with the error its own parsing would have raised first
+    unknown = keyword == 0
+    insufficient = ~unknown & (given < count + colored)
+    errors = unknown | insufficient | bad_int | bad_color | out_of_range
+    if errors.any():
+        i = int(np.argmax(errors))
+        n = int(lines[i]) + 1
+        if unknown[i]:
+            _reject_path(n, chr(letters[i]))
+            raise ValueError(f'line {n}: Unknown command')
+        if insufficient[i]:
+            raise ValueError(f'line {n}: Insufficient number of arguments')
+        if bad_int[i]:
+            raise TypeError(f'line {n}: Arguments must be of type int')
+        if bad_color[i]:
+            raise ValueError(f'line {n}: Color symbol must be a single character')
+        raise ValueError(f'line {n}: Arguments out of range')
+
+    records = np.zeros(lines.size, dtype=COMMAND_DTYPE)
+    records['keyword'] = keyword
+    records['args'][command[numeric], ordinal[numeric] - 1] = values
+    records['color'] = color
+    return records
+
+
+def _compile_lines(lines: Iterable[str]) -> np.array:
+    """
+    Line by line counterpart of compile_text()
+    """
+    import numpy as np
+    records = []
+    for (n, line) in enumerate(lines, 1):
+        tokens = line.split()
+        if not tokens:
+            continue
+        _reject_path(n, tokens[0])
+        try:
+            (keyword, args, color) = _parse_tokens(tokens)
+        except (TypeError, ValueError) as e:
+            raise type(e)(f'line {n}: {e}') from e
+        if keyword == Command.Keyword.UNKNOWN:
+            raise ValueError(f'line {n}: Unknown command')
+        if any(not -2 ** 63 <= arg < 2 ** 63 for arg in args):
+            raise ValueError(f'line {n}: Arguments out of range')
+        records.append((keyword.value, args + [0] * (4 - len(args)), ord(color) if color else 0))
+    return np.array(records, dtype=COMMAND_DTYPE)
+
+
+def _reject_path(n: int, letter: str):
+    """
+    Report a command taking a path met while compiling a command buffer
+    """
+    if letter in _TABLE and _TABLE[letter][0] in PATHS:
+        raise ValueError(f'line {n}: {_TABLE[letter][0].name.lower()} commands cannot be compiled')
+
+
+def _parse_ints(buf: np.array, starts: np.array, ends: np.array) -> Tuple[np.array, np.array, np.array]:
+    """
+    Convert tokens made of an optional sign and up to 18 decimal digits into ints.
+    Any other token is handed over to int(), so that the accepted syntax is exactly the same as parse()'s
+    :param buf: script bytes
+    :param starts: token start offsets
+    :param ends: token end offsets
+    :return: (values, malformed, overflow) - int64 values, the masks of the tokens that are not ints
+     and of the ones that don't fit into int64
+    """
+    import numpy as np
+    lengths = ends - starts
+    signed = (buf[starts] == _MINUS) | (buf[starts] == _PLUS)
+    digits = lengths - signed
+
+    # Horner's scheme over the digit positions counted from the end of the tokens
+    first = starts + signed
+    simple = (digits >= 1) & (digits <= 18)
+    values = np.zeros(starts.size, dtype='int64')
+    for offset in range(int(min(digits.max(initial=1), 18)), 0, -1):
+        position = ends - offset
+        present = position >= first
+        # Bytes below '0' wrap around, so anything but a digit is above 9
+        digit = np.where(present, buf[np.where(present, position, 0)] - np.uint8(_ZERO), 0)
+        simple &= digit <= 9
+        values = values * 10 + digit
+    values = np.where(buf[starts] == _MINUS, -values, values)
+
+    malformed = np.zeros(starts.size, dtype='bool')
+    overflow = np.zeros(starts.size, dtype='bool')
+    for i in np.flatnonzero(~simple).tolist():
+        try:
+            value = int(bytes(buf[starts[i]:ends[i]]).decode('latin-1'))
+        except ValueError:
+            malformed[i] = True
+            continue
+        if not -2 ** 63 <= value < 2 ** 63:
+            overflow[i] = True
+            continue
+        values[i] = value
+    return values, malformed, overflow
+
+
+def to_command(record) -> Command:
+    """
+    Expand a command buffer record back into a Command
+    """
+    keyword = Command.Keyword(int(record['keyword']))
+    count = COMMANDS[_LETTERS[keyword]][1]
+    args = record['args'][:count].tolist()
+    if record['color']:
+        args.append(chr(record['color']))
+    return Command(keyword, *args)
+
+
+def iter_commands(buffer: np.array) -> Iterator[Command]:
+    """
+    Expand a command buffer into Commands, one at a time
+    """
+    for record in buffer:
+        yield to_command(record)
+
+
+def compile_commands(commands: Iterable[Command]) -> np.array:
+    """
+    Pack Commands into a command buffer, the counterpart of iter_commands(). Arguments may be ints
+    or their text form, as the executors accept them; the errors are prefixed with the position of the command
+    :param commands: the commands, counted from 1
+    :return: structured array of COMMAND_DTYPE
+    """
+    import numpy as np
+    records = []
+    for (n, command) in enumerate(commands, 1):
+        letter = _LETTERS.get(command.keyword)
+        if letter is None:
+            raise ValueError(f'command {n}: Unknown command')
+        if command.keyword in PATHS:
+            raise ValueError(f'command {n}: {command.keyword.name.lower()} commands cannot be compiled')
+        (_, count, colored) = COMMANDS[letter]
+        args = command.args
+        if len(args) < count + colored:
+            raise ValueError(f'command {n}: Insufficient number of arguments')
+        try:
+            ints = [arg if type(arg) is int else int(arg) for arg in args[:count]]
+        except (TypeError, ValueError):
+            raise TypeError(f'command {n}: Arguments must be of type int')
+        if any(not -2 ** 63 <= arg < 2 ** 63 for arg in ints):
+            raise ValueError(f'command {n}: Arguments out of range')
+        color = args[count] if colored else ''
+        if colored and not (isinstance(color, str) and len(color) == 1 and ord(color) < 256):
+            raise ValueError(f'command {n}: Color symbol must be a single byte character')
+        records.append((command.keyword.value, ints + [0] * (4 - count), ord(color) if color else 0))
+    return np.array(records, dtype=COMMAND_DTYPE)
+
+
+def format_command(command: Command) -> str:
+    """
+    Text form of a command, parse() gives back an equivalent command
+    """
+    return ' '.join([_LETTERS[command.keyword]] + [str(arg) for arg in command.args])
@@ -0,0 +1,151 @@
+"""
+This module contains the undo/redo history of canvas changes.
+
+Every canvas operation is recorded as a delta holding only what the operation changed, so the cost of
+undoing an operation is proportional to its effect rather than to the canvas size.
+"""
+
+from __future__ import annotations
+from collections import deque
+from typing import Deque, List, Tuple
+import numpy as np
+
+from primitives import NotUndoableError
+
+
+class Delta:
+    """
+    Changes made by one operation: flat indices of the changed points along with their colors before and after
+    """
+
+    def __init__(self, index: np.array, before: np.array, after: np.array):
+        self.index = index
+        self.before = before
+        self.after = after
+
+    @staticmethod
+    def concat(parts: List[Tuple[np.array, np.array, np.array]]) -> Delta:
+        """
+        Merge the changes recorded by the steps of an operation
+        :param parts: (index, before, after) triples in the order they were made
+        """
+        if len(parts) == 1:
+            return Delta(*parts[0])
+        (index, before, after) = zip(*parts)
+        return Delta(np.concatenate(index), np.concatenate(before), np.concatenate(after))
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + self.before.nbytes + self.after.nbytes
+
+    def revert(self, canvas):
+        canvas._apply_points(self.index, self.before)
+
+    def apply(self, canvas):
+        canvas._apply_points(self.index, self.after)
+
+
+class ResizeDelta:
+    """
+    Canvas creation: the grid is replaced as a whole, so the previous one is kept by reference
+    """
+
+    def __init__(self, before: np.array, width: int, height: int):
+        self.before = before
+        self.width = width
+        self.height = height
+
+    @property
+    def nbytes(self) -> int:
+        return self.before.nbytes
+
+    def revert(self, canvas):
+        canvas._apply_grid(self.before)
+
+    def apply(self, canvas):
+        canvas.create(self.width, self.height)
+
+
+class GridDelta:
+    """
+    Canvas replacement by another grid, e.g. a loaded snapshot: both grids are kept by reference
+    """
+
+    def __init__(self, before: np.array, after: np.array):
+        self.before = before
+        self.after = after
+
+    @property
+    def nbytes(self) -> int:
+        return self.before.nbytes + self.after.nbytes
+
+    def revert(self, canvas):
+        canvas._apply_grid(self.before)
+
+    def apply(self, canvas):
+        canvas._apply_grid(self.after)
+
+
+class History:
+    """
+    Linear undo/redo history with a memory budget.
+    Once the deltas take more than the budget, the oldest ones are evicted
+    """
+
+    def __init__(self, budget: int = 64 * 2 ** 20):
+        """
+        :param budget: maximum number of bytes taken by the deltas, either done or undone
+        """
+        self.budget = budget
+        self.nbytes = 0
+        self.done: Deque = deque()
+        self.undone: List = []
+
+    def push(self, delta):
+        """
+        Record a new change; whatever was undone before can't be redone anymore.
+        A change larger than the whole budget is not recorded, the older ones being kept
+        :raise NotUndoableError: if the change is not recorded
+        """
+        self.nbytes -= sum(d.nbytes for d in self.undone)
+        self.undone.clear()
+        if delta.nbytes > self.budget:
+            raise NotUndoableError(f'The change takes {delta.nbytes} bytes, more than the undo history budget '
+                                   f'of {self.budget} bytes: it has been made but cannot be undone')
+        self.done.append(delta)
+        self.nbytes += delta.nbytes
+        while self.done and self.nbytes > self.budget:
+            self.nbytes -= self.done.popleft().nbytes
+
+    def undo(self):
+        """
+        Take the latest change to revert
+        """
+        if not self.done:
+            raise ValueError('Nothing to undo')
+        delta = self.done.pop()
+        self.undone.append(delta)
+        return delta
+
+    def redo(self):
+        """
+        Take the latest reverted change to apply again
+        """
+        if not self.undone:
+            raise ValueError('Nothing to redo')
+        delta = self.undone.pop()
+        self.done.append(delta)
+        return delta
+
+    def checkpoint(self) -> Tuple:
+        """
+        Current state of the history, to be brought back by rollback(), e.g. when a batch of changes fails
+        """
+        return deque(self.done), list(self.undone), self.nbytes
+
+    def rollback(self, checkpoint: Tuple):
+        """
+        Forget the changes recorded since a checkpoint, evicted or undone changes of the time included
+        :param checkpoint: value returned by checkpoint()
+        """
+        (self.done, self.undone, self.nbytes) = (deque(checkpoint[0]), list(checkpoint[1]), checkpoint[2])
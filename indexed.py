@@ -0,0 +1,259 @@
+"""
+This module contains a dense canvas keeping a connected component index alongside its grid.
+
+Every point is labeled with the component it belongs to, a component being a 4-connected area of a single color,
+and every component is described by its color and bounding box. A fill then looks up the component
+of the base point, gathers the neighbouring components of the old and the new color and repaints them all
+within their bounding boxes, merging them into a single component.
+
+Drawing doesn't relabel anything by itself: the components a shape crosses are only marked as stale, along
+with the points it paints, and they are split, or merged with the neighbouring components of the same color,
+right before the next fill. Many shapes drawn in a row therefore cost a single relabeling of the components
+they cross, while the rest of the canvas is left untouched.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+
+import regions
+from canvas import MemoryLessCanvas, ASCII_WHITESPACE
+from history import History
+from primitives import NotUndoableError
+
+# Label of the points painted since the last update of the index
+PENDING = -1
+
+
+class IndexedCanvas(MemoryLessCanvas):
+    def __init__(self, history: Optional[History] = None):
+        """
+        :param history: undo/redo history to record the changes to, if any
+        """
+        super().__init__(history)
+        self.labels: np.array = np.asarray([], dtype='int32')
+        # label -> [color, top, bottom, left, right], the bounding box being 0-based and exclusive
+        self.components: Dict[int, List[int]] = {}
+        self._next_label = 0
+        # Components crossed by the shapes drawn since the last update and the bounding box of the painted points
+        self._stale: Set[int] = set()
+        self._pending: Optional[List[int]] = None
+        self._pending_colors: Set[int] = set()
+        self._rebuild = False
+
+
+    def create(self, width: int, height: int):
+        # The canvas is created even if the history can't keep the change
+        try:
+            super().create(width, height)
+        except NotUndoableError:
+            self._reset()
+            raise
+        self._reset()
+
+
+    def clear(self):
+        try:
+            super().clear()
+        finally:
+            self._reset()
+
+
+    def draw_many(self, shape, coords):
+        try:
+            super().draw_many(shape, coords)
+        finally:
+            self._rebuild = True
+
+
+    def _apply_points(self, index: np.array, colors: np.array):
+        super()._apply_points(index, colors)
+        self._rebuild = True
+
+
+    def _apply_grid(self, data: np.array):
+        super()._apply_grid(data)
+        self._reset()
+        self._rebuild = True
+
+
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        self._invalidate(self.data[y, left:right], self.labels[y, left:right], color, (y, y + 1, left, right))
+        super()._paint_row(y, left, right, color)
+
+
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        self._invalidate(self.data[top:bottom, x], self.labels[top:bottom, x], color, (top, bottom, x, x + 1))
+        super()._paint_column(x, top, bottom, color)
+
+
+    def _paint_points(self, rows: np.array, cols: np.array, color: int):
+        if rows.size:
+            # Fancy indexing copies, the labels are written back once the painted points are marked
+            labels = self.labels[rows, cols]
+            box = (int(rows.min()), int(rows.max()) + 1, int(cols.min()), int(cols.max()) + 1)
+            self._invalidate(self.data[rows, cols], labels, color, box)
+            self.labels[rows, cols] = labels
+        super()._paint_points(rows, cols, color)
+
+
+    def _fork(self, twin: IndexedCanvas):
+        # The index is rebuilt by the clone on its first fill rather than copied
+        super()._fork(twin)
+        twin._reset()
+        twin._rebuild = True
+
+
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Component based fill with the same semantics as MemoryLessCanvas:
+        the area is made of the components of either color connected to the base point
+        """
+        self._writable()
+        self._update()
+        (h, w) = self.data.shape
+        start = int(self.labels[y, x])
+        area = {start}
+        frontier = [start]
+        while frontier:
+            (_, top, bottom, left, right) = self.components[frontier.pop()]
+            # Look for the neighbours within the bounding box grown by one point
+            (top, bottom, left, right) = (max(top - 1, 0), min(bottom + 1, h), max(left - 1, 0), min(right + 1, w))
+            window = self.labels[top:bottom, left:right]
+            inside = np.isin(window, list(area)) if len(area) > 1 else window == start
+            around = np.zeros_like(inside)
+            around[1:] |= inside[:-1]
+            around[:-1] |= inside[1:]
+            around[:, 1:] |= inside[:, :-1]
+            around[:, :-1] |= inside[:, 1:]
+            for label in np.unique(window[around & ~inside]).tolist():
+                if label not in area and self.components[label][0] in (old_color, new_color):
+                    area.add(label)
+                    frontier.append(label)
+
+        # Repaint the area and make a single component of it
+        target = min(area)
+        box = [new_color, h, 0, w, 0]
+        for label in area:
+            (_, top, bottom, left, right) = self.components.pop(label)
+            window = self.labels[top:bottom, left:right]
+            points = window == label
+            grid = self.data[top:bottom, left:right]
+            if self._journal is not None:
+                changed = points & (grid != new_color)
+                (rows, cols) = np.nonzero(changed)
+                self._record((top + rows) * w + left + cols, grid[changed], new_color)
+            grid[points] = new_color
+            window[points] = target
+            box = [new_color, min(box[1], top), max(box[2], bottom), min(box[3], left), max(box[4], right)]
+        self.components[target] = box
+        self._mark_dirty(box[1], box[2])
+
+
+    def _reset(self):
+        """
+        Index a blank canvas: a single component, unless the canvas is empty
+        """
+        self.labels = np.zeros(self.data.shape, dtype='int32')
+        self.components = {0: [ASCII_WHITESPACE, 0, self.height, 0, self.width]} if self.data.size else {}
+        self._next_label = 1
+        self._reset_tracking()
+
+
+    def _invalidate(self, points: np.array, labels: np.array, color: int, box: Tuple[int, int, int, int]):
+        """
+        Mark the points about to be painted and the components they belong to as stale
+        """
+        changed = points != color
+        if self._rebuild or not changed.any():
+            # Everything is going to be relabeled anyway
+            return
+        self._stale.update(label for label in np.unique(labels[changed]).tolist() if label != PENDING)
+        labels[changed] = PENDING
+        self._pending_colors.add(color)
+        if self._pending is None:
+            self._pending = list(box)
+        else:
+            self._pending = [min(self._pending[0], box[0]), max(self._pending[1], box[1]),
+                             min(self._pending[2], box[2]), max(self._pending[3], box[3])]
+
+
+    def _update(self):
+        """
+        Bring the index up to date: relabel the stale components along with the painted points
+        and the components of the same color they touch
+        """
+        if self._rebuild:
+            self._relabel((0, self.height, 0, self.width), None)
+            self._reset_tracking()
+            return
+        if self._pending is None:
+            return
+        (h, w) = self.data.shape
+        stale = self._stale
+        (top, bottom, left, right) = self._pending
+        (top, bottom, left, right) = (max(top - 1, 0), min(bottom + 1, h), max(left - 1, 0), min(right + 1, w))
+        window = self.labels[top:bottom, left:right]
+        painted = window == PENDING
+        around = np.zeros_like(painted)
+        around[1:] |= painted[:-1]
+        around[:-1] |= painted[1:]
+        around[:, 1:] |= painted[:, :-1]
+        around[:, :-1] |= painted[:, 1:]
+        for label in np.unique(window[around & ~painted]).tolist():
+            if label != PENDING and self.components[label][0] in self._pending_colors:
+                stale.add(label)
+
+        box = list(self._pending)
+        for label in stale:
+            (_, t, b, l, r) = self.components.pop(label)
+            box = [min(box[0], t), max(box[1], b), min(box[2], l), max(box[3], r)]
+        self._relabel(tuple(box), stale)
+        self._reset_tracking()
+
+
+    def _reset_tracking(self):
+        self._stale = set()
+        self._pending = None
+        self._pending_colors = set()
+        self._rebuild = False
+
+
+    def _relabel(self, box: Tuple[int, int, int, int], stale: Optional[Set[int]]):
+        """
+        Label the components within a bounding box
+        :param box: (top, bottom, left, right) bounding box
+        :param stale: labels of the components to split or merge, their points being relabeled along with
+         the painted ones; None to relabel everything within the box
+        """
+        (top, bottom, left, right) = box
+        labels = self.labels[top:bottom, left:right]
+        grid = self.data[top:bottom, left:right]
+        if stale is None:
+            self.components = {}
+            self._next_label = 0
+            scope = np.ones(labels.shape, dtype='bool')
+        else:
+            scope = labels == PENDING
+            if stale:
+                scope |= np.isin(labels, list(stale))
+
+        colors = np.flatnonzero(np.bincount(grid[scope], minlength=256))
+        for color in colors.tolist():
+            (rows, starts, ends, roots) = regions.label_runs(scope & (grid == color))
+            # Components are numbered after their first run, the roots being the indices of those runs
+            (first, component) = np.unique(roots, return_inverse=True)
+            ids = self._next_label + component
+            self._next_label += first.size
+            image = regions.rasterize(labels.shape, rows, starts, ends, ids)
+            points = scope & (grid == color)
+            labels[points] = image[points]
+
+            order = np.argsort(component, kind='stable')
+            bounds = np.flatnonzero(np.r_[True, component[order][1:] != component[order][:-1]])
+            boxes = zip((top + np.minimum.reduceat(rows[order], bounds)).tolist(),
+                        (top + np.maximum.reduceat(rows[order], bounds) + 1).tolist(),
+                        (left + np.minimum.reduceat(starts[order], bounds)).tolist(),
+                        (left + np.maximum.reduceat(ends[order], bounds)).tolist())
+            for (i, (t, b, l, r)) in enumerate(boxes):
+                self.components[int(ids[order[bounds[i]]])] = [color, t, b, l, r]
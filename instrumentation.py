@@ -0,0 +1,350 @@
+"""
+This module measures where the time of a session goes: parsing, executing each kind of command,
+serializing the canvas and writing it out.
+
+Instrumentation is installed by wrapping the executor and the writer and by replacing a few methods
+of the canvas instance, so nothing is measured, nor slowed down, unless it has been asked for.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, Optional
+
+from traits import Canvas, CommandExecutor, Writer
+from primitives import Command
+from viewport import Viewport
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+
+class Histogram:
+    """
+    Latency histogram with power of two buckets: bucket i counts the durations
+    in the [2 ** (i - 1), 2 ** i) microseconds range, bucket 0 those below one microsecond
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'peak')
+
+    def __init__(self):
+        self.buckets = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.peak = 0.0
+
+    def add(self, seconds: float):
+        self.buckets[min(int(seconds * 1e6).bit_length(), 39)] += 1
+        self.count += 1
+        self.total += seconds
+        self.peak = max(self.peak, seconds)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th percentile
+        :param q: percentile, 0 to 100
+        :return: duration in seconds
+        """
+        rank = q / 100 * self.count
+        seen = 0
+        for (i, n) in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(2 ** i / 1e6, self.peak)
+        return self.peak
+
+    def to_dict(self) -> Dict:
+        last = max((i for (i, n) in enumerate(self.buckets) if n), default=-1)
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.peak,
+            'buckets_us': {str(2 ** i): n for (i, n) in enumerate(self.buckets[:last + 1]) if n},
+        }
+
+
+class Stats:
+    """
+    Measurements collected over a session
+    """
+
+    def __init__(self):
+        self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.cells: Dict[str, int] = defaultdict(int)
+        self.painted = 0
+        self.bytes_serialized = 0
+        self.serializing = False
+        self.bytes_written = 0
+        self.started = time.perf_counter()
+
+    def record(self, stage: str, seconds: float):
+        self.latency[stage].add(seconds)
+
+    @staticmethod
+    def peak_memory() -> int:
+        """
+        Peak memory usage of the process in bytes, as traced by tracemalloc if it is running
+        or the maximum resident set size otherwise (0 if unknown)
+        """
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[1]
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def to_dict(self) -> Dict:
+        return {
+            'elapsed': time.perf_counter() - self.started,
+            'latency': {stage: histogram.to_dict() for (stage, histogram) in sorted(self.latency.items())},
+            'cells': dict(self.cells),
+            'bytes_written': self.bytes_written,
+            'peak_memory': self.peak_memory(),
+        }
+
+    def report(self) -> str:
+        """
+        Human readable summary, one line per stage
+        """
+        lines = ['%-16s %8s %12s %12s %12s %12s %12s' % ('stage', 'count', 'total ms', 'mean us',
+                                                          'p50 us', 'p99 us', 'max us')]
+        for (stage, histogram) in sorted(self.latency.items()):
+            data = histogram.to_dict()
+            lines.append('%-16s %8d %12.3f %12.1f %12.1f %12.1f %12.1f' % (
+                stage, data['count'], data['total'] * 1e3, data['mean'] * 1e6,
+                data['p50'] * 1e6, data['p99'] * 1e6, data['max'] * 1e6))
+        for (keyword, cells) in sorted(self.cells.items()):
+            if cells:
+                lines.append('cells painted by %s: %d' % (keyword, cells))
+        lines.append('bytes written: %d' % self.bytes_written)
+        lines.append('peak memory: %.1f MB' % (self.peak_memory() / 2 ** 20))
+        return '\n'.join(lines)
+
+    def dump(self, path: str):
+        """
+        Write the measurements to a JSON file
+        """
+        with open(path, 'w') as output:
+            json.dump(self.to_dict(), output, indent=2)
+
+
+def timed(stats: Stats, stage: str, function: Callable) -> Callable:
+    """
+    Wrap a function so that the duration of every call is recorded under the stage name
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.record(stage, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_canvas(canvas: Canvas, stats: Stats) -> Canvas:
+    """
+    Make a canvas record serialization time, serialized bytes and the number of cells painted through the row,
+    column and point primitives (lines, rectangles and dense fills). The canvas is switched to a subclass of its
+    class wrapping these methods, so that its clones are instrumented, and paint themselves, as well
+    :param canvas: the canvas to instrument, modified in place
+    :param stats: where to record the measurements
+    :return: the canvas
+    """
+    canvas._stats = stats
+    canvas.__class__ = _instrumented_class(type(canvas))
+    inner = getattr(canvas, 'canvas', None)
+    if isinstance(inner, Canvas):
+        # Delegating canvases (see small.AdaptiveCanvas) paint through the canvas they hold
+        instrument_canvas(inner, stats)
+    return canvas
+
+
+# Instrumented subclasses by canvas class
+_INSTRUMENTED: Dict[type, type] = {}
+
+
+def _instrumented_class(cls: type) -> type:
+    if getattr(cls, '_instrumented', False):
+        return cls
+    if cls not in _INSTRUMENTED:
+        namespace = {'_instrumented': True}
+        for name in ('to_string', 'to_bytes', 'rows_to_bytes', 'view_to_bytes'):
+            if hasattr(cls, name):
+                namespace[name] = _serializer(getattr(cls, name))
+        if hasattr(cls, '_paint_row'):
+            namespace.update(_painters(cls))
+        if hasattr(cls, '_select'):
+            namespace['_select'] = _switcher(cls._select)
+        _INSTRUMENTED[cls] = type(cls.__name__, (cls,), namespace)
+    return _INSTRUMENTED[cls]
+
+
+def _painters(cls: type) -> Dict[str, Callable]:
+    """
+    Primitives counting the cells they paint
+    """
+    (paint_row, paint_column, paint_points) = (cls._paint_row, cls._paint_column, cls._paint_points)
+
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        # Points may be painted through the row primitive, they must not be counted twice
+        if not getattr(self, '_painting_points', False):
+            self._stats.painted += right - left
+        paint_row(self, y, left, right, color)
+
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        self._stats.painted += bottom - top
+        paint_column(self, x, top, bottom, color)
+
+    def _paint_points(self, rows, cols, color: int):
+        self._stats.painted += len(rows)
+        self._painting_points = True
+        try:
+            paint_points(self, rows, cols, color)
+        finally:
+            self._painting_points = False
+    return {'_paint_row': _paint_row, '_paint_column': _paint_column, '_paint_points': _paint_points}
+
+
+def _switcher(select: Callable) -> Callable:
+    @wraps(select)
+    def wrapper(self, *args, **kwargs):
+        # A canvas with a new storage is instrumented before it is used
+        canvas = select(self, *args, **kwargs)
+        return instrument_canvas(canvas, self._stats)
+    return wrapper
+
+
+def _serializer(serialize: Callable) -> Callable:
+    @wraps(serialize)
+    def wrapper(self, *args, **kwargs):
+        stats = self._stats
+        # Serialization methods may be implemented in terms of one another, only the outer call is measured
+        if stats.serializing:
+            return serialize(self, *args, **kwargs)
+        stats.serializing = True
+        start = time.perf_counter()
+        try:
+            data = serialize(self, *args, **kwargs)
+        finally:
+            stats.serializing = False
+        stats.record('serialize', time.perf_counter() - start)
+        stats.bytes_serialized += len(data)
+        return data
+    return wrapper
+
+
+class InstrumentedExecutor(CommandExecutor):
+    """
+    Executor recording the latency and the cells painted per command type
+    """
+
+    def __init__(self, executor: CommandExecutor, stats: Stats):
+        self.executor = executor
+        self.stats = stats
+
+    def execute(self, canvas: Canvas, command: Command):
+        stats = self.stats
+        painted = stats.painted
+        start = time.perf_counter()
+        try:
+            return self.executor.execute(canvas, command)
+        finally:
+            stats.record(command.keyword.name, time.perf_counter() - start)
+            stats.cells[command.keyword.name] += stats.painted - painted
+
+    def execute_many(self, canvas: Canvas, commands) -> int:
+        # A batch is recorded as a whole
+        stats = self.stats
+        painted = stats.painted
+        start = time.perf_counter()
+        try:
+            return self.executor.execute_many(canvas, commands)
+        finally:
+            stats.record('BATCH', time.perf_counter() - start)
+            stats.cells['BATCH'] += stats.painted - painted
+
+
+class InstrumentedWriter(Writer):
+    """
+    Writer recording the time spent rendering and writing frames and the amount of data written
+    """
+
+    def __init__(self, writer: Writer, stats: Stats):
+        self.writer = writer
+        self.stats = stats
+
+    def write(self, data: str):
+        start = time.perf_counter()
+        self.writer.write(data)
+        self.stats.record('write', time.perf_counter() - start)
+        self.stats.bytes_written += len(data)
+
+    @property
+    def viewport(self) -> Optional[Viewport]:
+        return self.writer.viewport
+
+    @viewport.setter
+    def viewport(self, view: Optional[Viewport]):
+        self.writer.viewport = view
+
+    def render(self, canvas: Canvas):
+        # The wrapped writer talks to the canvas directly, the frame size is what the canvas serialized meanwhile
+        serialized = self.stats.bytes_serialized
+        start = time.perf_counter()
+        self.writer.render(canvas)
+        self.stats.record('render', time.perf_counter() - start)
+        self.stats.bytes_written += self.stats.bytes_serialized - serialized
+
+    def flush(self):
+        self.writer.flush()
+
+
+@contextmanager
+def profiled(profiler: Optional[str], output=None) -> Iterator[None]:
+    """
+    Run a block under cProfile or tracemalloc and print the report once it is over
+    :param profiler: one of PROFILERS or None to run the block as is
+    :param output: text stream for the report, stderr by default
+    """
+    output = output if output is not None else sys.stderr
+    if profiler is None:
+        yield
+    elif profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(30)
+            output.write(report.getvalue())
+    elif profiler == 'tracemalloc':
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            (current, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            output.write('traced memory: current %.1f MB, peak %.1f MB\n' % (current / 2 ** 20, peak / 2 ** 20))
+            for stat in snapshot.statistics('lineno')[:20]:
+                output.write(f'{stat}\n')
+    else:
+        raise ValueError(f'Unknown profiler {profiler}')
@@ -1,10 +1,43 @@
 import sys
+import argparse
 import asyncio
+import importlib
+import shutil
+from typing import AsyncIterator, Callable, Iterable, Optional, Tuple
 from traits import Canvas, Writer, CommandExecutor
-from primitives import Command
-from canvas import MemoryLessCanvas as CanvasClass
-from command_executor import SyncCommandExecutor as ExecutorClass
-from writer import SimpleWriter as WriterClass
+from primitives import Command, NotUndoableError
+import command_parser
+from command_executor import SyncCommandExecutor, AsyncCommandExecutor, NAVIGATION, navigate
+from writer import SimpleWriter, BufferedWriter, AsciiFormatter
+from viewport import Viewport
+from small import AdaptiveCanvas, ByteCanvas
+import instrumentation
+from instrumentation import Stats
+
+
+def _lazy(module: str, name: str) -> Callable:
+    """Factory importing a class on first use, so that NumPy is only loaded by the sessions needing it"""
+    return lambda *args, **kwargs: getattr(importlib.import_module(module), name)(*args, **kwargs)
+
+
+CANVASES = {
+    'auto': AdaptiveCanvas,
+    'small': ByteCanvas,
+    'dense': _lazy('canvas', 'MemoryLessCanvas'),
+    'tiled': _lazy('canvas', 'TiledCanvas'),
+    'rle': _lazy('canvas', 'RunLengthCanvas'),
+    'shared': _lazy('parallel', 'SharedCanvas'),
+    'indexed': _lazy('indexed', 'IndexedCanvas'),
+}
+
+# The canvases able to record their changes for undo/redo
+HISTORY_CANVASES = ('dense', 'indexed')
+
+WRITERS = {
+    'simple': SimpleWriter,
+    'buffered': BufferedWriter,
+    'ascii': AsciiFormatter,
+}
 
 class App:
     """Text drawing application
@@ -18,44 +51,261 @@ class App:
         The updated state is printed to the console.
         """
 
-    def __init__(self, canvas: Canvas, executor: CommandExecutor, writer: Writer):
+    def __init__(self, canvas: Canvas, executor: CommandExecutor, writer: Writer, stats: Optional[Stats] = None):
         self.canvas = canvas
         self.executor = executor
         self.writer = writer
+        self.stats = stats
+
+    def instrument(self, stats: Stats):
+        """Starts recording where the time goes: parsing, executing, serializing and writing"""
+        self.stats = stats
+        self.parse_line = instrumentation.timed(stats, 'parse', self.parse_line)
+        instrumentation.instrument_canvas(self.canvas, stats)
+        self.writer = instrumentation.InstrumentedWriter(self.writer, stats)
+        if isinstance(self.executor, AsyncCommandExecutor):
+            self.executor.executor = instrumentation.InstrumentedExecutor(self.executor.executor, stats)
+        else:
+            self.executor = instrumentation.InstrumentedExecutor(self.executor, stats)
+
+    def stats_report(self) -> str:
+        if self.stats is None:
+            return 'Statistics are not being collected, start the program with --stats'
+        return self.stats.report()
 
     def parse_command(self) -> Command:
-        r = input('enter command: ').split()
-        if len(r) == 0:
-            return Command(Command.Keyword.UNKNOWN)
-        if r[0] == 'C' or r[0] == 'c':
-            return Command(Command.Keyword.CREATE, *r[1:])
-        if r[0] == 'L' or r[0] == 'l':
-            return Command(Command.Keyword.LINE, *r[1:])
-        if r[0] == 'R' or r[0] == 'r':
-            return Command(Command.Keyword.RECT, *r[1:])
-        if r[0] == 'B' or r[0] == 'b':
-            return Command(Command.Keyword.FILL, *r[1:])
-        if r[0] == 'Q' or r[0] == 'q':
-            return Command(Command.Keyword.QUIT)
-        return Command(Command.Keyword.UNKNOWN)
+        return self.parse_line(input('enter command: '))
+
+    @staticmethod
+    def parse_line(line: str) -> Command:
+        """Parses a command, raising TypeError or ValueError if its arguments are malformed"""
+        return command_parser.parse(line)
+
+    async def read_commands(self) -> AsyncIterator[Command]:
+        """Reads commands from the command line without blocking the event loop"""
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                line = await loop.run_in_executor(None, input, 'enter command: ')
+            except EOFError:
+                return
+            try:
+                cmd = self.parse_line(line)
+            except (TypeError, ValueError) as e:
+                print(f'{e}\n')
+                continue
+            if cmd.keyword == Command.Keyword.UNKNOWN:
+                print('Unknown command, please repeat')
+                continue
+            if cmd.keyword == Command.Keyword.STATS:
+                print(f'{self.stats_report()}\n')
+                continue
+            yield cmd
+            if cmd.keyword == Command.Keyword.QUIT:
+                return
 
     async def start(self):
         """Starts the main command loop"""
+        if isinstance(self.executor, AsyncCommandExecutor):
+            await self.executor.run(self.canvas, self.read_commands(), self.writer,
+                                    on_error=lambda e: print(f'{e}\n'))
+            return
         while True:
-            cmd = self.parse_command()
+            try:
+                cmd = self.parse_command()
+            except (TypeError, ValueError) as e:
+                print(f'{e}\n')
+                continue
             if cmd.keyword == Command.Keyword.UNKNOWN:
                 print('Unknown command, please repeat')
                 continue
             if cmd.keyword == Command.Keyword.QUIT:
                 break
+            if cmd.keyword == Command.Keyword.FLUSH:
+                self.render()
+                continue
+            if cmd.keyword == Command.Keyword.STATS:
+                print(f'{self.stats_report()}\n')
+                continue
             try:
-                self.executor.execute(self.canvas, cmd)
+                self.execute(cmd)
+            except NotUndoableError as e:
+                # The command went through, only it cannot be undone
+                print(f'{e}\n')
             except (TypeError, ValueError) as e:
                 print(f'{e}\n')
                 continue
-            self.writer.write(self.canvas.to_string())
+            self.render()
+
+    def execute(self, cmd: Command):
+        """Executes a command, moving the viewport of the writer for the pan and zoom commands"""
+        if cmd.keyword in NAVIGATION:
+            self.writer.viewport = navigate(self.writer.viewport, cmd)
+        else:
+            self.executor.execute(self.canvas, cmd)
+
+    def render(self):
+        """Prints the canvas out, unless there is no canvas (e.g. its creation has been undone)"""
+        if self.canvas.created():
+            self.writer.render(self.canvas)
+
+    def run_script(self, lines: Iterable[str], render_every: int = 0):
+        """Executes commands streamed from a script without prompting
+
+        The canvas is rendered once the script is over, on the explicit flush command
+        and, if render_every is positive, after every render_every successfully executed commands.
+        Errors are reported to stderr along with the line number and don't stop the script.
+        """
+        pending = 0
+        for (n, line) in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                cmd = self.parse_line(line)
+            except (TypeError, ValueError) as e:
+                print(f'line {n}: {e}', file=sys.stderr)
+                continue
+            if cmd.keyword == Command.Keyword.UNKNOWN:
+                print(f'line {n}: Unknown command', file=sys.stderr)
+                continue
+            if cmd.keyword == Command.Keyword.QUIT:
+                break
+            if cmd.keyword == Command.Keyword.FLUSH:
+                if pending:
+                    self.render()
+                    pending = 0
+                continue
+            if cmd.keyword == Command.Keyword.STATS:
+                print(self.stats_report(), file=sys.stderr)
+                continue
+            try:
+                self.execute(cmd)
+            except NotUndoableError as e:
+                print(f'line {n}: {e}', file=sys.stderr)
+            except (TypeError, ValueError) as e:
+                print(f'line {n}: {e}', file=sys.stderr)
+                continue
+            pending += 1
+            if pending == render_every:
+                self.render()
+                pending = 0
+        if pending:
+            self.render()
+
+    def run_batch(self, lines: Iterable[str]):
+        """Executes a whole script as a single transaction
+
+        The script is compiled and validated as a whole, then applied all at once or not at all,
+        and the canvas is rendered once at the end. Errors are reported to stderr.
+        """
+        try:
+            buffer = command_parser.compile_script(lines)
+            self.executor.execute_many(self.canvas, buffer)
+        except NotUndoableError as e:
+            print(e, file=sys.stderr)
+        except (TypeError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return
+        except MemoryError:
+            print('Out of memory, the batch has been rolled back', file=sys.stderr)
+            return
+        self.render()
+
+
+def viewport_size(text: str) -> Tuple[int, int]:
+    """Parses a COLSxROWS viewport size, an empty string standing for the terminal size"""
+    if not text:
+        (columns, lines) = shutil.get_terminal_size()
+        # Leave room for the borders and the prompt
+        return max(columns - 2, 1), max(lines - 4, 1)
+    try:
+        (columns, rows) = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid viewport size: {text}')
+    if columns <= 0 or rows <= 0:
+        raise argparse.ArgumentTypeError(f'invalid viewport size: {text}')
+    return columns, rows
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Simple console drawing program')
+    parser.add_argument('--script', metavar='FILE',
+                        help='run commands from FILE without prompting, "-" stands for stdin')
+    parser.add_argument('--render-every', metavar='N', type=int, default=0,
+                        help='in script mode, also print the canvas after every N commands')
+    parser.add_argument('--batch', action='store_true',
+                        help='in script mode, validate the whole script first and apply it all or nothing, '
+                             'printing the canvas once; the script may only create the canvas, draw and fill')
+    parser.add_argument('--canvas', choices=sorted(CANVASES),
+                        help='canvas storage, auto by default and dense with --history: a plain byte array for small canvases and a dense grid for the others, '
+                             'either of them alone, lazily allocated tiles for very large canvases, '
+                             'run-length encoded rows for drawings made of long lines and large areas, '
+                             'a dense grid in shared memory rendered and filled by all CPUs '
+                             'or a dense grid indexing its regions to speed up repeated fills')
+    parser.add_argument('--file', metavar='PATH',
+                        help='keep the canvas in a memory-mapped file, reopening the drawing stored there if any')
+    parser.add_argument('--history', metavar='MB', type=float, default=0,
+                        help='enable undo/redo keeping up to MB megabytes of changes (dense and indexed canvases only)')
+    parser.add_argument('--writer', choices=sorted(WRITERS), default='buffered',
+                        help='output mode: plain printing, printing with a single write per frame '
+                             'or incremental terminal repaint')
+    parser.add_argument('--max-fps', metavar='N', type=float, default=0,
+                        help='with the buffered writer, print at most N frames per second, skipping the frames '
+                             'coming in between but always printing the latest one')
+    parser.add_argument('--viewport', metavar='COLSxROWS', nargs='?', const='', type=viewport_size,
+                        help='print only a window of the canvas, the size of the terminal by default, '
+                             'moved with the P command and zoomed out with the Z command')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='read, execute and print commands concurrently, skipping outdated frames')
+    parser.add_argument('--stats', metavar='FILE', nargs='?', const='',
+                        help='collect per command timings, painted cells, written bytes and peak memory, '
+                             'shown by the I command and saved to FILE as JSON on exit if given')
+    parser.add_argument('--profile', choices=instrumentation.PROFILERS,
+                        help='run the session under a profiler and print its report to stderr on exit')
+    args = parser.parse_args(argv)
+    if args.canvas is None:
+        args.canvas = 'dense' if args.history > 0 else 'auto'
+    elif args.history > 0 and args.canvas not in HISTORY_CANVASES:
+        parser.error(f'--history is not supported by the {args.canvas} canvas, '
+                     f'use one of: {", ".join(HISTORY_CANVASES)}')
+    return args
 
 
 if __name__ == '__main__':
-    app = App(CanvasClass(), ExecutorClass(), WriterClass())
-    asyncio.run(app.start())
+    args = parse_args()
+    executor = AsyncCommandExecutor() if args.pipeline else SyncCommandExecutor()
+    if args.file:
+        try:
+            canvas = _lazy('canvas', 'MappedCanvas')(args.file, flush_interval=1)
+        except (OSError, ValueError) as e:
+            print(f'Cannot open {args.file}: {e}', file=sys.stderr)
+            sys.exit(1)
+    elif args.history > 0:
+        history = _lazy('history', 'History')(int(args.history * 2 ** 20))
+        canvas = CANVASES[args.canvas](history)
+    else:
+        canvas = CANVASES[args.canvas]()
+    writer = BufferedWriter(max_fps=args.max_fps) if args.writer == 'buffered' else WRITERS[args.writer]()
+    if args.viewport is not None:
+        writer.viewport = Viewport(*args.viewport)
+    app = App(canvas, executor, writer)
+    run = app.run_batch if args.batch else lambda lines: app.run_script(lines, args.render_every)
+    if args.stats is not None:
+        app.instrument(Stats())
+    with instrumentation.profiled(args.profile):
+        try:
+            if args.script is not None and args.script != '-':
+                with open(args.script) as script:
+                    run(script)
+            elif args.script == '-' or not sys.stdin.isatty():
+                # Commands piped into the program are run as a script
+                run(sys.stdin)
+            else:
+                asyncio.run(app.start())
+        finally:
+            app.writer.flush()
+            if args.stats:
+                app.stats.dump(args.stats)
+    # Mapped and shared canvases hold resources to release
+    if hasattr(canvas, 'close'):
+        canvas.close()
@@ -0,0 +1,295 @@
+"""
+This module shrinks command sequences before they are executed, e.g. to replay long recorded sessions.
+
+The optimized sequence leaves a new canvas in exactly the same state as the original one. The static pass
+only relies on the semantics of the commands:
+ - nothing after the quit command is executed and printing, statistics or viewport commands don't change
+   the canvas,
+ - creating the canvas discards whatever has been drawn before, unless it has been saved,
+ - lines and rectangles only paint points with 'x', so between two fills their order doesn't matter:
+   duplicates, lines contained in other lines or rectangle sides and shapes outside the canvas are dropped,
+   and collinear lines overlapping or touching each other are merged,
+ - filling twice in a row from the same point with the same color does nothing the second time.
+The optional simulation pass executes the commands and also drops each one that doesn't change any point,
+e.g. a fill repainting a region already of its color. Snapshots are neither written nor read by the simulation,
+which keeps the commands following a load as they are.
+
+Run this module to rewrite a script: python optimizer.py SCRIPT [-o OUTPUT] [--simulate]
+"""
+
+import argparse
+import sys
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from primitives import Command
+from command_executor import SyncCommandExecutor
+import command_parser
+from canvas import MemoryLessCanvas
+from history import History
+
+# Reasons for eliminating commands, as reported by optimize()
+AFTER_QUIT = 'after quit'
+OUTPUT_ONLY = 'output only'
+BEFORE_CREATE = 'before create'
+OUTSIDE = 'outside the canvas'
+DUPLICATE = 'duplicate shape'
+MERGED = 'merged line'
+REPEATED_FILL = 'repeated fill'
+NO_EFFECT = 'no effect'
+
+Interval = Tuple[int, int]
+
+
+def optimize(commands: Iterable[Command], simulate: bool = False) -> Tuple[List[Command], Dict[str, int]]:
+    """
+    Drop or merge the commands which don't contribute to the final state of the canvas
+    :param commands: parsed commands, meant to be executed on a new canvas
+    :param simulate: also execute the commands and drop the ones that don't change any point
+    :return: the optimized commands and the number of commands eliminated for every reason
+    """
+    eliminated = Counter()
+    kept = []
+    commands = iter(commands)
+    for command in commands:
+        if command.keyword == Command.Keyword.QUIT:
+            eliminated[AFTER_QUIT] += 1
+            break
+        if command.keyword in (Command.Keyword.FLUSH, Command.Keyword.STATS, Command.Keyword.PAN, Command.Keyword.ZOOM):
+            eliminated[OUTPUT_ONLY] += 1
+            continue
+        kept.append(command)
+    eliminated[AFTER_QUIT] += sum(1 for _ in commands)
+
+    # Undo can bring back any previous state, so the canvas history must be kept as it is
+    if not any(command.keyword in (Command.Keyword.UNDO, Command.Keyword.REDO) for command in kept):
+        kept = _compact(kept, eliminated)
+    if simulate:
+        kept = _simulate(kept, eliminated)
+    return kept, {reason: count for (reason, count) in eliminated.items() if count}
+
+
+def _ints(command: Command, count: int) -> Optional[List[int]]:
+    args = command.args[:count]
+    if len(args) < count or any(type(arg) is not int for arg in args):
+        return None
+    return args
+
+
+def _dimensions(command: Command) -> Optional[List[int]]:
+    """
+    Dimensions of the canvas made by a creation command, None if the command fails
+    """
+    dimensions = _ints(command, 2)
+    if dimensions is None or min(dimensions) < 0:
+        return None
+    return dimensions
+
+
+def _compact(commands: List[Command], eliminated: Counter) -> List[Command]:
+    # Only the last successful creation matters, as long as nothing has been saved before it
+    start = 0
+    for (i, command) in enumerate(commands):
+        if command.keyword == Command.Keyword.SAVE:
+            break
+        if command.keyword == Command.Keyword.CREATE and _dimensions(command) is not None:
+            start = i
+    eliminated[BEFORE_CREATE] += start
+    commands = commands[start:]
+
+    result = []
+    block: List[Command] = []
+    size = None
+    for command in commands:
+        if command.keyword in (Command.Keyword.LINE, Command.Keyword.RECT):
+            block.append(command)
+            continue
+        result.extend(_compact_shapes(block, size, eliminated))
+        block = []
+        if command.keyword == Command.Keyword.CREATE and _dimensions(command) is not None:
+            size = _dimensions(command)
+        elif command.keyword == Command.Keyword.LOAD:
+            # Dimensions of a snapshot are not known until it is loaded
+            size = None
+        if command.keyword == Command.Keyword.FILL:
+            point = _ints(command, 2)
+            if size is not None and point is not None and \
+                    not (0 < point[0] <= size[0] and 0 < point[1] <= size[1]):
+                eliminated[OUTSIDE] += 1
+                continue
+            previous = result[-1] if result else None
+            if previous is not None and previous.keyword == Command.Keyword.FILL and previous.args == command.args:
+                eliminated[REPEATED_FILL] += 1
+                continue
+        result.append(command)
+    result.extend(_compact_shapes(block, size, eliminated))
+    return result
+
+
+def _compact_shapes(block: List[Command], size: Optional[List[int]], eliminated: Counter) -> List[Command]:
+    """
+    Minimize a sequence of lines and rectangles not interleaved with other commands
+    """
+    result = []
+    rects = set()
+    # Horizontal intervals by row, vertical ones by column, 1-based and inclusive, clipped to the canvas
+    lines = (OrderedDict(), OrderedDict())
+    sides = ({}, {})
+    for command in block:
+        coords = _ints(command, 4)
+        if coords is None:
+            # Let the executor report the error
+            result.append(command)
+            continue
+        (x1, y1, x2, y2) = coords
+        if command.keyword == Command.Keyword.RECT:
+            if x1 > x2 or y1 > y2:
+                result.append(command)
+                continue
+            if size is not None and (x1 > size[0] or x2 <= 0 or y1 > size[1] or y2 <= 0):
+                eliminated[OUTSIDE] += 1
+                continue
+            if (x1, y1, x2, y2) in rects:
+                eliminated[DUPLICATE] += 1
+                continue
+            rects.add((x1, y1, x2, y2))
+            result.append(command)
+            for (horizontal, fixed, first, last) in ((True, y1, x1, x2), (True, y2, x1, x2),
+                                                      (False, x1, y1, y2), (False, x2, y1, y2)):
+                interval = _clip(horizontal, fixed, first, last, size)
+                if interval is not None:
+                    sides[not horizontal].setdefault(fixed, []).append(interval)
+            continue
+
+        if x1 != x2 and y1 != y2:
+            result.append(command)
+            continue
+        horizontal = y1 == y2
+        (fixed, first, last) = (y1, min(x1, x2), max(x1, x2)) if horizontal else (x1, min(y1, y2), max(y1, y2))
+        interval = _clip(horizontal, fixed, first, last, size)
+        if interval is None:
+            eliminated[OUTSIDE] += 1
+            continue
+        lines[not horizontal].setdefault(fixed, []).append(interval)
+
+    for (orientation, by_line) in enumerate(lines):
+        for (fixed, intervals) in by_line.items():
+            merged = _merge(intervals)
+            covering = sides[orientation].get(fixed, [])
+            kept = [(first, last) for (first, last) in merged
+                    if not _covered(first, last, covering)
+                    # A single point is a line of either orientation
+                    and not (first == last and _covered(fixed, fixed, sides[1 - orientation].get(first, [])))]
+            eliminated[DUPLICATE] += len(merged) - len(kept)
+            eliminated[MERGED] += len(intervals) - len(merged)
+            for (first, last) in kept:
+                if orientation == 0:
+                    result.append(Command(Command.Keyword.LINE, first, fixed, last, fixed))
+                else:
+                    result.append(Command(Command.Keyword.LINE, fixed, first, fixed, last))
+    return result
+
+
+def _clip(horizontal: bool, fixed: int, first: int, last: int, size: Optional[List[int]]) -> Optional[Interval]:
+    """
+    Crop a segment to the canvas
+    :return: the visible part of the segment or None if there is none
+    """
+    if size is None:
+        return first, last
+    (along, across) = (size[0], size[1]) if horizontal else (size[1], size[0])
+    if not 0 < fixed <= across or last <= 0 or first > along:
+        return None
+    return max(first, 1), min(last, along)
+
+
+def _covered(first: int, last: int, intervals: List[Interval]) -> bool:
+    return any(a <= first and last <= b for (a, b) in intervals)
+
+
+def _merge(intervals: List[Interval]) -> List[Interval]:
+    """
+    Union of inclusive intervals, merging the ones overlapping or touching each other
+    """
+    merged = []
+    for (first, last) in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+class _Recorder(History):
+    """
+    History counting the changes made to the canvas
+    """
+
+    def __init__(self, budget: int):
+        super().__init__(budget)
+        self.changes = 0
+
+    def push(self, delta):
+        self.changes += 1
+        super().push(delta)
+
+
+def _simulate(commands: List[Command], eliminated: Counter) -> List[Command]:
+    # A command which changes nothing can be dropped without changing the state any later command starts from.
+    # Nothing needs to be kept in the history unless it can be undone
+    undoable = any(command.keyword in (Command.Keyword.UNDO, Command.Keyword.REDO) for command in commands)
+    history = _Recorder(History().budget if undoable else 0)
+    canvas = MemoryLessCanvas(history)
+    executor = SyncCommandExecutor()
+    result = []
+    for (i, command) in enumerate(commands):
+        if command.keyword == Command.Keyword.SAVE:
+            result.append(command)
+            continue
+        if command.keyword == Command.Keyword.LOAD:
+            result.extend(commands[i:])
+            break
+        changes = history.changes
+        try:
+            executor.execute(canvas, command)
+        except (TypeError, ValueError):
+            pass
+        if history.changes == changes and command.keyword not in (Command.Keyword.UNDO, Command.Keyword.REDO):
+            eliminated[NO_EFFECT] += 1
+            continue
+        result.append(command)
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Rewrite a drawing script into a shorter equivalent one')
+    parser.add_argument('script', help='script to optimize, "-" for stdin')
+    parser.add_argument('-o', '--output', metavar='FILE', help='where to write the optimized script, stdout by default')
+    parser.add_argument('--simulate', action='store_true',
+                        help='also execute the script and drop the commands that change nothing')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.script == '-' else open(args.script)
+    with source:
+        lines = [line for line in source if line.strip()]
+    try:
+        commands = [command_parser.parse(line) for line in lines]
+    except (TypeError, ValueError) as e:
+        print(f'Cannot optimize the script: {e}', file=sys.stderr)
+        return 1
+    if any(command.keyword == Command.Keyword.UNKNOWN for command in commands):
+        print('Cannot optimize the script: it contains unknown commands', file=sys.stderr)
+        return 1
+
+    (optimized, eliminated) = optimize(commands, args.simulate)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    with output:
+        output.writelines(f'{command_parser.format_command(command)}\n' for command in optimized)
+    print(f'{len(commands) - len(optimized)} of {len(commands)} commands eliminated', file=sys.stderr)
+    for (reason, count) in sorted(eliminated.items()):
+        print(f'  {reason}: {count}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
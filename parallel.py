@@ -0,0 +1,214 @@
+"""
+This module contains a canvas whose grid lives in shared memory, so that a pool of worker processes
+can work on horizontal bands of it in parallel.
+
+Serializing splits the rows into bands framed by the workers straight into a shared output buffer.
+Filling labels the regions of every band in parallel (see regions module), merges the regions touching across
+band boundaries in the main process and lets the workers repaint the selected regions of their bands.
+Every band is always given to the same worker, which keeps its labels between the two steps of a fill.
+"""
+
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+import regions
+from canvas import MemoryLessCanvas, ASCII_DASH, ASCII_NEWLINE, ASCII_WHITESPACE, _frame_rows, _inside
+
+# Shared memory blocks attached by a worker process, by name
+_attached: Dict[str, SharedMemory] = {}
+# Regions of the bands labeled by a worker for the fill in progress, by band
+_labeled: Dict[Tuple[int, int], Tuple[np.array, np.array, np.array, np.array]] = {}
+
+
+def _views(*blocks: Tuple[str, Tuple[int, int]]) -> List[np.array]:
+    """
+    Worker side: map shared memory blocks as uint8 arrays.
+    Blocks attached for the previous tasks and not needed by this one are detached, as they are likely
+    to belong to a grid or an output buffer which has been replaced since
+    """
+    names = [name for (name, _) in blocks]
+    for stale in [name for name in _attached if name not in names]:
+        _attached.pop(stale).close()
+    views = []
+    for (name, shape) in blocks:
+        if name not in _attached:
+            _attached[name] = SharedMemory(name)
+        views.append(np.ndarray(shape, dtype='uint8', buffer=_attached[name].buf))
+    return views
+
+
+def _frame_band(grid: str, out: str, shape: Tuple[int, int], top: int, bottom: int):
+    (h, w) = shape
+    (data, frame) = _views((grid, shape), (out, (h + 2, w + 3)))
+    _frame_rows(frame[top + 1:bottom + 1], data[top:bottom])
+
+
+def _label_band(grid: str, shape: Tuple[int, int], top: int, bottom: int, old_color: int, new_color: int,
+                seed: Optional[Tuple[int, int]]):
+    """
+    Label the regions of a band of rows, keeping the labels for the painting step
+    :return: number of runs, the runs of the first and the last row of the band with their labels
+     and the label of the region containing the seed point (-1 if no seed is given)
+    """
+    (data,) = _views((grid, shape))
+    (rows, starts, ends, labels) = _labeled[(top, bottom)] = \
+        regions.label_runs(_inside(data[top:bottom], old_color, new_color))
+    first = rows == 0
+    last = rows == bottom - top - 1
+    label = -1
+    if seed is not None:
+        label = int(labels[regions.run_at(rows, starts, ends, seed[0], seed[1] - top)])
+    return (rows.size, (starts[first], ends[first], labels[first]),
+            (starts[last], ends[last], labels[last]), label)
+
+
+def _paint_band(grid: str, shape: Tuple[int, int], top: int, bottom: int, new_color: int,
+                selected: np.array) -> Optional[Tuple[int, int]]:
+    """
+    Paint the regions of a band of rows having the selected labels
+    :return: [first, last) range of painted rows
+    """
+    (data,) = _views((grid, shape))
+    (rows, starts, ends, labels) = _labeled.pop((top, bottom))
+    pick = np.isin(labels, selected)
+    if not pick.any():
+        return None
+    regions.paint_runs(data[top:bottom], rows[pick], starts[pick], ends[pick], new_color)
+    return top + int(rows[pick][0]), top + int(rows[pick][-1]) + 1
+
+
+class SharedCanvas(MemoryLessCanvas):
+    """
+    Dense canvas in shared memory, serialized and filled by a pool of worker processes.
+    Canvases smaller than the threshold are handled in the main process as usual, since passing
+    them to the workers would cost more than it saves. Call close() to stop the workers and free the memory.
+    """
+
+    def __init__(self, workers: Optional[int] = None, threshold: int = 2 ** 22):
+        """
+        :param workers: number of worker processes, the number of CPUs by default
+        :param threshold: number of points from which the workers are used
+        """
+        super().__init__()
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self._grid: Optional[SharedMemory] = None
+        self._frame: Optional[SharedMemory] = None
+        self._pools: List[ProcessPoolExecutor] = []
+
+
+    def create(self, width: int, height: int):
+        # The new block is ready before the current one goes, so that a failure keeps the drawing
+        grid = SharedMemory(create=True, size=max(width * height, 1))
+        try:
+            data = np.ndarray((height, width), dtype='uint8', buffer=grid.buf)
+        except BaseException:
+            self._free(grid)
+            raise
+        data.fill(ASCII_WHITESPACE)
+        self._release()
+        (self._grid, self.data) = (grid, data)
+        self._mark_dirty(0, height)
+
+
+    def _import(self, data: np.array):
+        self.create(data.shape[1], data.shape[0])
+        self.data[...] = data
+
+
+    def clone(self) -> SharedCanvas:
+        """
+        Copy of the canvas in a shared memory block of its own, with workers of its own
+        """
+        twin = SharedCanvas(self.workers, self.threshold)
+        if self.created():
+            twin._import(self.data)
+        return twin
+
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared memory
+        """
+        for pool in self._pools:
+            pool.shutdown()
+        self._pools = []
+        self._release()
+
+
+    def to_bytes(self) -> bytes:
+        if self.data.size < self.threshold:
+            return super().to_bytes()
+        (h, w) = self.data.shape
+        size = (h + 2) * (w + 3)
+        if self._frame is None or self._frame.size < size:
+            self._free(self._frame)
+            self._frame = SharedMemory(create=True, size=size)
+        frame = np.ndarray((h + 2, w + 3), dtype='uint8', buffer=self._frame.buf)
+        frame[0, :w + 2] = ASCII_DASH
+        frame[h + 1, :w + 2] = ASCII_DASH
+        frame[[0, h + 1], w + 2] = ASCII_NEWLINE
+        del frame
+
+        self._map(_frame_band, [(self._grid.name, self._frame.name, (h, w), top, bottom)
+                                for (top, bottom) in self._bands()])
+        # No line break after the bottom border
+        return bytes(self._frame.buf[:size - 1])
+
+
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        if self.data.size < self.threshold:
+            return super()._flood(x, y, old_color, new_color)
+        shape = self.data.shape
+        bands = self._bands()
+        labeled = self._map(_label_band, [
+            (self._grid.name, shape, top, bottom, old_color, new_color, (x, y) if top <= y < bottom else None)
+            for (top, bottom) in bands])
+
+        seed = next((i, label) for (i, (_, _, _, label)) in enumerate(labeled) if label >= 0)
+        (offsets, area) = regions.join_bands([(count, first, last) for (count, first, last, _) in labeled], seed)
+
+        band_of = np.searchsorted(offsets, area, side='right') - 1
+        painted = [span for span in self._map(_paint_band, [
+            (self._grid.name, shape, top, bottom, new_color, area[band_of == i] - offsets[i])
+            for (i, (top, bottom)) in enumerate(bands)]) if span is not None]
+        self._mark_dirty(min(top for (top, _) in painted), max(bottom for (_, bottom) in painted))
+
+
+    def _bands(self) -> List[Tuple[int, int]]:
+        """
+        Split the rows into a few bands per worker, to even out the load
+        """
+        h = self.data.shape[0]
+        count = min(h, self.workers * 4)
+        edges = np.linspace(0, h, count + 1).astype(int)
+        return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+    def _map(self, task, arguments: List[Tuple]) -> List:
+        """
+        Run a task once per band, band i going to worker i modulo the number of workers
+        """
+        if not self._pools:
+            self._pools = [ProcessPoolExecutor(1) for _ in range(self.workers)]
+        futures = [self._pools[i % self.workers].submit(task, *args) for (i, args) in enumerate(arguments)]
+        return [future.result() for future in futures]
+
+
+    def _release(self):
+        # The views must go before the memory they map
+        self.data = np.asarray([], dtype='uint8')
+        self._free(self._grid)
+        self._free(self._frame)
+        (self._grid, self._frame) = (None, None)
+
+
+    @staticmethod
+    def _free(block: Optional[SharedMemory]):
+        if block is not None:
+            block.close()
+            block.unlink()
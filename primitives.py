@@ -22,6 +22,16 @@ class Command:
         FILL = 4
         QUIT = 5
         UNKNOWN = 6
+        FLUSH = 7
+        UNDO = 8
+        REDO = 9
+        STATS = 10
+        SAVE = 11
+        LOAD = 12
+        PAN = 13
+        ZOOM = 14
+
+    __slots__ = ('keyword', 'args')
 
     keyword: Keyword
     args: List
@@ -29,3 +39,10 @@ class Command:
     def __init__(self, keyword: Keyword, *argv):
         self.keyword = keyword
         self.args = list(argv)
+
+
+class NotUndoableError(ValueError):
+    """
+    A change has been made but is too large to be kept in the undo history: the command went through,
+    only undoing it is not possible
+    """
@@ -0,0 +1,163 @@
+"""
+This module finds the connected regions of a boolean grid with whole-array operations.
+
+A region is described by its horizontal runs: every run of True values in a row is a node, and runs of
+consecutive rows sharing at least one column are linked (4-connectivity). Components of that graph are found
+by repeatedly hooking roots onto smaller ones and compressing the paths, so the cost is a few passes over
+the runs rather than a Python step per point or per run.
+"""
+
+from typing import List, Tuple
+import numpy as np
+
+
+def runs(mask: np.array) -> Tuple[np.array, np.array, np.array]:
+    """
+    Find the horizontal runs of True values of a 2-dimensional mask
+    :param mask: boolean array of shape (height, width)
+    :return: (rows, starts, ends) of the runs, ends being exclusive, sorted by row and start
+    """
+    (h, w) = mask.shape
+    padded = np.zeros((h, w + 2), dtype='int8')
+    padded[:, 1:w + 1] = mask
+    edges = np.diff(padded, axis=1)
+    (rows, starts) = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    return rows, starts, ends
+
+
+def touching(a_starts: np.array, a_ends: np.array, b_starts: np.array, b_ends: np.array) -> Tuple[np.array, np.array]:
+    """
+    Find the pairs of runs sharing at least one column between two sorted lists of non-overlapping runs.
+    Sort keys may include a row component (row * (width + 1) + column) to match many pairs of rows at once
+    :param a_starts: starts of the first list of runs
+    :param a_ends: ends of the first list of runs (exclusive)
+    :param b_starts: starts of the second list of runs
+    :param b_ends: ends of the second list of runs (exclusive)
+    :return: indices into the first and the second list, one entry per pair
+    """
+    # The runs of the first list touching a run of the second one are a contiguous range of it:
+    # from the first run ending after its start to the last one starting before its end
+    lo = np.searchsorted(a_ends, b_starts, side='right')
+    hi = np.searchsorted(a_starts, b_ends, side='left')
+    counts = np.maximum(hi - lo, 0)
+    b = np.repeat(np.arange(b_starts.size), counts)
+    offsets = np.arange(b.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    return lo[b] + offsets, b
+
+
+def components(n: int, u: np.array, v: np.array) -> np.array:
+    """
+    Connected components of an undirected graph
+    :param n: number of nodes
+    :param u: first ends of the edges
+    :param v: second ends of the edges
+    :return: component representative of every node, the smallest node of its component
+    """
+    parent = np.arange(n)
+    while u.size:
+        (pu, pv) = (parent[u], parent[v])
+        apart = pu != pv
+        if not apart.any():
+            break
+        (u, v, pu, pv) = (u[apart], v[apart], pu[apart], pv[apart])
+        # Roots only point to smaller nodes, so no cycle can appear
+        parent[np.maximum(pu, pv)] = np.minimum(pu, pv)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+    return parent
+
+
+def label_runs(mask: np.array) -> Tuple[np.array, np.array, np.array, np.array]:
+    """
+    Find the runs of a mask along with the connected region each one belongs to
+    :param mask: boolean array of shape (height, width)
+    :return: (rows, starts, ends, labels), a label being the index of the first run of the region
+    """
+    (rows, starts, ends) = runs(mask)
+    stride = mask.shape[1] + 1
+    # Keys of the runs shifted one row down are comparable with the keys of the runs of the next row
+    (a, b) = touching((rows + 1) * stride + starts, (rows + 1) * stride + ends,
+                      rows * stride + starts, rows * stride + ends)
+    return rows, starts, ends, components(rows.size, a, b)
+
+
+def join_bands(bands: List[Tuple[int, Tuple, Tuple]], seed: Tuple[int, int]) -> Tuple[np.array, np.array]:
+    """
+    Find the region containing a point when the bands of rows of a grid are labeled separately
+    (see label_runs()): the regions touching across every boundary between two bands are merged
+    :param bands: for every band from the top one, its number of runs and the (starts, ends, labels)
+     of the runs of its first row and of its last row
+    :param seed: (band, label) of the region containing the point
+    :return: (offsets, area): labels of band i are made global by adding offsets[i] to them,
+     area holds the global labels of the regions connected to the point, sorted
+    """
+    # Labels are made global by offsetting them with the number of runs of the previous bands
+    offsets = np.cumsum([0] + [count for (count, _, _) in bands])
+    start = offsets[seed[0]] + seed[1]
+    (u, v) = ([np.array([start])], [np.array([start])])
+    for i in range(len(bands) - 1):
+        (a_starts, a_ends, a_labels) = bands[i][2]
+        (b_starts, b_ends, b_labels) = bands[i + 1][1]
+        (a, b) = touching(a_starts, a_ends, b_starts, b_ends)
+        u.append(offsets[i] + a_labels[a])
+        v.append(offsets[i + 1] + b_labels[b])
+    (nodes, edges) = np.unique(np.concatenate(u + v), return_inverse=True)
+    (u, v) = np.split(edges, 2)
+    roots = components(nodes.size, u, v)
+    return offsets, nodes[roots == roots[np.searchsorted(nodes, start)]]
+
+
+def run_at(rows: np.array, starts: np.array, ends: np.array, x: int, y: int) -> int:
+    """
+    Find the run containing a point
+    :return: index of the run or -1 if the point is not in any
+    """
+    (lo, hi) = np.searchsorted(rows, [y, y + 1])
+    i = lo + int(np.searchsorted(starts[lo:hi], x, side='right')) - 1
+    if i >= lo and x < ends[i]:
+        return int(i)
+    return -1
+
+
+def paint_runs(grid: np.array, rows: np.array, starts: np.array, ends: np.array, color: int):
+    """
+    Paint runs of a grid in one pass
+    :param grid: uint8 array of shape (height, width), modified in place
+    :param rows: rows of the runs
+    :param starts: starts of the runs
+    :param ends: ends of the runs (exclusive)
+    :param color: color to paint the runs with
+    """
+    if not rows.size:
+        return
+    (h, w) = grid.shape
+    # Rows are laid out w + 1 wide so that the end of a run never falls on the start of another one,
+    # a point is then covered when the running sum of the run starts and ends is positive
+    edges = np.zeros(h * (w + 1) + 1, dtype='int8')
+    edges[rows * (w + 1) + starts] = 1
+    edges[rows * (w + 1) + ends] = -1
+    cover = np.cumsum(edges[:-1], dtype='int8').reshape(h, w + 1)[:, :w].view('bool')
+    grid[cover] = color
+
+
+def rasterize(shape: Tuple[int, int], rows: np.array, starts: np.array, ends: np.array,
+              values: np.array) -> np.array:
+    """
+    Draw runs with a value per run
+    :param shape: (height, width) of the grid
+    :param rows: rows of the runs
+    :param starts: starts of the runs
+    :param ends: ends of the runs (exclusive)
+    :param values: value of every run
+    :return: int64 array of the given shape holding the value of the run covering every point, 0 elsewhere
+    """
+    (h, w) = shape
+    # Same layout as in paint_runs(): the running sum steps up to the value at the start of a run and back down at its end
+    edges = np.zeros(h * (w + 1) + 1, dtype='int64')
+    edges[rows * (w + 1) + starts] = values
+    edges[rows * (w + 1) + ends] = -values
+    return np.cumsum(edges[:-1]).reshape(h, w + 1)[:, :w]
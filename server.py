@@ -0,0 +1,259 @@
+"""
+This module serves canvases to many concurrent clients over TCP or a Unix socket.
+
+Every connection is a session with a canvas of its own, driven by the same commands as the console program,
+one per line. Nothing is printed after a command unless it fails: the canvas is sent on the F command only,
+so clients choose when to pay for a frame, and once a client pans or zooms the frame is its viewport only. Sessions run on a single event loop; the commands whose cost
+grows with the canvas area (creating, filling and printing a large canvas) are handed to a bounded thread pool
+so that they don't hold up the other sessions, and every frame waits for the client to read the previous
+ones (back-pressure), so a slow reader only slows down its own session.
+
+Run this module to start a server: python server.py [--port PORT | --unix PATH] [options]
+"""
+
+import argparse
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from traits import Canvas
+from primitives import Command
+import command_parser
+from command_executor import SyncCommandExecutor, NAVIGATION, int_args, navigate
+from canvas import MemoryLessCanvas, TiledCanvas, RunLengthCanvas
+from indexed import IndexedCanvas
+from small import AdaptiveCanvas, ByteCanvas
+from viewport import Viewport
+
+CANVASES: Dict[str, Callable[[], Canvas]] = {
+    'dense': MemoryLessCanvas,
+    'tiled': TiledCanvas,
+    'rle': RunLengthCanvas,
+    'indexed': IndexedCanvas,
+    'small': ByteCanvas,
+    'auto': AdaptiveCanvas,
+}
+
+# Commands a session may run; snapshots would give clients access to the server files
+ALLOWED = {Command.Keyword.CREATE, Command.Keyword.LINE, Command.Keyword.RECT, Command.Keyword.FILL,
+           Command.Keyword.UNDO, Command.Keyword.REDO, Command.Keyword.FLUSH, Command.Keyword.QUIT,
+           Command.Keyword.PAN, Command.Keyword.ZOOM}
+
+# Commands whose cost depends on the canvas area, and the area from which they are run in the thread pool
+HEAVY = {Command.Keyword.CREATE, Command.Keyword.FILL, Command.Keyword.FLUSH}
+OFFLOAD_POINTS = 2 ** 16
+
+# Seconds a session waits for the client to hang up once it is over
+LINGER = 5
+
+
+class Session:
+    """
+    State of a client: its canvas and the limits it runs within
+    """
+
+    def __init__(self, canvas: Canvas, max_points: int):
+        """
+        :param canvas: the session canvas, not created yet
+        :param max_points: largest canvas area the session may create
+        """
+        self.canvas = canvas
+        self.max_points = max_points
+        self.executor = SyncCommandExecutor()
+        # Window printed by the print command once the client pans or zooms, the whole canvas until then
+        self.view: Optional[Viewport] = None
+
+    def check(self, command: Command):
+        """
+        Reject the commands the session may not run, before anything is executed
+        """
+        if command.keyword == Command.Keyword.UNKNOWN:
+            raise ValueError('Unknown command, please repeat')
+        if command.keyword not in ALLOWED:
+            raise ValueError('Command not available on the server')
+        if command.keyword == Command.Keyword.CREATE:
+            (width, height) = int_args(command.args, 2)
+            if width * height > self.max_points:
+                raise ValueError(f'Canvas too large, at most {self.max_points} points are allowed')
+
+    def execute(self, command: Command) -> Optional[bytes]:
+        """
+        Run a checked command
+        :return: the frame to send back for the print command, None otherwise
+        """
+        if command.keyword in NAVIGATION:
+            self.view = navigate(self.view, command)
+            return None
+        if command.keyword == Command.Keyword.FLUSH:
+            if not self.canvas.created():
+                raise ValueError('Canvas must first be created')
+            if self.view is not None:
+                return self.canvas.view_to_bytes(self.view) + b'\n'
+            return self.canvas.to_bytes() + b'\n'
+        self.executor.execute(self.canvas, command)
+        return None
+
+    def is_heavy(self, command: Command) -> bool:
+        """
+        Whether a command is worth running in the thread pool
+        :param command: a checked command
+        """
+        if command.keyword not in HEAVY:
+            return False
+        if command.keyword == Command.Keyword.CREATE:
+            (width, height) = int_args(command.args, 2)
+            return width * height >= OFFLOAD_POINTS
+        if command.keyword == Command.Keyword.FLUSH and self.view is not None:
+            return False
+        return self.canvas.created() and self.canvas.width * self.canvas.height >= OFFLOAD_POINTS
+
+
+class Server:
+    """
+    Canvas server: accepts connections and runs one session per connection
+    """
+
+    def __init__(self, canvas_factory: Callable[[], Canvas] = MemoryLessCanvas, max_points: int = 2 ** 24,
+                 max_sessions: int = 10000, workers: int = 4, line_limit: int = 2 ** 16):
+        """
+        :param canvas_factory: callable returning a new canvas for every session
+        :param max_points: largest canvas area a session may create
+        :param max_sessions: number of concurrent sessions above which new connections are turned down
+        :param workers: number of threads running the heavy commands of all the sessions
+        :param line_limit: longest command line accepted, in bytes
+        """
+        self.canvas_factory = canvas_factory
+        self.max_points = max_points
+        self.max_sessions = max_sessions
+        self.line_limit = line_limit
+        self.sessions = 0
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='canvas')
+
+    async def start_tcp(self, host: Optional[str], port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port, limit=self.line_limit, backlog=self._backlog())
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        return await asyncio.start_unix_server(self.handle, path, limit=self.line_limit, backlog=self._backlog())
+
+    def _backlog(self) -> int:
+        # Many clients may connect at once, the default backlog of 100 would turn them down
+        return max(100, min(self.max_sessions, 4096))
+
+    def close(self):
+        """
+        Stop the thread pool, once the servers are closed
+        """
+        self.pool.shutdown()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Run a session until the client quits or disconnects
+        """
+        if self.sessions >= self.max_sessions:
+            writer.write(b'Too many sessions, try again later\n')
+            await self._close(reader, writer)
+            return
+        self.sessions += 1
+        try:
+            await self._serve(Session(self.canvas_factory(), self.max_points), reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sessions -= 1
+            await self._close(reader, writer)
+
+    async def _serve(self, session: Session, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # The line exceeds the limit, the rest of the stream can't be trusted
+                writer.write(b'Command line too long\n')
+                return
+            if not line:
+                return
+            if not line.strip():
+                continue
+            try:
+                command = command_parser.parse(line.decode('latin-1'))
+                if command.keyword == Command.Keyword.QUIT:
+                    return
+                session.check(command)
+                if session.is_heavy(command):
+                    frame = await loop.run_in_executor(self.pool, session.execute, command)
+                else:
+                    frame = session.execute(command)
+            except (TypeError, ValueError) as e:
+                frame = f'{e}\n'.encode('latin-1', 'replace')
+            if frame is not None:
+                writer.write(frame)
+                # Wait for the client to catch up before reading anything more from it
+                await writer.drain()
+
+    @staticmethod
+    async def _close(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        End a session. Closing a socket with unread input resets the connection, which may discard
+        the output the client hasn't read yet, so whatever the client still sends is read and dropped
+        until it hangs up
+        """
+        async def discard():
+            while await reader.read(2 ** 16):
+                pass
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+            await asyncio.wait_for(discard(), LINGER)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Serve drawing sessions over TCP or a Unix socket')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on, 127.0.0.1 by default')
+    parser.add_argument('--port', type=int, default=7070, help='TCP port to listen on, 7070 by default')
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--canvas', choices=sorted(CANVASES), default='auto', help='canvas storage of the sessions')
+    parser.add_argument('--max-points', metavar='N', type=int, default=2 ** 24,
+                        help='largest canvas area (width * height) a session may create')
+    parser.add_argument('--max-sessions', metavar='N', type=int, default=10000,
+                        help='maximum number of concurrent sessions')
+    parser.add_argument('--workers', metavar='N', type=int, default=4,
+                        help='number of threads running the fills and renders of large canvases')
+    return parser.parse_args(argv)
+
+
+async def serve(args: argparse.Namespace):
+    server = Server(CANVASES[args.canvas], args.max_points, args.max_sessions, args.workers)
+    if args.unix:
+        listener = await server.start_unix(args.unix)
+    else:
+        listener = await server.start_tcp(args.host, args.port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f'Cannot start the server: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""
+This module contains canvases that don't depend on NumPy, for the small drawings most sessions are about.
+
+Loading NumPy takes longer than drawing, filling and printing a small canvas in plain Python, and reading
+or writing a single point of a NumPy array is slower than indexing a bytearray. ByteCanvas keeps the points
+in a bytearray and paints, scans and serializes whole runs of them with bytes methods running in C.
+AdaptiveCanvas picks ByteCanvas for small canvases and another backend, NumPy based by default and only
+imported then, for large ones.
+"""
+
+from __future__ import annotations
+import copy
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from traits import Canvas
+
+# Same codes as in the canvas module, which can't be imported without NumPy
+ASCII_WHITESPACE = 32
+ASCII_X = 120
+
+# Largest canvas area (width * height) AdaptiveCanvas keeps in a ByteCanvas
+SMALL_POINTS = 2 ** 16
+
+
+def line_points(x1: int, y1: int, x2: int, y2: int, width: int, height: int) -> Iterator[Tuple[int, int]]:
+    """
+    Rasterize a segment cropped to the visible area (Bresenham's algorithm), pure Python counterpart
+    of canvas._line_points: one point per step along the major axis, the other coordinate rounded half up,
+    the same points whichever end the segment starts from, and only the visible steps are visited
+    :param x1: x coordinate of the first end, 1-based
+    :param y1: y coordinate of the first end, 1-based
+    :param x2: x coordinate of the second end, 1-based
+    :param y2: y coordinate of the second end, 1-based
+    :param width: canvas width
+    :param height: canvas height
+    :return: 0-based (x, y) coordinates of the points
+    """
+    steep = abs(y2 - y1) > abs(x2 - x1)
+    (a1, b1, a2, b2) = (y1, x1, y2, x2) if steep else (x1, y1, x2, y2)
+    if a1 > a2:
+        (a1, b1, a2, b2) = (a2, b2, a1, b1)
+    (size_a, size_b) = (height, width) if steep else (width, height)
+
+    # Point t is (a1 + t, b1 + sign * q(t)) with q(t) = floor((2 * t * |db| + d) / (2 * d)), non-decreasing
+    d = a2 - a1
+    db = b2 - b1
+    sign = (db > 0) - (db < 0)
+    slope = abs(db)
+    first = max(1 - a1, 0)
+    last = min(size_a - a1, d)
+    (q_first, q_last) = (1 - b1, size_b - b1) if sign >= 0 else (b1 - size_b, b1 - 1)
+    if q_last < 0 or (slope == 0 and q_first > 0):
+        return
+    if slope:
+        # The first step with q >= q_first and the last one with q <= q_last
+        if q_first > 0:
+            first = max(first, -((d - 2 * d * q_first) // (2 * slope)))
+        last = min(last, -((d - 2 * d * (q_last + 1)) // (2 * slope)) - 1)
+    for t in range(first, last + 1):
+        q = (2 * t * slope + d) // (2 * d) if d else 0
+        (a, b) = (a1 + t - 1, b1 + sign * q - 1)
+        yield (b, a) if steep else (a, b)
+
+
+class ByteCanvas(Canvas):
+    """
+    Canvas keeping its points in a bytearray, row by row
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self._width = 0
+        self._height = 0
+        self.dirty: Optional[Tuple[int, int]] = None
+        # Ownership token of the points, shared with the clones until either side paints (see _writable())
+        self._owners = [1]
+
+    @property
+    def width(self) -> int:
+        """
+        Canvas width getter
+        """
+        return self._width
+
+    @property
+    def height(self) -> int:
+        """
+        Canvas height getter
+        """
+        return self._height
+
+    def create(self, width: int, height: int):
+        if width < 0 or height < 0:
+            raise ValueError('Canvas dimensions must not be negative')
+        data = bytearray([ASCII_WHITESPACE]) * (width * height)
+        self._unshare()
+        self.data = data
+        self._width = width
+        self._height = height
+        self._mark_dirty(0, height)
+
+    def created(self) -> bool:
+        return self._width * self._height != 0
+
+    def clear(self):
+        data = bytearray([ASCII_WHITESPACE]) * len(self.data)
+        self._unshare()
+        self.data = data
+        self._mark_dirty(0, self._height)
+
+    def to_string(self) -> str:
+        return self.to_bytes().decode('latin-1')
+
+    def to_bytes(self) -> bytes:
+        border = b'-' * (self._width + 2)
+        return border + b'\n' + self.rows_to_bytes(0, self._height) + border
+
+    def rows_to_bytes(self, top: int, bottom: int) -> bytes:
+        w = self._width
+        return b''.join(b'|' + self.data[y * w:(y + 1) * w] + b'|\n' for y in range(top, min(bottom, self._height)))
+
+    def take_dirty_rows(self) -> Tuple[int, int]:
+        """
+        Changes are always tracked, so this never returns None
+        :return: [top, bottom) range of the rows changed since the previous call, (0, 0) if nothing changed
+        """
+        dirty = self.dirty
+        self.dirty = None
+        return dirty if dirty is not None else (0, 0)
+
+    def clone(self) -> ByteCanvas:
+        # Nothing is copied up front: the points are copied by whichever canvas paints them first
+        twin = copy.copy(self)
+        twin.dirty = (0, self._height)
+        self._owners[0] += 1
+        return twin
+
+    def restore(self, backup: ByteCanvas):
+        # The clone isn't used anymore, its points are taken over along with its share of them
+        self._unshare()
+        (self.data, self._width, self._height, self._owners) = (backup.data, backup.width, backup.height,
+                                                                backup._owners)
+        backup._owners = [1]
+        self._mark_dirty(0, self._height)
+
+    def save(self, path: str, compression: int = 0):
+        # Snapshots go through NumPy, which is only imported when they are used
+        import numpy as np
+        import snapshot
+        data = np.frombuffer(bytes(self.data), dtype='uint8').reshape(self._height, self._width)
+        snapshot.save(path, data, compression)
+
+    def load(self, path: str):
+        import snapshot
+        data = snapshot.load(path)
+        points = bytearray(data.tobytes())
+        self._unshare()
+        self.data = points
+        (self._height, self._width) = data.shape
+        self._mark_dirty(0, self._height)
+
+    def draw(self, shape, *argv):
+        if shape == 'line':
+            return self.draw_line(*argv)
+        if shape == 'rect':
+            return self.draw_rect(*argv)
+
+    def draw_many(self, shape, coords):
+        # NumPy rows are turned into Python ints, which can't overflow in the arithmetic of the lines
+        rows = coords.tolist() if hasattr(coords, 'tolist') else coords
+        if shape not in ('line', 'rect'):
+            raise ValueError(f'Unknown shape {shape}')
+        # The whole batch is validated before anything is drawn, like the NumPy canvases do
+        if shape == 'rect' and any(x1 > x2 or y1 > y2 for (x1, y1, x2, y2) in rows):
+            raise ValueError('Rectangle must have a non-negative area, try again')
+        for row in rows:
+            self.draw(shape, *row)
+
+    def draw_line(self, *argv):
+        if len(argv) < 4:
+            return
+        (x1, y1, x2, y2) = argv[:4]
+        (h, w) = (self._height, self._width)
+        if y1 == y2:
+            left = max(min(x1, x2), 1) - 1
+            right = min(max(x1, x2), w)
+            if 0 < y1 <= h and left < right:
+                self._paint_row(y1 - 1, left, right, ASCII_X)
+                self._mark_dirty(y1 - 1, y1)
+        elif x1 == x2:
+            top = max(min(y1, y2), 1) - 1
+            bottom = min(max(y1, y2), h)
+            if 0 < x1 <= w and top < bottom:
+                self._paint_column(x1 - 1, top, bottom, ASCII_X)
+                self._mark_dirty(top, bottom)
+        else:
+            (cols, rows) = ([], [])
+            for (x, y) in line_points(x1, y1, x2, y2, w, h):
+                cols.append(x)
+                rows.append(y)
+            if rows:
+                self._paint_points(rows, cols, ASCII_X)
+                self._mark_dirty(min(rows), max(rows) + 1)
+
+    def draw_rect(self, *argv):
+        if len(argv) < 4:
+            return
+        (x1, y1, x2, y2) = argv[:4]
+        if x1 > x2 or y1 > y2:
+            raise ValueError('Rectangle must have a non-negative area, try again')
+        self.draw_line(x1, y1, x2, y1)
+        self.draw_line(x2, y1, x2, y2)
+        self.draw_line(x2, y2, x1, y2)
+        self.draw_line(x1, y2, x1, y1)
+
+    def fill(self, x: int, y: int, color: str):
+        (h, w) = (self._height, self._width)
+        if not (0 < x <= w and 0 < y <= h):
+            return
+        (x, y) = (x - 1, y - 1)
+        old = self.data[y * w + x]
+        new = ord(color)
+        if old == new:
+            return
+        self._flood(x, y, old, new)
+
+    def _flood(self, x: int, y: int, old_color: int, new_color: int):
+        """
+        Scanline flood fill with the same semantics as the other canvases: the area is made of the points
+        of either the old or the new color connected to the base point. Painting keeps points inside the area,
+        so the area mask is computed once, with bytes.translate(), and runs are found in it with find() and rfind()
+        """
+        (h, w) = (self._height, self._width)
+        table = bytes(1 if c in (old_color, new_color) else 0 for c in range(256))
+        inside = self.data.translate(table)
+        painted = set()
+        (top, bottom) = (y, y + 1)
+        stack = [(x, y)]
+        while stack:
+            (x, y) = stack.pop()
+            start = y * w
+            # Extent of the run containing the seed, the row ends standing in for the points outside the area
+            left = max(inside.rfind(0, start, start + x) + 1, start)
+            if left in painted:
+                continue
+            right = inside.find(0, start + x, start + w)
+            right = start + w if right < 0 else right
+            self._paint_row(y, left - start, right - start, new_color)
+            painted.add(left)
+            top = min(top, y)
+            bottom = max(bottom, y + 1)
+
+            for ny in (y - 1, y + 1):
+                if 0 <= ny < h:
+                    offset = (ny - y) * w
+                    stack.extend((s, ny) for s in _run_starts(inside, left + offset, right + offset, ny * w))
+        self._mark_dirty(top, bottom)
+
+    def _writable(self) -> bytearray:
+        """
+        The points, copied first if they are shared with a clone: the first canvas to paint copies them
+        and leaves the other one their sole owner
+        """
+        if self._owners[0] > 1:
+            self._owners[0] -= 1
+            self._owners = [1]
+            self.data = bytearray(self.data)
+        return self.data
+
+    def _unshare(self):
+        """
+        Leave the points to the canvases sharing them, before they are replaced as a whole
+        """
+        self._owners[0] -= 1
+        self._owners = [1]
+
+    def _paint_row(self, y: int, left: int, right: int, color: int):
+        """
+        Paint the [left, right) span of a row; the same primitives as the ones of canvas.GridCanvas
+        """
+        start = y * self._width
+        self._writable()[start + left:start + right] = bytes([color]) * (right - left)
+
+    def _paint_column(self, x: int, top: int, bottom: int, color: int):
+        """
+        Paint the [top, bottom) span of a column
+        """
+        w = self._width
+        # Points of a column are w bytes apart
+        self._writable()[top * w + x:(bottom - 1) * w + x + 1:w] = bytes([color]) * (bottom - top)
+
+    def _paint_points(self, rows: List[int], cols: List[int], color: int):
+        """
+        Paint scattered points, e.g. those of an inclined line
+        """
+        (data, w) = (self._writable(), self._width)
+        for (y, x) in zip(rows, cols):
+            data[y * w + x] = color
+
+    def _mark_dirty(self, top: int, bottom: int):
+        if top >= bottom:
+            return
+        if self.dirty is not None:
+            top = min(top, self.dirty[0])
+            bottom = max(bottom, self.dirty[1])
+        self.dirty = (top, bottom)
+
+
+def _run_starts(inside: bytes, left: int, right: int, row: int) -> List[int]:
+    """
+    Find the runs of points inside the area within a span of a row
+    :param inside: area mask, one byte per point
+    :param left: first point of the span, as an offset into the mask
+    :param right: point following the last one of the span
+    :param row: offset of the row start
+    :return: first point of every run, relative to the row start
+    """
+    starts = []
+    position = left
+    while position < right:
+        start = inside.find(1, position, right)
+        if start < 0:
+            break
+        starts.append(start - row)
+        end = inside.find(0, start, right)
+        if end < 0:
+            break
+        position = end
+    return starts
+
+
+class AdaptiveCanvas(Canvas):
+    """
+    Canvas choosing its storage on creation: a ByteCanvas up to a given area, another backend above it
+    """
+
+    def __init__(self, large: Optional[Callable[[], Canvas]] = None, threshold: int = SMALL_POINTS):
+        """
+        :param large: callable returning a new canvas for areas above the threshold, a dense NumPy canvas by default
+        :param threshold: largest area kept in a ByteCanvas
+        """
+        self.large = large if large is not None else _dense
+        self.threshold = threshold
+        self.canvas: Canvas = ByteCanvas()
+
+    @property
+    def width(self) -> int:
+        """
+        Canvas width getter
+        """
+        return self.canvas.width
+
+    @property
+    def height(self) -> int:
+        """
+        Canvas height getter
+        """
+        return self.canvas.height
+
+    def _select(self, points: int) -> Canvas:
+        """
+        Canvas with the storage suited to an area: the current one if it has that storage already, a new one
+        otherwise, which only replaces the current one once it holds the new drawing
+        """
+        small = points <= self.threshold
+        if small != isinstance(self.canvas, ByteCanvas):
+            return ByteCanvas() if small else self.large()
+        return self.canvas
+
+    def create(self, width: int, height: int):
+        canvas = self._select(width * height)
+        canvas.create(width, height)
+        self.canvas = canvas
+
+    def created(self) -> bool:
+        return self.canvas.created()
+
+    def clear(self):
+        self.canvas.clear()
+
+    def to_string(self) -> str:
+        return self.canvas.to_string()
+
+    def to_bytes(self) -> bytes:
+        return self.canvas.to_bytes()
+
+    def rows_to_bytes(self, top: int, bottom: int) -> bytes:
+        return self.canvas.rows_to_bytes(top, bottom)
+
+    def view_to_bytes(self, view) -> bytes:
+        return self.canvas.view_to_bytes(view)
+
+    def take_dirty_rows(self) -> Optional[Tuple[int, int]]:
+        return self.canvas.take_dirty_rows()
+
+    def draw(self, *argv):
+        return self.canvas.draw(*argv)
+
+    def draw_many(self, shape, coords):
+        return self.canvas.draw_many(shape, coords)
+
+    def undo(self):
+        self.canvas.undo()
+
+    def redo(self):
+        self.canvas.redo()
+
+    def clone(self) -> AdaptiveCanvas:
+        twin = copy.copy(self)
+        twin.canvas = self.canvas.clone()
+        return twin
+
+    def restore(self, backup: AdaptiveCanvas):
+        # The clone is marked dirty as a whole already
+        self.canvas = backup.canvas
+
+    def save(self, path: str, compression: int = 0):
+        self.canvas.save(path, compression)
+
+    def load(self, path: str):
+        import snapshot
+        with open(path, 'rb') as f:
+            (width, height, _) = snapshot.read_header(f)
+        canvas = self._select(width * height)
+        canvas.load(path)
+        self.canvas = canvas
+
+    def fill(self, x: int, y: int, color: str):
+        self.canvas.fill(x, y, color)
+
+
+def _dense() -> Canvas:
+    # NumPy is only imported once a large canvas is created
+    from canvas import MemoryLessCanvas
+    return MemoryLessCanvas()
@@ -0,0 +1,149 @@
+"""
+This module defines the binary file format canvases are stored in.
+
+A canvas file starts with a fixed-size header (format signature and version, payload compression, canvas
+dimensions) followed by the canvas points, one byte per point, row by row, optionally compressed
+with zlib or lzma. Uncompressed files can be memory-mapped as is.
+"""
+
+import lzma
+import os
+import struct
+import tempfile
+import zlib
+from typing import BinaryIO, Tuple
+import numpy as np
+
+MAGIC = b'CNVS'
+VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+
+COMPRESSIONS = {'none': COMPRESSION_NONE, 'zlib': COMPRESSION_ZLIB, 'lzma': COMPRESSION_LZMA}
+
+# File name extensions implying a compression method
+EXTENSIONS = {'.zz': COMPRESSION_ZLIB, '.zlib': COMPRESSION_ZLIB, '.xz': COMPRESSION_LZMA, '.lzma': COMPRESSION_LZMA}
+
+# Amount of the payload compressed or decompressed at once
+CHUNK = 2 ** 22
+
+# signature, version, compression, width, height
+HEADER = struct.Struct('<4sHHII')
+
+
+def pack_header(width: int, height: int, compression: int = COMPRESSION_NONE) -> bytes:
+    """
+    Build a canvas file header
+    :param width: canvas width
+    :param height: canvas height
+    :param compression: payload compression method
+    :return: the header bytes
+    """
+    if not (0 <= width < 2 ** 32 and 0 <= height < 2 ** 32):
+        raise ValueError('Canvas dimensions must be non-negative and below 2^32 to be stored')
+    return HEADER.pack(MAGIC, VERSION, compression, width, height)
+
+
+def read_header(f: BinaryIO) -> Tuple[int, int, int]:
+    """
+    Read and check a canvas file header; the file position is left at the beginning of the payload
+    :param f: binary file positioned at the beginning
+    :return: (width, height, compression)
+    """
+    raw = f.read(HEADER.size)
+    if len(raw) != HEADER.size:
+        raise ValueError('Not a canvas file: the header is truncated')
+    (magic, version, compression, width, height) = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError('Not a canvas file: wrong signature')
+    if version != VERSION:
+        raise ValueError(f'Unsupported canvas file version {version}')
+    return width, height, compression
+
+
+def compression_for(path: str) -> int:
+    """
+    Compression method implied by the extension of a file name, none by default
+    """
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), COMPRESSION_NONE)
+
+
+def _compressor(compression: int):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compressobj()
+    if compression == COMPRESSION_LZMA:
+        return lzma.LZMACompressor()
+    raise ValueError(f'Unknown compression method {compression}')
+
+
+def _decompressor(compression: int):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompressobj()
+    if compression == COMPRESSION_LZMA:
+        return lzma.LZMADecompressor()
+    raise ValueError(f'Unknown compression method {compression}')
+
+
+def save(path: str, data: np.array, compression: int = COMPRESSION_NONE):
+    """
+    Write a canvas file.
+    The file is written next to the target and moved in place once complete, so a snapshot being replaced
+    is never seen truncated, not even by a canvas still mapping it
+    :param path: canvas file
+    :param data: uint8 array of shape (height, width), the canvas points
+    :param compression: payload compression method
+    """
+    (height, width) = data.shape
+    data = np.ascontiguousarray(data, dtype='uint8')
+    compressor = None if compression == COMPRESSION_NONE else _compressor(compression)
+    (fd, temporary) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pack_header(width, height, compression))
+            if compressor is None:
+                f.write(memoryview(data.reshape(-1)))
+            else:
+                flat = data.reshape(-1)
+                for start in range(0, flat.size, CHUNK):
+                    f.write(compressor.compress(memoryview(flat[start:start + CHUNK])))
+                f.write(compressor.flush())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load(path: str) -> np.array:
+    """
+    Read a canvas file.
+    An uncompressed payload is not read but mapped copy-on-write: the points are paged in on first access
+    and changing them doesn't change the file. A compressed one is decompressed into a single buffer
+    :param path: canvas file
+    :return: uint8 array of shape (height, width), the canvas points
+    """
+    with open(path, 'rb') as f:
+        (width, height, compression) = read_header(f)
+        size = width * height
+        if compression == COMPRESSION_NONE:
+            if os.fstat(f.fileno()).st_size < HEADER.size + size:
+                raise ValueError('Not a canvas file: the payload is truncated')
+            if size == 0:
+                return np.zeros((height, width), dtype='uint8')
+            return np.memmap(f, dtype='uint8', mode='c', offset=HEADER.size, shape=(height, width))
+
+        decompressor = _decompressor(compression)
+        out = bytearray(size)
+        position = 0
+        try:
+            for chunk in iter(lambda: f.read(CHUNK), b''):
+                piece = decompressor.decompress(chunk)
+                out[position:position + len(piece)] = piece
+                position += len(piece)
+        except (zlib.error, lzma.LZMAError) as e:
+            raise ValueError(f'Not a canvas file: {e}')
+        if position != size:
+            raise ValueError('Not a canvas file: the payload size does not match the dimensions')
+        # The buffer is writable, so is the array
+        return np.frombuffer(out, dtype='uint8').reshape(height, width)
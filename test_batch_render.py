@@ -0,0 +1,104 @@
+"""
+Unit tests for batch_render module
+"""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+import batch_render
+from canvas import MemoryLessCanvas
+
+
+class BatchRenderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.scripts = os.path.join(self.dir.name, 'scripts')
+        os.mkdir(self.scripts)
+        self.write('a.txt', 'C 10 3\nL 1 2 10 2\nF\nB 1 1 o\n')
+        self.write('b.txt', 'C 4 2\nR 1 1 x 4\n\nL 1 1 4 1\nQ\nL 1 2 4 2\n')
+        self.write('c.txt', 'L 1 1 2 2\n')
+        self.write('notes.md', 'not a script\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        with open(os.path.join(self.scripts, name), 'w') as f:
+            f.write(text)
+
+    def run_main(self, *argv):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            code = batch_render.main(list(argv))
+        return code, stderr.getvalue()
+
+    def read_output(self, name):
+        with open(os.path.join(self.dir.name, 'out', name + batch_render.SUFFIX), 'rb') as f:
+            return f.read()
+
+    def test_directory_ok(self):
+        output = os.path.join(self.dir.name, 'out')
+        report = os.path.join(self.dir.name, 'report.json')
+        (code, summary) = self.run_main(self.scripts, '-o', output, '--pattern', '*.txt', '--workers', '2',
+                                        '--report', report)
+        self.assertEqual(code, 1)
+        self.assertIn('3 scripts rendered', summary)
+        self.assertIn('line 2: Arguments must be of type int', summary)
+
+        expected = MemoryLessCanvas()
+        expected.create(10, 3)
+        expected.draw_line(1, 2, 10, 2)
+        expected.fill(1, 1, 'o')
+        self.assertEqual(self.read_output('a.txt'), expected.to_bytes() + b'\n')
+        # Errors don't stop a script, the quit command does
+        self.assertEqual(self.read_output('b.txt'), b'------\n|xxxx|\n|    |\n------\n')
+        self.assertEqual(self.read_output('c.txt'), b'')
+
+        with open(report) as f:
+            results = json.load(f)['scripts']
+        self.assertEqual([os.path.basename(result['script']) for result in results], ['a.txt', 'b.txt', 'c.txt'])
+        self.assertEqual([result['commands'] for result in results], [3, 2, 0])
+        self.assertEqual([len(result['errors']) for result in results], [0, 1, 1])
+
+    def test_manifest_ok(self):
+        manifest = os.path.join(self.dir.name, 'manifest.txt')
+        with open(manifest, 'w') as f:
+            f.write('# nightly\nscripts/a.txt\n\nscripts/missing.txt\n')
+        output = os.path.join(self.dir.name, 'out')
+        (code, summary) = self.run_main(manifest, '-o', output, '--workers', '1')
+        self.assertEqual(code, 1)
+        self.assertIn('missing.txt', summary)
+        self.assertTrue(self.read_output('a.txt').startswith(b'------------\n|oooooooooo|'))
+
+    def test_malformed_scripts_ok(self):
+        with open(os.path.join(self.scripts, 'd.txt'), 'wb') as f:
+            f.write(b'C 4 2\n\xff\xfe 1 1\nB 1 1 \xe9\nL 1 1 4 1\n')
+        self.write('e.txt', 'C 4 2\nB 1 1 \u20ac\nL 1 2 4 2\n')
+        output = os.path.join(self.dir.name, 'out')
+        report = os.path.join(self.dir.name, 'report.json')
+        (code, summary) = self.run_main(self.scripts, '-o', output, '--pattern', '*.txt', '--workers', '2',
+                                        '--report', report)
+        self.assertEqual(code, 1)
+        self.assertIn('5 scripts rendered', summary)
+        # Every script is rendered, the malformed lines being reported alone
+        self.assertTrue(self.read_output('a.txt').startswith(b'------------\n|oooooooooo|'))
+        self.assertEqual(self.read_output('d.txt'), b'------\n|xxxx|\n|    |\n------\n')
+        self.assertEqual(self.read_output('e.txt'), b'------\n|    |\n|xxxx|\n------\n')
+        with open(report) as f:
+            results = {os.path.basename(result['script']): result for result in json.load(f)['scripts']}
+        self.assertEqual(results['d.txt']['errors'], ['line 2: Unknown command',
+                                                      'line 3: Color symbol must be a single byte character'])
+        self.assertEqual(results['e.txt']['errors'], ['line 2: Color symbol must be a single byte character'])
+        self.assertEqual(results['a.txt']['errors'], [])
+
+    def test_duplicate_names_throws(self):
+        scripts = [os.path.join(self.scripts, 'a.txt'), os.path.join(self.dir.name, 'a.txt')]
+        self.assertRaises(ValueError, batch_render.render_all, scripts, self.dir.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
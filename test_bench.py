@@ -0,0 +1,50 @@
+"""
+Unit tests for the bench package
+"""
+
+import unittest
+from bench import BENCHMARKS, compare, run
+from bench import scenes
+from canvas import MemoryLessCanvas
+
+
+class BenchTest(unittest.TestCase):
+    def test_spiral_is_one_corridor(self):
+        canvas = MemoryLessCanvas()
+        canvas.create(9, 9)
+        for segment in scenes.spiral(9):
+            canvas.draw('line', *segment)
+        canvas.fill(2, 2, 'o')
+        self.assertNotIn(' ', canvas.to_string())
+
+    def test_maze_is_one_corridor(self):
+        canvas = MemoryLessCanvas()
+        canvas.create(10, 10)
+        for segment in scenes.maze(10):
+            canvas.draw('line', *segment)
+        canvas.fill(1, 1, 'o')
+        self.assertNotIn(' ', canvas.to_string())
+
+    def test_run(self):
+        results = run(['dense', 'tiled'], list(BENCHMARKS), [10], repeat=1)
+        self.assertEqual(len(results['results']), 2 * len(BENCHMARKS))
+        for result in results['results']:
+            self.assertGreater(result['ops'], 0)
+            self.assertGreaterEqual(result['median'], result['best'])
+
+    def test_compare(self):
+        baseline = {'results': [
+            {'backend': 'dense', 'benchmark': 'fill_maze', 'size': 10, 'best': 1.0},
+            {'backend': 'dense', 'benchmark': 'to_string', 'size': 10, 'best': 1.0},
+        ]}
+        current = {'results': [
+            {'backend': 'dense', 'benchmark': 'fill_maze', 'size': 10, 'best': 1.05},
+            {'backend': 'dense', 'benchmark': 'to_string', 'size': 10, 'best': 1.5},
+            {'backend': 'tiled', 'benchmark': 'to_string', 'size': 10, 'best': 9.0},
+        ]}
+        regressions = compare(baseline, current, threshold=0.1)
+        self.assertEqual([(r['benchmark'], r['ratio']) for r in regressions], [('to_string', 1.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,17 @@
 Unit tests for canvas module
 """
 
+import os
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np
 
-from canvas import MemoryLessCanvas as Canvas
+import canvas as canvas_module
+from canvas import MemoryLessCanvas as Canvas, MappedCanvas, TiledCanvas, RunLengthCanvas
+from history import History
+from primitives import NotUndoableError
+from small import ByteCanvas
 
 
 class CanvasTest(unittest.TestCase):
@@ -15,6 +22,18 @@ class CanvasTest(unittest.TestCase):
         self.assertEqual(canvas.width, 20)
         self.assertEqual(canvas.height, 10)
 
+    def test_to_string_ok(self):
+        canvas = Canvas()
+        canvas.create(4, 2)
+        canvas.draw_line(2, 1, 3, 1)
+        canvas.fill(1, 2, 'o')
+        expected = '------\n' \
+                   '|oxxo|\n' \
+                   '|oooo|\n' \
+                   '------'
+        self.assertEqual(canvas.to_string(), expected)
+        self.assertEqual(canvas.to_bytes(), expected.encode())
+
     def test_drawline_horizontal_ok(self):
         canvas = Canvas()
         canvas.create(8, 4)
@@ -48,10 +67,42 @@ class CanvasTest(unittest.TestCase):
         canvas2.draw_line(5, 3, 5, 1)
         self.assertTrue((canvas.data == canvas2.data).all())
 
-    def test_drawline_inclined_throws(self):
+    def test_drawline_inclined_ok(self):
         canvas = Canvas()
         canvas.create(8, 4)
-        self.assertRaises(ValueError, canvas.draw_line, 1, 2, 6, 4)
+        canvas.draw_line(1, 2, 6, 4)
+        expected = np.asarray([
+            [ 32,  32,  32,  32,  32,  32,  32,  32],
+            [120, 120,  32,  32,  32,  32,  32,  32],
+            [ 32,  32, 120, 120,  32,  32,  32,  32],
+            [ 32,  32,  32,  32, 120, 120,  32,  32]
+        ], dtype='uint8')
+        self.assertTrue((canvas.data == expected).all())
+
+        # The same points are drawn whichever end the line starts from
+        canvas2 = Canvas()
+        canvas2.create(8, 4)
+        canvas2.draw_line(6, 4, 1, 2)
+        self.assertTrue((canvas.data == canvas2.data).all())
+
+    def test_drawline_inclined_cropped_ok(self):
+        canvas = Canvas()
+        canvas.create(8, 4)
+        canvas.draw_line(-2, 7, 5, 0)
+        expected = np.asarray([
+            [ 32,  32,  32, 120,  32,  32,  32,  32],
+            [ 32,  32, 120,  32,  32,  32,  32,  32],
+            [ 32, 120,  32,  32,  32,  32,  32,  32],
+            [120,  32,  32,  32,  32,  32,  32,  32]
+        ], dtype='uint8')
+        self.assertTrue((canvas.data == expected).all())
+        self.assertEqual(canvas.take_dirty_rows(), (0, 4))
+
+        # Only the visible part of a line is rasterized, however long it is
+        canvas.clear()
+        canvas.draw_line(-10 ** 15, -10 ** 15 + 1, 10 ** 15, 10 ** 15 + 1)
+        canvas.draw_line(10 ** 30, 10 ** 30, 10 ** 30 + 1, 10 ** 30 + 5)
+        self.assertEqual(list(zip(*np.nonzero(canvas.data == 120))), [(1, 0), (2, 1), (3, 2)])
 
     def test_drawline_horizontal_cropped_ok(self):
         canvas = Canvas()
@@ -121,6 +172,56 @@ class CanvasTest(unittest.TestCase):
         ], dtype='uint8')
         self.assertTrue((canvas.data == expected).all())
 
+    def test_drawmany_lines_ok(self):
+        segments = [(2, 2, 6, 2), (5, -3, 5, 14), (-2, 4, 10, 4), (9, 9, 12, 9)]
+        canvas = Canvas()
+        canvas.create(8, 5)
+        for segment in segments:
+            canvas.draw_line(*segment)
+        canvas2 = Canvas()
+        canvas2.create(8, 5)
+        canvas2.draw_many('line', np.asarray(segments))
+        self.assertTrue((canvas.data == canvas2.data).all())
+
+    def test_drawmany_dense_lines_ok(self):
+        canvas = Canvas()
+        canvas.create(6, 4)
+        canvas.draw_many('line', [(1, y, 6, y) for y in range(1, 5)] + [(3, 1, 3, 4)])
+        self.assertTrue((canvas.data == 120).all())
+
+    def test_drawmany_rects_ok(self):
+        rects = [(2, 2, 6, 4), (-4, -3, 6, 4), (3, 1, 3, 5)]
+        canvas = Canvas()
+        canvas.create(8, 5)
+        for rect in rects:
+            canvas.draw_rect(*rect)
+        canvas2 = Canvas()
+        canvas2.create(8, 5)
+        canvas2.draw_many('rect', rects)
+        self.assertTrue((canvas.data == canvas2.data).all())
+
+    def test_drawmany_inclined_lines_ok(self):
+        lines = [(1, 1, 8, 5), (8, 1, 1, 5), (2, 5, 3, -4), (4, 2, 4, 4), (-3, 3, 20, 3), (7, 0, 12, 9)]
+        for (width, height) in ((8, 5), (30, 20)):
+            canvas = Canvas(History())
+            canvas.create(width, height)
+            for line in lines:
+                canvas.draw_line(*line)
+            canvas2 = Canvas(History())
+            canvas2.create(width, height)
+            canvas2.draw_many('line', lines)
+            self.assertTrue((canvas.data == canvas2.data).all())
+            canvas2.undo()
+            self.assertTrue((canvas2.data == 32).all())
+
+    def test_drawmany_invalid_throws(self):
+        canvas = Canvas()
+        canvas.create(8, 5)
+        self.assertRaises(ValueError, canvas.draw_many, 'rect', [(1, 1, 4, 2), (6, 4, 1, 2)])
+        self.assertRaises(ValueError, canvas.draw_many, 'ellipse', [(1, 1, 4, 2)])
+        # Nothing is drawn if the batch is invalid
+        self.assertTrue((canvas.data == 32).all())
+
     def test_fill_ok(self):
         canvas = Canvas()
         canvas.create(10, 8)
@@ -173,6 +274,372 @@ class CanvasTest(unittest.TestCase):
         ], dtype='uint8')
         self.assertTrue((canvas.data == expected).all())
 
+    def test_dirty_rows_ok(self):
+        canvas = Canvas()
+        canvas.create(10, 8)
+        self.assertEqual(canvas.take_dirty_rows(), (0, 8))
+        self.assertEqual(canvas.take_dirty_rows(), (0, 0))
+
+        canvas.draw_line(2, 3, 6, 3)
+        canvas.draw_line(4, 5, 4, 6)
+        self.assertEqual(canvas.take_dirty_rows(), (2, 6))
+
+        canvas.draw_rect(6, 5, 9, 7)
+        canvas.fill(7, 6, 'o')
+        self.assertEqual(canvas.take_dirty_rows(), (4, 7))
+
+        canvas.draw_many('line', [(1, 8, 1, 8), (20, 1, 20, 8)])
+        self.assertEqual(canvas.take_dirty_rows(), (7, 8))
+
+    def test_fill_large_area_ok(self):
+        # Areas way beyond the recursion limit must be filled without errors
+        canvas = Canvas()
+        canvas.create(1000, 1000)
+        canvas.draw_line(500, 1, 500, 999)
+        expected = np.where(canvas.data == 32, 111, canvas.data)
+        canvas.fill(1, 1, 'o')
+        self.assertTrue((canvas.data == expected).all())
+
+    def test_fill_spiral_ok(self):
+        canvas = Canvas()
+        canvas.create(21, 21)
+        for i in range(0, 10, 2):
+            canvas.draw_line(1 + i, 1 + i, 21 - i, 1 + i)
+            canvas.draw_line(21 - i, 1 + i, 21 - i, 21 - i)
+            canvas.draw_line(21 - i, 21 - i, 3 + i, 21 - i)
+            canvas.draw_line(3 + i, 21 - i, 3 + i, 3 + i)
+        expected = np.where(canvas.data == 32, 111, canvas.data)
+        canvas.fill(2, 21, 'o')
+        self.assertTrue((canvas.data == expected).all())
+
+    def test_fill_maze_ok(self):
+        # A comb of walls makes a fill snake through every column, one run per row and column
+        canvas = Canvas()
+        canvas.create(200, 100)
+        for x in range(2, 201, 2):
+            canvas.draw_line(x, 1 if x % 4 == 2 else 2, x, 99 if x % 4 == 2 else 100)
+        expected = np.where(canvas.data == 32, 111, canvas.data)
+        canvas.fill(1, 1, 'o')
+        self.assertTrue((canvas.data == expected).all())
+        self.assertEqual(canvas.take_dirty_rows(), (0, 100))
+
+    def test_fill_by_bands_ok(self):
+        # Fragmented areas are labeled band by band: the result must not depend on the bands
+        rng = np.random.default_rng(3)
+        with mock.patch.object(canvas_module, 'SCANLINE_RUNS_PER_ROW', 0), \
+                mock.patch.object(canvas_module, 'FILL_BAND', 40):
+            for _ in range(30):
+                grid = np.where(rng.random((17, 13)) < 0.4, 120, 32).astype('uint8')
+                (x, y) = rng.integers(1, 14), rng.integers(1, 18)
+                canvas = Canvas(History())
+                reference = ByteCanvas()
+                canvas.create(13, 17)
+                canvas.data[:] = grid
+                canvas.take_dirty_rows()
+                reference.create(13, 17)
+                reference.data[:] = grid.tobytes()
+                canvas.fill(x, y, 'o')
+                reference.fill(x, y, 'o')
+                self.assertEqual(canvas.to_bytes(), reference.to_bytes())
+                canvas.undo()
+                self.assertTrue((canvas.data == grid).all())
+
+    def test_fill_through_new_color_ok(self):
+        # Points of the new color connect the points of the old color they touch
+        canvas = Canvas()
+        canvas.create(5, 3)
+        canvas.draw_line(3, 1, 3, 3)
+        canvas.fill(3, 2, 'o')
+        canvas.fill(1, 1, 'o')
+        self.assertTrue((canvas.data == 111).all())
+
+
+class HistoryTest(unittest.TestCase):
+    def test_undo_redo_ok(self):
+        canvas = Canvas(History())
+        canvas.create(10, 8)
+        states = [canvas.to_array()]
+        operations = [
+            lambda: canvas.draw_line(2, 4, 9, 4),
+            lambda: canvas.draw_rect(3, 2, 8, 20),
+            lambda: canvas.fill(5, 3, '+'),
+            lambda: canvas.fill(10, 8, '.'),
+            lambda: canvas.draw_many('line', [(1, 1, 10, 1), (1, 1, 1, 8)]),
+            lambda: canvas.clear(),
+        ]
+        for operation in operations:
+            operation()
+            states.append(canvas.to_array())
+
+        for state in reversed(states[:-1]):
+            canvas.undo()
+            self.assertTrue((canvas.data == state).all())
+        for state in states[1:]:
+            canvas.redo()
+            self.assertTrue((canvas.data == state).all())
+        self.assertRaises(ValueError, canvas.redo)
+
+        # A new change drops whatever could be redone
+        canvas.undo()
+        canvas.fill(1, 1, 'o')
+        self.assertRaises(ValueError, canvas.redo)
+
+    def test_undo_create_ok(self):
+        canvas = Canvas(History())
+        canvas.create(10, 8)
+        canvas.create(4, 3)
+        canvas.undo()
+        self.assertEqual((canvas.width, canvas.height), (10, 8))
+        canvas.undo()
+        self.assertFalse(canvas.created())
+        self.assertRaises(ValueError, canvas.undo)
+        canvas.redo()
+        self.assertEqual((canvas.width, canvas.height), (10, 8))
+
+    def test_deltas_are_compact(self):
+        history = History()
+        canvas = Canvas(history)
+        canvas.create(5000, 5000)
+        canvas.draw_line(7, 7, 7, 7)
+        self.assertLess(history.done[-1].nbytes, 16)
+        canvas.undo()
+        self.assertEqual(canvas.data[6, 6], 32)
+
+    def test_budget_evicts_oldest(self):
+        history = History(budget=100)
+        canvas = Canvas(history)
+        canvas.create(100, 100)
+        for y in range(1, 11):
+            canvas.draw_line(1, y, 5, y)
+        self.assertLessEqual(history.nbytes, 100)
+        while history.done:
+            canvas.undo()
+        # The oldest lines can't be undone anymore
+        self.assertEqual(canvas.data[0, 0], 120)
+        self.assertEqual(canvas.data[9, 0], 32)
+
+    def test_oversized_change_keeps_history(self):
+        history = History(budget=100)
+        canvas = Canvas(history)
+        canvas.create(20, 20)
+        canvas.draw_line(1, 1, 5, 1)
+        canvas.draw_line(1, 2, 5, 2)
+        # Changes every point, far more than the budget
+        self.assertRaises(NotUndoableError, canvas.fill, 10, 10, 'o')
+        self.assertEqual(canvas.data[19, 19], ord('o'))
+        # The creation and both lines are still there
+        self.assertEqual(len(history.done), 3)
+        canvas.undo()
+        canvas.undo()
+        self.assertTrue((canvas.data[:2, :5] == 32).all())
+        self.assertEqual(canvas.data[19, 19], ord('o'))
+        canvas.undo()
+        self.assertFalse(canvas.created())
+
+    def test_no_history_throws(self):
+        canvas = Canvas()
+        canvas.create(10, 8)
+        self.assertRaises(ValueError, canvas.undo)
+        self.assertRaises(ValueError, TiledCanvas().redo)
+
+
+class MappedCanvasTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'canvas.bin')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_persistence_ok(self):
+        canvas = MappedCanvas(self.path)
+        self.assertFalse(canvas.created())
+        canvas.create(10, 8)
+        canvas.draw_rect(2, 2, 6, 5)
+        canvas.fill(3, 3, 'o')
+        expected = canvas.to_string()
+        canvas.close()
+
+        reopened = MappedCanvas(self.path)
+        self.assertEqual(reopened.to_string(), expected)
+        self.assertIsInstance(reopened.data, np.memmap)
+
+        reopened.clear()
+        reopened.flush()
+        self.assertTrue((MappedCanvas(self.path).data == 32).all())
+
+    def test_not_a_canvas_file_throws(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'definitely not a canvas')
+        self.assertRaises(ValueError, MappedCanvas, self.path)
+
+    def test_invalid_size_keeps_file(self):
+        canvas = MappedCanvas(self.path)
+        canvas.create(4, 2)
+        canvas.draw_line(1, 1, 4, 1)
+        expected = canvas.to_string()
+        self.assertRaises(ValueError, canvas.create, -3, 4)
+        self.assertRaises(ValueError, canvas.create, 5, 2 ** 32)
+        self.assertEqual(canvas.to_string(), expected)
+        canvas.close()
+        self.assertEqual(MappedCanvas(self.path).to_string(), expected)
+        self.assertEqual(os.listdir(self.dir.name), ['canvas.bin'])
+
+
+class TiledCanvasTest(unittest.TestCase):
+    def draw_scene(self, canvas):
+        canvas.create(30, 20)
+        canvas.draw_line(2, 4, 29, 4)
+        canvas.draw_line(7, -3, 7, 40)
+        canvas.draw_line(-5, 30, 40, 1)
+        canvas.draw_line(14, 3, 17, 19)
+        canvas.draw_rect(3, 2, 12, 15)
+        canvas.draw_rect(15, 6, 25, 18)
+        canvas.fill(5, 5, 'o')
+        canvas.fill(20, 10, '+')
+        canvas.fill(30, 20, '.')
+        canvas.fill(7, 10, '*')
+
+    def test_same_as_dense_ok(self):
+        canvas = Canvas()
+        self.draw_scene(canvas)
+        for tile_size in (1, 4, 7, 64):
+            tiled = TiledCanvas(tile_size)
+            self.draw_scene(tiled)
+            self.assertTrue((tiled.to_array() == canvas.data).all())
+            self.assertEqual(tiled.to_string(), canvas.to_string())
+
+    def test_memory_follows_drawn_area(self):
+        canvas = TiledCanvas(tile_size=16)
+        canvas.create(100000, 100000)
+        self.assertEqual(len(canvas.tiles), 0)
+        canvas.draw_line(1, 1, 160, 1)
+        canvas.draw_line(100000, 1, 100000, 32)
+        self.assertEqual(len(canvas.tiles), 12)
+        self.assertEqual(canvas._point(99999, 31), 120)
+        self.assertEqual(canvas._point(99999, 32), 32)
+
+    def test_fill_uniform_tiles_ok(self):
+        canvas = TiledCanvas(tile_size=16)
+        canvas.create(100, 100)
+        canvas.draw_rect(1, 1, 50, 50)
+        canvas.fill(80, 80, 'o')
+        # Tiles away from the rectangle are repainted as a whole without being allocated
+        self.assertEqual(canvas.tiles[(6, 6)], ord('o'))
+        expected = np.full((100, 100), ord('o'), dtype='uint8')
+        expected[:50, :50] = 32
+        expected[0, :50] = expected[49, :50] = expected[:50, 0] = expected[:50, 49] = 120
+        self.assertTrue((canvas.to_array() == expected).all())
+
+
+class RunLengthCanvasTest(unittest.TestCase):
+    def test_same_as_dense_ok(self):
+        canvas = Canvas()
+        TiledCanvasTest.draw_scene(self, canvas)
+        rle = RunLengthCanvas()
+        TiledCanvasTest.draw_scene(self, rle)
+        self.assertTrue((rle.to_array() == canvas.data).all())
+        self.assertEqual(rle.to_string(), canvas.to_string())
+        self.assertEqual(rle.rows_to_bytes(3, 9), canvas.rows_to_bytes(3, 9))
+
+    def test_memory_follows_runs(self):
+        canvas = RunLengthCanvas()
+        canvas.create(100000, 100000)
+        self.assertEqual(canvas.runs(), 0)
+        canvas.draw_line(1, 1, 50000, 1)
+        canvas.draw_line(40000, 1, 100000, 1)
+        self.assertEqual(canvas.rows[0], ([100000], [120]))
+        canvas.draw_line(5, 1, 5, 3)
+        self.assertEqual(canvas.rows[1], ([4, 5, 100000], [32, 120, 32]))
+        self.assertEqual(canvas.runs(), 7)
+        self.assertEqual(canvas._point(4, 2), 120)
+        self.assertEqual(canvas._point(4, 3), 32)
+
+    def test_fill_splices_runs(self):
+        canvas = RunLengthCanvas()
+        canvas.create(20, 5)
+        canvas.draw_rect(5, 1, 10, 4)
+        canvas.fill(1, 1, 'o')
+        self.assertEqual(canvas.rows[1], ([4, 5, 9, 10, 20], [111, 120, 32, 120, 111]))
+        canvas.fill(7, 2, 'o')
+        self.assertEqual(canvas.rows[1], ([4, 5, 9, 10, 20], [111, 120, 111, 120, 111]))
+        # Runs painted over are merged into a single one, blank rows are dropped
+        canvas.draw_line(1, 2, 20, 2)
+        self.assertEqual(canvas.rows[1], ([20], [120]))
+        canvas.fill(1, 2, ' ')
+        self.assertIsNone(canvas.rows[1])
+
+
+class CloneTest(unittest.TestCase):
+    def test_clones_are_independent(self):
+        for factory in (Canvas, lambda: Canvas(History()), lambda: TiledCanvas(tile_size=4), RunLengthCanvas):
+            canvas = factory()
+            canvas.create(12, 6)
+            canvas.draw_rect(2, 2, 8, 5)
+            expected = canvas.to_string()
+            twin = canvas.clone()
+            self.assertIs(type(twin), type(canvas))
+            self.assertEqual(twin.take_dirty_rows(), (0, 6))
+            twin.fill(3, 3, 'o')
+            self.assertEqual(canvas.to_string(), expected)
+            canvas.draw_line(1, 1, 12, 1)
+            self.assertEqual(twin.to_string().count('o'), 10)
+            self.assertEqual(twin.to_string().count('x'), 18)
+
+    def test_storage_is_shared_until_painted(self):
+        canvas = Canvas()
+        canvas.create(10, 10)
+        data = canvas.data
+        twin = canvas.clone()
+        self.assertIs(twin.data, canvas.data)
+        twin.draw_line(1, 1, 1, 10)
+        self.assertIsNot(twin.data, canvas.data)
+        self.assertTrue((canvas.data == 32).all())
+        # Only the first canvas to paint copies the grid, the other one paints it in place
+        canvas.draw_line(2, 1, 2, 10)
+        self.assertIs(canvas.data, data)
+        self.assertEqual(twin.data[:, 1].tolist(), [32] * 10)
+        # Restoring takes the grid of the clone over
+        backup = canvas.clone()
+        canvas.draw_line(3, 1, 3, 10)
+        self.assertIs(backup.data, data)
+        canvas.restore(backup)
+        self.assertIs(canvas.data, data)
+        self.assertEqual(canvas.data[:, 2].tolist(), [32] * 10)
+        canvas.draw_line(4, 1, 4, 10)
+        self.assertIs(canvas.data, data)
+
+        canvas = TiledCanvas(tile_size=4)
+        canvas.create(16, 16)
+        canvas.draw_line(1, 1, 16, 1)
+        canvas.draw_line(1, 5, 16, 5)
+        twin = canvas.clone()
+        twin.draw_line(1, 2, 4, 2)
+        # Only the painted tile is copied
+        self.assertIsNot(twin.tiles[(0, 0)], canvas.tiles[(0, 0)])
+        self.assertIs(twin.tiles[(1, 3)], canvas.tiles[(1, 3)])
+
+        canvas = RunLengthCanvas()
+        canvas.create(16, 16)
+        canvas.draw_line(1, 1, 1, 16)
+        twin = canvas.clone()
+        twin.draw_line(2, 1, 10, 1)
+        self.assertIsNot(twin.rows[0], canvas.rows[0])
+        self.assertIs(twin.rows[1], canvas.rows[1])
+        self.assertEqual(canvas.rows[0], ([1, 16], [120, 32]))
+
+    def test_history_is_not_shared(self):
+        canvas = Canvas(History())
+        canvas.create(5, 5)
+        canvas.draw_line(1, 1, 5, 1)
+        twin = canvas.clone()
+        self.assertRaises(ValueError, twin.undo)
+        twin.draw_line(1, 2, 5, 2)
+        twin.undo()
+        canvas.undo()
+        self.assertEqual(twin.data[0].tolist(), [120] * 5)
+        self.assertTrue((canvas.data == 32).all())
+
 
 if __name__ == '__main__':
     t = CanvasTest()
@@ -2,10 +2,17 @@
 Unit tests for canvas module
 """
 
+import asyncio
+import os
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np
-from command_executor import SyncCommandExecutor as Executor
-from canvas import MemoryLessCanvas as Canvas
+from command_executor import SyncCommandExecutor as Executor, AsyncCommandExecutor, navigate
+from command_parser import compile_script, parse
+from canvas import MemoryLessCanvas as Canvas, TiledCanvas, RunLengthCanvas
+from small import ByteCanvas
+from history import History
 from primitives import Command
 
 
@@ -85,6 +92,155 @@ class CommandExecutorTest(unittest.TestCase):
         command = Command(Command.Keyword.FILL, 1, 'str', 'o')
         self.assertRaises(TypeError, executor.execute, canvas, command)
 
+    def test_execute_save_load_ok(self):
+        executor = Executor()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'canvas.zz')
+            canvas = Canvas()
+            self.assertRaises(ValueError, executor.execute, canvas, Command(Command.Keyword.SAVE, path))
+            canvas.create(8, 4)
+            canvas.draw_line(1, 2, 8, 2)
+            executor.execute(canvas, Command(Command.Keyword.SAVE, path))
+            loaded = Canvas()
+            executor.execute(loaded, Command(Command.Keyword.LOAD, path))
+            self.assertEqual(loaded.to_string(), canvas.to_string())
+            self.assertRaises(ValueError, executor.execute, loaded,
+                              Command(Command.Keyword.LOAD, os.path.join(directory, 'missing.bin')))
+
+    def test_navigate_ok(self):
+        view = navigate(None, Command(Command.Keyword.PAN, 5, 3))
+        self.assertEqual((view.left, view.top, view.zoom), (5, 3, 1))
+        self.assertIs(navigate(view, Command(Command.Keyword.ZOOM, 2)), view)
+        self.assertEqual(view.zoom, 2)
+        self.assertRaises(ValueError, navigate, view, Command(Command.Keyword.ZOOM, 0))
+        self.assertRaises(ValueError, navigate, view, Command(Command.Keyword.PAN, 1))
+
+    def test_execute_many_ok(self):
+        script = ['C 20 6', 'L 1 1 20 6', 'L 1 6 20 1', 'R 3 2 9 5', 'R 12 2 18 5', 'B 5 3 o', 'L 1 3 20 3']
+        for canvas in (Canvas(), TiledCanvas(4), RunLengthCanvas(), ByteCanvas()):
+            expected = Canvas()
+            for line in script:
+                Executor().execute(expected, parse(line))
+            self.assertEqual(Executor().execute_many(canvas, compile_script(script)), len(script))
+            self.assertEqual(canvas.to_string(), expected.to_string())
+        # Commands are accepted as well, with their arguments in text form
+        canvas = Canvas()
+        commands = [Command(Command.Keyword.CREATE, '5', 2), Command(Command.Keyword.FILL, 1, 1, '.')]
+        self.assertEqual(Executor().execute_many(canvas, commands), 2)
+        self.assertEqual(canvas.to_string(), '-------\n|.....|\n|.....|\n-------')
+        self.assertEqual(Executor().execute_many(canvas, []), 0)
+
+    def test_execute_many_invalid_throws(self):
+        executor = Executor()
+        canvas = Canvas()
+        canvas.create(6, 3)
+        canvas.draw_line(1, 2, 6, 2)
+        before = canvas.to_string()
+        batches = [(['L 1 1 6 1', 'R 4 1 2 3'], 'command 2: Rectangle'),
+                   (['L 1 1 6 1', 'C 0 4', 'L 1 1 3 1'], 'command 3: Canvas must first be created'),
+                   (['C -1 4'], 'command 1: Canvas dimensions'),
+                   (['L 1 1 6 1', 'U'], 'command 2: undo commands cannot be batched')]
+        for (script, message) in batches:
+            with self.assertRaises(ValueError) as error:
+                executor.execute_many(canvas, compile_script(script))
+            self.assertTrue(str(error.exception).startswith(message), str(error.exception))
+        with self.assertRaises(TypeError) as error:
+            executor.execute_many(canvas, [Command(Command.Keyword.LINE, 1, 1, 'x', 1)])
+        self.assertTrue(str(error.exception).startswith('command 1'))
+        self.assertRaises(ValueError, executor.execute_many, canvas, [Command(Command.Keyword.FILL, 1, 1, 'ab')])
+        self.assertRaises(ValueError, executor.execute_many, canvas, [Command(Command.Keyword.SAVE, 'a.bin')])
+        self.assertRaises(ValueError, executor.execute_many, Canvas(), compile_script(['L 1 1 2 2']))
+        self.assertEqual(canvas.to_string(), before)
+
+    def test_execute_many_rolls_back(self):
+        for canvas in (Canvas(), TiledCanvas(4), RunLengthCanvas(), ByteCanvas()):
+            canvas.create(6, 3)
+            canvas.draw('line', 1, 2, 6, 2)
+            before = canvas.to_string()
+            with mock.patch.object(canvas, 'fill', side_effect=RuntimeError('out of luck')):
+                self.assertRaises(RuntimeError, Executor().execute_many, canvas,
+                                  compile_script(['L 1 1 6 3', 'C 10 10', 'R 1 1 5 5', 'B 3 3 o']))
+            self.assertEqual(canvas.to_string(), before)
+            # The canvas is still usable, its clone being gone
+            canvas.fill(1, 1, '.')
+            self.assertEqual(canvas.to_string().count('.'), 6)
+
+    def test_execute_many_rolls_back_history(self):
+        history = History()
+        canvas = Canvas(history)
+        canvas.create(6, 3)
+        canvas.draw('line', 1, 2, 6, 2)
+        canvas.undo()
+        before = canvas.to_string()
+        with mock.patch.object(canvas, 'fill', side_effect=MemoryError):
+            self.assertRaises(MemoryError, Executor().execute_many, canvas,
+                              compile_script(['L 1 1 5 1', 'R 1 1 3 3', 'B 3 3 o']))
+        self.assertEqual(canvas.to_string(), before)
+        # Nothing of the batch is left to undo and the undone line can still be redone
+        self.assertEqual(len(history.done), 1)
+        canvas.redo()
+        self.assertEqual(canvas.data[1].tolist(), [120] * 6)
+        canvas.undo()
+        canvas.undo()
+        self.assertFalse(canvas.created())
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.frames = []
+        self.viewport = None
+
+    def render(self, canvas):
+        if self.viewport is not None:
+            self.frames.append(canvas.view_to_bytes(self.viewport).decode())
+        else:
+            self.frames.append(canvas.to_string())
+
+
+async def stream(commands):
+    for command in commands:
+        yield command
+
+
+class AsyncCommandExecutorTest(unittest.TestCase):
+    def test_run_ok(self):
+        canvas = Canvas()
+        writer = RecordingWriter()
+        errors = []
+        commands = [
+            Command(Command.Keyword.CREATE, 8, 4),
+            Command(Command.Keyword.LINE, 1, 2, 8, 2),
+            Command(Command.Keyword.RECT, 6, 4, 1, 2),
+            Command(Command.Keyword.FILL, 1, 1, 'o'),
+            Command(Command.Keyword.QUIT),
+            Command(Command.Keyword.FILL, 1, 4, '*'),
+        ]
+        asyncio.run(AsyncCommandExecutor().run(canvas, stream(commands), writer, errors.append))
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(1 <= len(writer.frames) <= 3)
+        # The last frame always shows the final state
+        self.assertEqual(writer.frames[-1], canvas.to_string())
+        self.assertEqual(chr(canvas.data[0][0]), 'o')
+        self.assertEqual(chr(canvas.data[3][0]), ' ')
+
+    def test_run_moves_viewport(self):
+        canvas = Canvas()
+        writer = RecordingWriter()
+        commands = [
+            Command(Command.Keyword.CREATE, 8, 4),
+            Command(Command.Keyword.LINE, 1, 2, 8, 2),
+            Command(Command.Keyword.ZOOM, 4),
+        ]
+        asyncio.run(AsyncCommandExecutor().run(canvas, stream(commands), writer))
+        self.assertEqual(writer.viewport.zoom, 4)
+        self.assertEqual(writer.frames[-1], '----\n|xx|\n----')
+
+    def test_run_nothing_to_render(self):
+        writer = RecordingWriter()
+        commands = [Command(Command.Keyword.FLUSH)]
+        asyncio.run(AsyncCommandExecutor().run(Canvas(), stream(commands), writer))
+        self.assertEqual(writer.frames, [])
+
 
 if __name__ == '__main__':
     t = CommandExecutorTest()
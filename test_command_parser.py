@@ -0,0 +1,72 @@
+"""
+Unit tests for command_parser module
+"""
+
+import unittest
+from command_parser import parse, compile_script, iter_commands, format_command
+from primitives import Command
+
+
+class CommandParserTest(unittest.TestCase):
+    def test_parse_ok(self):
+        command = parse('l 1 4 10 4')
+        self.assertEqual(command.keyword, Command.Keyword.LINE)
+        self.assertEqual(command.args, [1, 4, 10, 4])
+        command = parse('B 2 3 o')
+        self.assertEqual(command.keyword, Command.Keyword.FILL)
+        self.assertEqual(command.args, [2, 3, 'o'])
+        self.assertEqual(parse('Q').keyword, Command.Keyword.QUIT)
+        command = parse('p -10 5')
+        self.assertEqual(command.keyword, Command.Keyword.PAN)
+        self.assertEqual(command.args, [-10, 5])
+        self.assertEqual(parse('Z 4').args, [4])
+
+    def test_parse_unknown(self):
+        self.assertEqual(parse('').keyword, Command.Keyword.UNKNOWN)
+        self.assertEqual(parse('X 1 2').keyword, Command.Keyword.UNKNOWN)
+
+    def test_parse_wrong_args_num_throws(self):
+        self.assertRaises(ValueError, parse, 'C 10')
+        self.assertRaises(ValueError, parse, 'B 1 2')
+
+    def test_parse_wrong_types_throws(self):
+        self.assertRaises(TypeError, parse, 'C str 10')
+        self.assertRaises(TypeError, parse, 'R 1 4 10 str')
+        self.assertRaises(ValueError, parse, 'B 1 2 oo')
+
+    def test_parse_wide_color_throws(self):
+        # Both parsers reject colors which don't fit in a point
+        message = 'Color symbol must be a single byte character'
+        with self.assertRaisesRegex(ValueError, message):
+            parse('B 1 2 \u20ac')
+        with self.assertRaisesRegex(ValueError, f'line 2: {message}'):
+            compile_script(['C 20 4', 'B 1 2 \u20ac'])
+        self.assertEqual(parse('B 1 2 \xe9').args, [1, 2, '\xe9'])
+
+    def test_parse_path_ok(self):
+        command = parse('S  drawings/my canvas.bin \n')
+        self.assertEqual(command.keyword, Command.Keyword.SAVE)
+        self.assertEqual(command.args, ['drawings/my canvas.bin'])
+        self.assertEqual(parse('o canvas.xz').keyword, Command.Keyword.LOAD)
+        self.assertRaises(ValueError, parse, 'O')
+        with self.assertRaisesRegex(ValueError, 'line 2: save commands cannot be compiled'):
+            compile_script(['C 20 4', 'S canvas.bin'])
+
+    def test_compile_script_ok(self):
+        lines = ['C 20 4', '', 'L 1 2 6 2', 'r 14 1 18 3', 'B 10 3 o', 'Q']
+        buffer = compile_script(lines)
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer['args'][1].tolist(), [1, 2, 6, 2])
+        self.assertEqual(chr(buffer['color'][3]), 'o')
+        commands = list(iter_commands(buffer))
+        self.assertEqual([format_command(c) for c in commands], ['C 20 4', 'L 1 2 6 2', 'R 14 1 18 3', 'B 10 3 o', 'Q'])
+
+    def test_compile_script_reports_line(self):
+        with self.assertRaisesRegex(TypeError, 'line 2'):
+            compile_script(['C 20 4', 'L 1 x 6 2'])
+        with self.assertRaisesRegex(ValueError, 'line 3'):
+            compile_script(['C 20 4', '', 'Z'])
+
+
+if __name__ == '__main__':
+    t = CommandParserTest()
@@ -0,0 +1,88 @@
+"""
+Unit tests for indexed module
+"""
+
+import random
+import unittest
+import numpy as np
+from canvas import MemoryLessCanvas
+from history import History
+from indexed import IndexedCanvas
+
+
+class IndexedCanvasTest(unittest.TestCase):
+    def assertIndexed(self, canvas: IndexedCanvas):
+        canvas._update()
+        self.assertEqual(set(np.unique(canvas.labels).tolist()), set(canvas.components))
+        for (label, (color, top, bottom, left, right)) in canvas.components.items():
+            (rows, cols) = np.nonzero(canvas.labels == label)
+            self.assertTrue((canvas.data[rows, cols] == color).all())
+            self.assertEqual((rows.min(), rows.max() + 1, cols.min(), cols.max() + 1), (top, bottom, left, right))
+
+    def test_line_splits_component(self):
+        canvas = IndexedCanvas()
+        canvas.create(10, 5)
+        canvas.draw('line', 4, 1, 4, 5)
+        self.assertIndexed(canvas)
+        self.assertEqual(sorted(color for (color, *_) in canvas.components.values()), [32, 32, 120])
+        canvas.fill(1, 1, 'o')
+        self.assertEqual(canvas.to_string(), '\n'.join(['-' * 12] + ['|ooox      |'] * 5 + ['-' * 12]))
+
+    def test_fill_merges_components(self):
+        canvas = IndexedCanvas()
+        canvas.create(6, 3)
+        canvas.draw('line', 3, 1, 3, 3)
+        canvas.fill(1, 1, 'o')
+        canvas.fill(6, 1, 'o')
+        # Both sides are now 'o' and the line between them is the only other component
+        canvas.fill(3, 1, 'o')
+        self.assertIndexed(canvas)
+        self.assertEqual(list(canvas.components.values()), [[ord('o'), 0, 3, 0, 6]])
+
+    def test_clone_rebuilds_its_index(self):
+        canvas = IndexedCanvas()
+        canvas.create(8, 4)
+        canvas.draw('line', 4, 1, 4, 4)
+        canvas.fill(1, 1, 'o')
+        twin = canvas.clone()
+        twin.fill(8, 1, 'o')
+        self.assertIndexed(twin)
+        self.assertIndexed(canvas)
+        self.assertEqual(canvas.to_string().count('o'), 12)
+        self.assertEqual(twin.to_string().count('o'), 28)
+
+    def test_same_as_dense_canvas(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            (w, h) = (rng.randint(1, 15), rng.randint(1, 10))
+            canvases = (IndexedCanvas(History()), MemoryLessCanvas(History()))
+            for canvas in canvases:
+                canvas.create(w, h)
+            for _ in range(rng.randint(1, 25)):
+                choice = rng.random()
+                if choice < 0.4:
+                    (x, y) = (rng.randint(0, w + 1), rng.randint(0, h + 1))
+                    kind = rng.random()
+                    args = ('draw', 'line', x, y, x, rng.randint(0, h + 1)) if kind < 0.4 else \
+                        ('draw', 'line', x, y, rng.randint(0, w + 1), y) if kind < 0.8 else \
+                        ('draw', 'line', x, y, rng.randint(-w, 2 * w), rng.randint(-h, 2 * h))
+                elif choice < 0.5:
+                    args = ('draw', 'rect', rng.randint(0, w), rng.randint(0, h), w, h)
+                elif choice < 0.9:
+                    args = ('fill', rng.randint(1, w), rng.randint(1, h), rng.choice('xo#'))
+                else:
+                    args = (rng.choice(['undo', 'redo', 'clear']),)
+                for canvas in canvases:
+                    try:
+                        getattr(canvas, args[0])(*args[1:])
+                    except ValueError:
+                        pass
+                if not canvases[1].created():
+                    break
+                self.assertTrue((canvases[0].data == canvases[1].data).all())
+            if canvases[0].created():
+                self.assertIndexed(canvases[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Unit tests for instrumentation module
+"""
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from canvas import MemoryLessCanvas
+from command_executor import SyncCommandExecutor
+from instrumentation import Histogram, Stats, InstrumentedExecutor, InstrumentedWriter, instrument_canvas, profiled
+from primitives import Command
+from small import AdaptiveCanvas
+from writer import AsciiFormatter
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = Stats()
+        self.canvas = instrument_canvas(MemoryLessCanvas(), self.stats)
+        self.executor = InstrumentedExecutor(SyncCommandExecutor(), self.stats)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for seconds in (0.5e-6, 3e-6, 3e-6, 100e-6):
+            histogram.add(seconds)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.percentile(50), 4e-6)
+        self.assertEqual(histogram.percentile(100), 100e-6)
+        self.assertEqual(histogram.to_dict()['buckets_us'], {'1': 1, '4': 2, '128': 1})
+
+    def test_cells_per_command(self):
+        self.executor.execute(self.canvas, Command(Command.Keyword.CREATE, 10, 5))
+        self.executor.execute(self.canvas, Command(Command.Keyword.LINE, 1, 2, 10, 2))
+        self.executor.execute(self.canvas, Command(Command.Keyword.RECT, 1, 1, 3, 3))
+        self.executor.execute(self.canvas, Command(Command.Keyword.FILL, 10, 5, 'o'))
+        self.assertEqual(self.stats.cells['LINE'], 10)
+        self.assertEqual(self.stats.cells['RECT'], 12)
+        self.assertEqual(self.stats.cells['FILL'], 27)
+        self.assertEqual(self.stats.latency['LINE'].count, 1)
+
+    def test_cells_on_every_storage(self):
+        canvas = instrument_canvas(AdaptiveCanvas(threshold=100), self.stats)
+        self.executor.execute(canvas, Command(Command.Keyword.CREATE, 10, 5))
+        self.executor.execute(canvas, Command(Command.Keyword.LINE, 1, 2, 10, 2))
+        self.executor.execute(canvas, Command(Command.Keyword.LINE, 1, 1, 3, 3))
+        self.executor.execute(canvas, Command(Command.Keyword.FILL, 10, 5, 'o'))
+        self.assertEqual(self.stats.cells['LINE'], 13)
+        self.assertEqual(self.stats.cells['FILL'], 29)
+        # A larger canvas switches to a dense storage, which is counted as well
+        self.executor.execute(canvas, Command(Command.Keyword.CREATE, 20, 10))
+        self.executor.execute(canvas, Command(Command.Keyword.LINE, 1, 1, 20, 1))
+        self.assertEqual(self.stats.cells['LINE'], 33)
+        # So is the storage of a clone taken over on rollback, and only it is painted
+        backup = canvas.clone()
+        canvas.restore(backup)
+        self.executor.execute(canvas, Command(Command.Keyword.LINE, 1, 2, 20, 2))
+        self.assertEqual(self.stats.cells['LINE'], 53)
+        self.assertEqual(canvas.to_string().count('x'), 40)
+
+    def test_clones_paint_themselves(self):
+        self.executor.execute(self.canvas, Command(Command.Keyword.CREATE, 5, 2))
+        twin = self.canvas.clone()
+        twin.draw_line(1, 1, 5, 1)
+        self.assertEqual(twin.to_string().count('x'), 5)
+        self.assertEqual(self.canvas.to_string().count('x'), 0)
+        self.assertEqual(self.stats.painted, 5)
+        # A failed batch is rolled back on the instrumented canvas itself
+        with mock.patch.object(self.canvas, 'fill', side_effect=RuntimeError('out of luck')):
+            with self.assertRaises(RuntimeError):
+                self.executor.execute_many(self.canvas, [Command(Command.Keyword.LINE, 1, 2, 5, 2),
+                                                         Command(Command.Keyword.FILL, 1, 1, 'o')])
+        self.assertEqual(self.canvas.to_string().count('x'), 0)
+        self.canvas.draw_line(1, 1, 1, 2)
+        self.assertEqual(self.canvas.to_string().count('x'), 2)
+
+    def test_stats_on_default_canvas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            script = os.path.join(directory, 'script.txt')
+            with open(script, 'w') as f:
+                f.write('C 10 5\nL 1 2 10 2\nB 1 1 o\nI\n')
+            main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+            report = subprocess.run([sys.executable, main, '--stats', '--script', script],
+                                    capture_output=True, text=True, check=True).stderr
+        self.assertIn('cells painted by LINE: 10', report)
+        self.assertIn('cells painted by FILL: 10', report)
+
+    def test_failed_command_is_recorded(self):
+        with self.assertRaises(ValueError):
+            self.executor.execute(self.canvas, Command(Command.Keyword.LINE, 1, 2, 10, 2))
+        self.assertEqual(self.stats.latency['LINE'].count, 1)
+
+    def test_bytes_written(self):
+        stream = io.BytesIO()
+        writer = InstrumentedWriter(AsciiFormatter(stream), self.stats)
+        self.executor.execute(self.canvas, Command(Command.Keyword.CREATE, 10, 5))
+        writer.render(self.canvas)
+        # to_string is implemented with to_bytes, the nested call must not be counted twice
+        self.assertEqual(len(self.canvas.to_string()), 7 * 13 - 1)
+        self.assertEqual(self.stats.bytes_written, 7 * 13 - 1)
+        self.assertEqual(self.stats.latency['serialize'].count, 2)
+        self.assertEqual(self.stats.latency['render'].count, 1)
+
+    def test_report(self):
+        self.executor.execute(self.canvas, Command(Command.Keyword.CREATE, 10, 5))
+        report = self.stats.report()
+        self.assertIn('CREATE', report)
+        self.assertIn('peak memory', report)
+        self.assertEqual(set(self.stats.to_dict()), {'elapsed', 'latency', 'cells', 'bytes_written', 'peak_memory'})
+
+    def test_profiled(self):
+        output = io.StringIO()
+        with profiled('cprofile', output):
+            self.executor.execute(self.canvas, Command(Command.Keyword.CREATE, 10, 5))
+        self.assertIn('function calls', output.getvalue())
+        output = io.StringIO()
+        with profiled('tracemalloc', output):
+            self.executor.execute(self.canvas, Command(Command.Keyword.CREATE, 10, 5))
+        self.assertIn('peak', output.getvalue())
+        self.assertRaises(ValueError, profiled('unknown').__enter__)
+
+
+if __name__ == '__main__':
+    unittest.main()
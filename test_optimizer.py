@@ -0,0 +1,70 @@
+"""
+Unit tests for optimizer module
+"""
+
+import unittest
+from canvas import MemoryLessCanvas
+from command_executor import SyncCommandExecutor
+from command_parser import parse, format_command
+from primitives import Command
+from optimizer import optimize, AFTER_QUIT, BEFORE_CREATE, DUPLICATE, MERGED, NO_EFFECT, OUTSIDE, REPEATED_FILL
+
+
+def run(commands):
+    canvas = MemoryLessCanvas()
+    executor = SyncCommandExecutor()
+    for command in commands:
+        if command.keyword == Command.Keyword.QUIT:
+            break
+        if command.keyword != Command.Keyword.FLUSH:
+            executor.execute(canvas, command)
+    return canvas.to_string()
+
+
+class OptimizerTest(unittest.TestCase):
+    def optimize(self, lines, simulate=False):
+        original = [parse(line) for line in lines]
+        (commands, eliminated) = optimize(original, simulate)
+        self.assertEqual(run(commands), run(original))
+        return [format_command(command) for command in commands], eliminated
+
+    def test_before_create_and_after_quit(self):
+        (commands, eliminated) = self.optimize(['C 5 5', 'L 1 1 5 1', 'C 4 3', 'L 1 1 4 1', 'Q', 'B 1 1 o'])
+        self.assertEqual(commands, ['C 4 3', 'L 1 1 4 1'])
+        self.assertEqual(eliminated, {BEFORE_CREATE: 2, AFTER_QUIT: 2})
+
+    def test_shapes(self):
+        (commands, eliminated) = self.optimize(['C 10 6', 'L 1 1 4 1', 'L 5 1 7 1', 'R 2 2 6 5', 'L 3 5 5 5',
+                                                'R 2 2 6 5', 'L 20 1 20 5', 'L 8 0 8 9'])
+        self.assertEqual(commands, ['C 10 6', 'R 2 2 6 5', 'L 1 1 7 1', 'L 8 1 8 6'])
+        self.assertEqual(eliminated, {MERGED: 1, DUPLICATE: 2, OUTSIDE: 1})
+
+    def test_shapes_are_not_moved_across_fills(self):
+        (commands, _) = self.optimize(['C 10 6', 'L 1 3 10 3', 'B 1 1 o', 'L 1 3 10 3'])
+        self.assertEqual(commands, ['C 10 6', 'L 1 3 10 3', 'B 1 1 o', 'L 1 3 10 3'])
+
+    def test_fills(self):
+        (commands, eliminated) = self.optimize(['C 10 6', 'B 1 1 o', 'B 1 1 o', 'B 11 1 o', 'B 2 2 c'])
+        self.assertEqual(commands, ['C 10 6', 'B 1 1 o', 'B 2 2 c'])
+        self.assertEqual(eliminated, {REPEATED_FILL: 1, OUTSIDE: 1})
+
+    def test_simulate(self):
+        (commands, eliminated) = self.optimize(['C 10 6', 'B 1 1 o', 'B 3 3 o', 'L 1 2 3 2', 'L 2 2 2 2'],
+                                               simulate=True)
+        self.assertEqual(commands, ['C 10 6', 'B 1 1 o', 'L 1 2 3 2'])
+        self.assertEqual(eliminated, {NO_EFFECT: 1, MERGED: 1})
+
+    def test_saved_state_is_kept(self):
+        lines = ['C 5 5', 'L 1 1 5 1', 'S canvas.bin', 'C 4 3', 'L 1 1 4 1', 'L 1 1 2 1']
+        (commands, eliminated) = optimize([parse(line) for line in lines], simulate=True)
+        self.assertEqual([format_command(command) for command in commands], lines[:-1])
+        self.assertEqual(eliminated, {MERGED: 1})
+
+    def test_undo_disables_compaction(self):
+        lines = ['C 5 5', 'L 1 1 5 1', 'C 4 3', 'U', 'F']
+        (commands, _) = optimize([parse(line) for line in lines])
+        self.assertEqual([format_command(command) for command in commands], lines[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Unit tests for parallel module
+"""
+
+import unittest
+import numpy as np
+from canvas import MemoryLessCanvas
+from parallel import SharedCanvas
+
+
+class SharedCanvasTest(unittest.TestCase):
+    def setUp(self):
+        # No threshold, so that even small canvases go through the workers
+        self.canvas = SharedCanvas(workers=2, threshold=0)
+
+    def tearDown(self):
+        self.canvas.close()
+
+    def test_to_string(self):
+        reference = MemoryLessCanvas()
+        for canvas in (self.canvas, reference):
+            canvas.create(20, 9)
+            canvas.draw('rect', 2, 2, 15, 8)
+        self.assertEqual(self.canvas.to_string(), reference.to_string())
+
+    def test_fill_across_bands(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            grid = np.where(rng.random((17, 23)) < 0.4, 120, 32).astype('uint8')
+            reference = MemoryLessCanvas()
+            for canvas in (self.canvas, reference):
+                canvas.create(23, 17)
+                canvas.data[:] = grid
+                canvas.take_dirty_rows()
+            (x, y) = rng.integers(1, 18, 2)
+            self.canvas.fill(x, y, 'o')
+            reference.fill(x, y, 'o')
+            self.assertTrue((self.canvas.data == reference.data).all())
+            self.assertEqual(self.canvas.take_dirty_rows(), reference.take_dirty_rows())
+
+    def test_recreate(self):
+        self.canvas.create(10, 10)
+        self.canvas.fill(1, 1, 'o')
+        self.canvas.create(5, 3)
+        self.canvas.fill(5, 3, 'c')
+        self.assertEqual(self.canvas.to_string(), '\n'.join(['-' * 7] + ['|ccccc|'] * 3 + ['-' * 7]))
+
+    def test_failed_create_keeps_drawing(self):
+        self.canvas.create(5, 3)
+        self.canvas.fill(1, 1, 'c')
+        with self.assertRaises(ValueError):
+            self.canvas.create(-5, 3)
+        self.assertEqual(self.canvas.to_string(), '\n'.join(['-' * 7] + ['|ccccc|'] * 3 + ['-' * 7]))
+
+
+if __name__ == '__main__':
+    unittest.main()
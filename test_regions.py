@@ -0,0 +1,48 @@
+"""
+Unit tests for regions module
+"""
+
+import unittest
+import numpy as np
+import regions
+
+
+class RegionsTest(unittest.TestCase):
+    def test_runs(self):
+        mask = np.array([[1, 1, 0, 1],
+                         [0, 0, 0, 0],
+                         [1, 1, 1, 1]], dtype='bool')
+        (rows, starts, ends) = regions.runs(mask)
+        self.assertEqual(rows.tolist(), [0, 0, 2])
+        self.assertEqual(starts.tolist(), [0, 3, 0])
+        self.assertEqual(ends.tolist(), [2, 4, 4])
+
+    def test_touching(self):
+        (a, b) = regions.touching(np.array([0, 4, 8]), np.array([2, 6, 10]), np.array([1, 6]), np.array([5, 8]))
+        self.assertEqual(list(zip(a.tolist(), b.tolist())), [(0, 0), (1, 0)])
+
+    def test_components(self):
+        roots = regions.components(6, np.array([5, 1, 3]), np.array([3, 2, 1]))
+        self.assertEqual(roots.tolist(), [0, 1, 1, 1, 4, 1])
+
+    def test_label_runs(self):
+        # Two regions: a U shape and an isolated point; diagonal neighbours are not connected
+        mask = np.array([[1, 0, 1, 0],
+                         [1, 0, 1, 0],
+                         [1, 1, 1, 0],
+                         [0, 0, 0, 1]], dtype='bool')
+        (rows, starts, ends, labels) = regions.label_runs(mask)
+        self.assertEqual(len(set(labels.tolist())), 2)
+        u = regions.run_at(rows, starts, ends, 0, 0)
+        self.assertEqual(labels[regions.run_at(rows, starts, ends, 2, 0)], labels[u])
+        self.assertNotEqual(labels[regions.run_at(rows, starts, ends, 3, 3)], labels[u])
+        self.assertEqual(regions.run_at(rows, starts, ends, 1, 0), -1)
+
+    def test_paint_runs(self):
+        grid = np.zeros((2, 3), dtype='uint8')
+        regions.paint_runs(grid, np.array([0, 1]), np.array([1, 0]), np.array([3, 3]), 7)
+        self.assertEqual(grid.tolist(), [[0, 7, 7], [7, 7, 7]])
+
+
+if __name__ == '__main__':
+    unittest.main()
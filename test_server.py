@@ -0,0 +1,89 @@
+"""
+Unit tests for server module
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from server import Server
+
+
+async def session(address, lines):
+    """
+    Send commands to a server and collect everything it sends back until it closes the connection
+    """
+    if isinstance(address, str):
+        (reader, writer) = await asyncio.open_unix_connection(address)
+    else:
+        (reader, writer) = await asyncio.open_connection(*address)
+    writer.write(''.join(f'{line}\n' for line in lines).encode())
+    writer.write_eof()
+    output = await reader.read()
+    writer.close()
+    return output.decode()
+
+
+class ServerTest(unittest.TestCase):
+    def run_sessions(self, scripts, server=None, unix=False):
+        server = server or Server()
+
+        async def run():
+            if unix:
+                directory = tempfile.mkdtemp()
+                address = os.path.join(directory, 'canvas.sock')
+                listener = await server.start_unix(address)
+            else:
+                listener = await server.start_tcp('127.0.0.1', 0)
+                address = listener.sockets[0].getsockname()[:2]
+            async with listener:
+                return await asyncio.gather(*(session(address, lines) for lines in scripts))
+        try:
+            return asyncio.run(run())
+        finally:
+            server.close()
+
+    def test_sessions_are_independent(self):
+        scripts = [['C 3 1', 'L 1 1 3 1', 'F', 'Q', 'F'], ['C 2 2', 'B 1 1 o', 'F']] * 20
+        outputs = self.run_sessions(scripts)
+        self.assertEqual(outputs[0], '-----\n|xxx|\n-----\n')
+        self.assertEqual(outputs[1], '----\n|oo|\n|oo|\n----\n')
+        self.assertEqual(set(outputs), set(outputs[:2]))
+
+    def test_unix_socket(self):
+        (output,) = self.run_sessions([['C 1 1', 'F']], unix=True)
+        self.assertEqual(output, '---\n| |\n---\n')
+
+    def test_errors_and_limits(self):
+        (output,) = self.run_sessions([['X', 'F', 'C 1000 1000', 'S canvas.bin', 'C 10 10', 'R 3 3 1 1']],
+                                      Server(max_points=10000))
+        self.assertEqual(output.splitlines(), [
+            'Unknown command, please repeat',
+            'Canvas must first be created',
+            'Canvas too large, at most 10000 points are allowed',
+            'Command not available on the server',
+            'Rectangle must have a non-negative area, try again',
+        ])
+
+    def test_viewport_frames(self):
+        (output,) = self.run_sessions([['C 300 100', 'R 1 1 300 100', 'Z 100', 'F', 'Z 1', 'P 10 10', 'F']])
+        lines = output.splitlines()
+        self.assertEqual(lines[:3], ['-----', '|xxx|', '-----'])
+        # Back to full detail, the view is fitted to the bottom of the canvas
+        self.assertEqual(len(lines), 3 + 62)
+        self.assertEqual(lines[-2], '|' + 'x' * 200 + '|')
+
+    def test_large_canvas_runs_in_pool(self):
+        (output,) = self.run_sessions([['C 500 300', 'R 1 1 500 300', 'B 2 2 o', 'F']])
+        self.assertEqual(len(output), 302 * 503)
+        self.assertEqual(output.count('o'), 498 * 298)
+
+    def test_too_many_sessions(self):
+        server = Server(max_sessions=0)
+        (output,) = self.run_sessions([['C 1 1', 'F']], server)
+        self.assertEqual(output, 'Too many sessions, try again later\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""
+Unit tests for small module
+"""
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from canvas import MemoryLessCanvas, TiledCanvas, _line_points
+from small import ByteCanvas, AdaptiveCanvas, line_points
+
+
+class LinePointsTest(unittest.TestCase):
+    def test_same_as_vectorized_ok(self):
+        rng = random.Random(7)
+        for _ in range(2000):
+            (x1, x2) = (rng.randint(-20, 40), rng.randint(-20, 40))
+            (y1, y2) = (rng.randint(-20, 40), rng.randint(-20, 40))
+            (w, h) = (rng.randint(1, 25), rng.randint(1, 25))
+            (rows, cols) = _line_points([x1, y1, x2, y2], w, h)
+            self.assertEqual(sorted(line_points(x1, y1, x2, y2, w, h)),
+                             sorted(zip(cols.tolist(), rows.tolist())))
+
+
+class ByteCanvasTest(unittest.TestCase):
+    def draw_scene(self, canvas):
+        canvas.create(30, 12)
+        canvas.draw_line(1, 3, 30, 3)
+        canvas.draw_line(12, 1, 12, 12)
+        canvas.draw_line(-5, 20, 40, -2)
+        canvas.draw_rect(15, 5, 28, 11)
+        canvas.draw_line(20, 10, 20, 10)
+        canvas.fill(20, 8, 'o')
+        canvas.fill(1, 12, '.')
+        canvas.fill(12, 3, '#')
+
+    def test_same_as_dense_ok(self):
+        (small, dense) = (ByteCanvas(), MemoryLessCanvas())
+        for canvas in (small, dense):
+            self.draw_scene(canvas)
+        self.assertEqual(small.to_string(), dense.to_string())
+        self.assertEqual(small.rows_to_bytes(2, 5), dense.rows_to_bytes(2, 5))
+        self.assertEqual(small.take_dirty_rows(), (0, 12))
+        small.draw_line(3, 7, 5, 7)
+        self.assertEqual(small.take_dirty_rows(), (6, 7))
+        small.clear()
+        dense.clear()
+        self.assertEqual(small.to_bytes(), dense.to_bytes())
+
+    def test_random_sessions_ok(self):
+        rng = random.Random(11)
+        for _ in range(200):
+            (small, dense) = (ByteCanvas(), MemoryLessCanvas())
+            (w, h) = (rng.randint(1, 15), rng.randint(1, 15))
+            for canvas in (small, dense):
+                canvas.create(w, h)
+            for _ in range(8):
+                if rng.random() < 0.7:
+                    coords = [rng.randint(-3, 18) for _ in range(4)]
+                    for canvas in (small, dense):
+                        canvas.draw_line(*coords)
+                else:
+                    (x, y, color) = (rng.randint(0, w + 1), rng.randint(0, h + 1), rng.choice('xo. '))
+                    for canvas in (small, dense):
+                        canvas.fill(x, y, color)
+            self.assertEqual(small.to_bytes(), dense.to_bytes())
+
+    def test_invalid_throws(self):
+        canvas = ByteCanvas()
+        self.assertRaises(ValueError, canvas.create, -1, 3)
+        canvas.create(5, 5)
+        self.assertRaises(ValueError, canvas.draw_rect, 4, 1, 2, 3)
+        self.assertRaises(ValueError, canvas.undo)
+
+    def test_clone_and_snapshot_ok(self):
+        canvas = ByteCanvas()
+        self.draw_scene(canvas)
+        twin = canvas.clone()
+        self.assertIs(twin.data, canvas.data)
+        twin.fill(1, 1, '+')
+        self.assertNotEqual(twin.to_string(), canvas.to_string())
+        # Only the first canvas to paint copies the points
+        data = canvas.data
+        canvas.draw_line(1, 1, 1, 1)
+        self.assertIs(canvas.data, data)
+        self.assertEqual(twin.data[0], ord('+'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'canvas.bin')
+            canvas.save(path)
+            dense = MemoryLessCanvas()
+            dense.load(path)
+            self.assertEqual(dense.to_string(), canvas.to_string())
+            loaded = ByteCanvas()
+            loaded.load(path)
+            self.assertEqual(loaded.to_string(), canvas.to_string())
+
+
+class AdaptiveCanvasTest(unittest.TestCase):
+    def test_storage_follows_size(self):
+        canvas = AdaptiveCanvas(threshold=100)
+        canvas.create(10, 10)
+        self.assertIsInstance(canvas.canvas, ByteCanvas)
+        canvas.create(20, 10)
+        self.assertIsInstance(canvas.canvas, MemoryLessCanvas)
+        canvas.draw('line', 1, 1, 20, 10)
+        dense = MemoryLessCanvas()
+        dense.create(20, 10)
+        dense.draw('line', 1, 1, 20, 10)
+        self.assertEqual(canvas.to_string(), dense.to_string())
+        canvas.create(3, 3)
+        self.assertIsInstance(canvas.canvas, ByteCanvas)
+        self.assertEqual((canvas.width, canvas.height), (3, 3))
+
+    def test_load_picks_storage(self):
+        large = MemoryLessCanvas()
+        large.create(40, 40)
+        large.draw_rect(2, 2, 30, 30)
+        canvas = AdaptiveCanvas(large=lambda: TiledCanvas(8), threshold=100)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'canvas.bin')
+            large.save(path)
+            canvas.load(path)
+        self.assertIsInstance(canvas.canvas, TiledCanvas)
+        self.assertEqual(canvas.to_string(), large.to_string())
+
+    def test_failed_switch_keeps_drawing(self):
+        canvas = AdaptiveCanvas(threshold=100)
+        canvas.create(5, 5)
+        canvas.draw('line', 1, 1, 5, 1)
+        expected = canvas.to_string()
+        self.assertRaises(ValueError, canvas.create, -1000, -1000)
+        self.assertRaises(ValueError, canvas.create, 1000, -1000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'canvas.bin')
+            large = MemoryLessCanvas()
+            large.create(40, 40)
+            large.save(path)
+            with open(path, 'r+b') as f:
+                f.truncate(100)
+            self.assertRaises(ValueError, canvas.load, path)
+        self.assertIsInstance(canvas.canvas, ByteCanvas)
+        self.assertEqual(canvas.to_string(), expected)
+
+    def test_startup_without_numpy(self):
+        code = 'import main, sys; print("numpy" in sys.modules)'
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Unit tests for snapshot module and the canvas snapshot methods
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+import snapshot
+from canvas import MemoryLessCanvas, TiledCanvas, RunLengthCanvas
+from indexed import IndexedCanvas
+from history import History
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'canvas.bin')
+        self.data = np.full((30, 50), 32, dtype='uint8')
+        self.data[5:20, 10:40] = ord('o')
+        self.data[12, :] = ord('x')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip_ok(self):
+        for compression in snapshot.COMPRESSIONS.values():
+            snapshot.save(self.path, self.data, compression)
+            with open(self.path, 'rb') as f:
+                self.assertEqual(snapshot.read_header(f), (50, 30, compression))
+            loaded = snapshot.load(self.path)
+            self.assertTrue((loaded == self.data).all())
+            # Loaded grids can be drawn on
+            loaded[0, 0] = ord('x')
+        self.assertLess(os.path.getsize(self.path), self.data.size // 4)
+
+    def test_uncompressed_is_mapped(self):
+        snapshot.save(self.path, self.data)
+        loaded = snapshot.load(self.path)
+        self.assertIsInstance(loaded, np.memmap)
+        loaded[:] = ord('#')
+        # Changes stay in memory
+        self.assertTrue((snapshot.load(self.path) == self.data).all())
+
+    def test_compression_for(self):
+        self.assertEqual(snapshot.compression_for('drawing.bin'), snapshot.COMPRESSION_NONE)
+        self.assertEqual(snapshot.compression_for('drawing.zz'), snapshot.COMPRESSION_ZLIB)
+        self.assertEqual(snapshot.compression_for('drawing.XZ'), snapshot.COMPRESSION_LZMA)
+
+    def test_corrupted_throws(self):
+        snapshot.save(self.path, self.data)
+        with open(self.path, 'r+b') as f:
+            f.truncate(snapshot.HEADER.size + 10)
+        self.assertRaises(ValueError, snapshot.load, self.path)
+        snapshot.save(self.path, self.data, snapshot.COMPRESSION_ZLIB)
+        with open(self.path, 'r+b') as f:
+            f.truncate(snapshot.HEADER.size + 10)
+        self.assertRaises(ValueError, snapshot.load, self.path)
+        self.assertRaises(ValueError, snapshot.save, self.path, self.data, 7)
+
+    def test_canvases_load_ok(self):
+        source = MemoryLessCanvas()
+        source.create(40, 12)
+        source.draw_rect(3, 2, 30, 10)
+        source.draw_line(1, 6, 40, 6)
+        source.fill(5, 4, 'o')
+        source.save(self.path)
+        for canvas in (MemoryLessCanvas(), TiledCanvas(tile_size=8), RunLengthCanvas(), IndexedCanvas()):
+            canvas.create(3, 3)
+            canvas.take_dirty_rows()
+            canvas.load(self.path)
+            self.assertEqual(canvas.to_string(), source.to_string())
+            self.assertEqual(canvas.take_dirty_rows(), (0, 12))
+            # The loaded canvas is a regular one
+            canvas.fill(1, 1, '.')
+            canvas.save(self.path + '.xz', snapshot.COMPRESSION_LZMA)
+            self.assertEqual(snapshot.load(self.path + '.xz')[0, 0], ord('.'))
+            self.assertTrue((snapshot.load(self.path) == source.data).all())
+
+    def test_load_undo_ok(self):
+        canvas = MemoryLessCanvas(History())
+        canvas.create(5, 5)
+        canvas.draw_line(1, 1, 5, 1)
+        canvas.save(self.path)
+        canvas.create(8, 2)
+        canvas.load(self.path)
+        self.assertEqual((canvas.width, canvas.height), (5, 5))
+        canvas.undo()
+        self.assertEqual((canvas.width, canvas.height), (8, 2))
+        canvas.redo()
+        self.assertEqual(canvas.data[0].tolist(), [120] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
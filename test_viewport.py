@@ -0,0 +1,106 @@
+"""
+Unit tests for viewport module and the canvas viewport rendering
+"""
+
+import unittest
+import numpy as np
+
+from canvas import MemoryLessCanvas, TiledCanvas, RunLengthCanvas
+from indexed import IndexedCanvas
+from small import ByteCanvas
+from traits import Canvas
+from viewport import Viewport
+
+
+class ViewportTest(unittest.TestCase):
+    def test_pan_and_zoom_ok(self):
+        view = Viewport(10, 4)
+        view.pan(3, 2)
+        self.assertEqual((view.left, view.top), (3, 2))
+        # Zooming keeps the center of the viewport where it is
+        view.set_zoom(3)
+        self.assertEqual((view.left, view.top, view.zoom), (-7, -2, 3))
+        view.pan(1, -1)
+        self.assertEqual((view.left, view.top), (-4, -5))
+        self.assertRaises(ValueError, view.set_zoom, 0)
+        self.assertRaises(ValueError, Viewport, 0, 4)
+
+    def test_fit_keeps_view_inside_canvas(self):
+        view = Viewport(10, 4, left=95, top=-3)
+        self.assertEqual(view.fit(100, 50), (10, 4))
+        self.assertEqual((view.left, view.top), (90, 0))
+        # A canvas smaller than the viewport is shown as a whole
+        self.assertEqual(view.fit(6, 3), (6, 3))
+        self.assertEqual((view.left, view.top), (0, 0))
+        view.set_zoom(4)
+        self.assertEqual(view.fit(6, 3), (2, 1))
+
+    def test_samples_ok(self):
+        view = Viewport(2, 1, zoom=10)
+        (ys, xs, k) = view.samples(15, 8)
+        self.assertEqual(k, 4)
+        self.assertEqual(ys, [0, 2, 5, 7])
+        self.assertEqual(xs, [0, 2, 5, 7, 10, 12, 14, 14])
+
+
+class ViewToBytesTest(unittest.TestCase):
+    def draw_scene(self, canvas):
+        canvas.create(40, 30)
+        canvas.draw_rect(3, 2, 25, 20)
+        canvas.draw_line(1, 30, 40, 1)
+        canvas.fill(10, 10, 'o')
+        canvas.fill(35, 28, '.')
+
+    def test_same_as_whole_canvas_ok(self):
+        canvas = MemoryLessCanvas()
+        self.draw_scene(canvas)
+        self.assertEqual(canvas.view_to_bytes(Viewport(100, 100)), canvas.to_bytes())
+        lines = canvas.to_string().split('\n')
+        window = canvas.view_to_bytes(Viewport(10, 5, left=20, top=8)).decode().split('\n')
+        self.assertEqual(window[1:-1], ['|' + line[21:31] + '|' for line in lines[9:14]])
+        self.assertEqual(window[0], '-' * 12)
+
+    def test_zoomed_out_overview(self):
+        canvas = MemoryLessCanvas()
+        canvas.create(12, 6)
+        canvas.draw_line(2, 1, 2, 6)
+        canvas.fill(12, 6, '.')
+        # Every cell shows the most frequent drawn color of its 3 x 3 area, 'x' winning the tie with '.'
+        self.assertEqual(canvas.view_to_bytes(Viewport(zoom=3)).decode(), '------\n|x...|\n|x...|\n------')
+
+    def test_zoomed_out_cell_shows_most_frequent_color(self):
+        for canvas in (MemoryLessCanvas(), ByteCanvas()):
+            canvas.create(12, 6)
+            canvas.fill(1, 1, 'o')
+            canvas.draw('line', 2, 1, 2, 6)
+            # The thin line doesn't cover the filled area around it
+            self.assertEqual(canvas.view_to_bytes(Viewport(zoom=3)).decode(), '------\n|oooo|\n|oooo|\n------')
+
+    def test_same_for_every_canvas(self):
+        reference = MemoryLessCanvas()
+        self.draw_scene(reference)
+        views = [dict(columns=12, rows=7, left=5, top=4), dict(columns=9, rows=5, left=30, top=25, zoom=3),
+                 dict(columns=3, rows=3, zoom=7)]
+        for canvas in (TiledCanvas(8), RunLengthCanvas(), IndexedCanvas()):
+            self.draw_scene(canvas)
+            for view in views:
+                self.assertEqual(canvas.view_to_bytes(Viewport(**view)), reference.view_to_bytes(Viewport(**view)))
+                # Generic implementation going through the whole canvas
+                self.assertEqual(Canvas.view_to_bytes(canvas, Viewport(**view)),
+                                 reference.view_to_bytes(Viewport(**view)))
+
+    def test_huge_canvas_ok(self):
+        for canvas in (TiledCanvas(), RunLengthCanvas()):
+            canvas.create(100000, 100000)
+            canvas.draw_rect(1000, 1000, 99000, 99000)
+            view = Viewport(20, 10, left=990, top=995)
+            frame = np.frombuffer(canvas.view_to_bytes(view) + b'\n', dtype='uint8').reshape(12, 23)
+            self.assertEqual(bytes(frame[5, 1:21]), b' ' * 9 + b'x' * 11)
+            self.assertEqual(bytes(frame[6, 1:21]), b' ' * 9 + b'x' + b' ' * 10)
+            self.assertEqual(bytes(frame[2, 1:21]), b' ' * 20)
+            view.set_zoom(10000)
+            self.assertEqual(canvas.view_to_bytes(view).count(b'\n'), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Unit tests for writer module
+"""
+
+import io
+import time
+import unittest
+from contextlib import redirect_stdout
+
+from canvas import MemoryLessCanvas as Canvas
+from writer import AsciiFormatter, BufferedWriter, SimpleWriter
+from viewport import Viewport
+
+
+class AsciiFormatterTest(unittest.TestCase):
+    def test_first_frame_repaints_everything(self):
+        stream = io.BytesIO()
+        writer = AsciiFormatter(stream)
+        canvas = Canvas()
+        canvas.create(4, 2)
+        writer.render(canvas)
+        self.assertEqual(stream.getvalue(), b'\x1b[H\x1b[2J' + canvas.to_bytes() + b'\n')
+
+    def test_changed_rows_repainted_only(self):
+        stream = io.BytesIO()
+        writer = AsciiFormatter(stream)
+        canvas = Canvas()
+        canvas.create(4, 3)
+        writer.render(canvas)
+        stream.seek(0)
+        stream.truncate()
+
+        canvas.draw_line(1, 2, 3, 2)
+        writer.render(canvas)
+        self.assertEqual(stream.getvalue(), b'\x1b[3;1H|xxx |\n\x1b[6;1H\x1b[J')
+
+    def test_resize_repaints_everything(self):
+        stream = io.BytesIO()
+        writer = AsciiFormatter(stream)
+        canvas = Canvas()
+        canvas.create(4, 3)
+        writer.render(canvas)
+        canvas.create(2, 2)
+        canvas.take_dirty_rows()
+        stream.seek(0)
+        stream.truncate()
+
+        writer.render(canvas)
+        self.assertEqual(stream.getvalue(), b'\x1b[H\x1b[2J' + canvas.to_bytes() + b'\n')
+
+    def test_viewport_repainted_as_a_whole(self):
+        stream = io.BytesIO()
+        writer = AsciiFormatter(stream)
+        writer.viewport = Viewport(2, 2, left=1, top=1)
+        canvas = Canvas()
+        canvas.create(100, 100)
+        canvas.draw_line(1, 2, 3, 2)
+        writer.render(canvas)
+        self.assertEqual(stream.getvalue(), b'\x1b[H\x1b[2J----\n|xx|\n|  |\n----\n')
+
+    def test_non_ascii_colors_encoded(self):
+        stream = io.BytesIO()
+        writer = AsciiFormatter(stream, encoding='utf-8')
+        canvas = Canvas()
+        canvas.create(2, 2)
+        canvas.fill(1, 1, '\xe9')
+        writer.render(canvas)
+        self.assertEqual(stream.getvalue(), '\x1b[H\x1b[2J----\n|\xe9\xe9|\n|\xe9\xe9|\n----\n'.encode())
+        stream.seek(0)
+        stream.truncate()
+        canvas.draw_line(1, 1, 1, 1)
+        writer.render(canvas)
+        self.assertEqual(stream.getvalue(), '\x1b[2;1H|x\xe9|\n\x1b[5;1H\x1b[J'.encode())
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+class BufferedWriterTest(unittest.TestCase):
+    def test_same_output_as_simple_writer(self):
+        canvas = Canvas()
+        canvas.create(5, 3)
+        canvas.draw_line(1, 1, 5, 3)
+        text = io.StringIO()
+        with redirect_stdout(text):
+            SimpleWriter().render(canvas)
+        stream = CountingStream()
+        writer = BufferedWriter(stream)
+        writer.render(canvas)
+        writer.write('done')
+        self.assertEqual(stream.getvalue(), (text.getvalue() + 'done\n\n\n').encode())
+        self.assertEqual(stream.writes, 2)
+
+    def test_non_ascii_colors_encoded(self):
+        canvas = Canvas()
+        canvas.create(3, 1)
+        canvas.fill(1, 1, '\xe9')
+        text = io.StringIO()
+        with redirect_stdout(text):
+            SimpleWriter().render(canvas)
+        for encoding in ('utf-8', 'cp1252'):
+            stream = io.BytesIO()
+            writer = BufferedWriter(stream, encoding=encoding)
+            writer.render(canvas)
+            writer.write('d\xe9j\xe0 \u20ac')
+            self.assertEqual(stream.getvalue(), (text.getvalue() + 'd\xe9j\xe0 \u20ac\n\n\n').encode(encoding))
+
+    def test_frames_dropped_above_max_fps(self):
+        now = [0.0]
+        stream = CountingStream()
+        writer = BufferedWriter(stream, max_fps=1, clock=lambda: now[0])
+        for text in ('a', 'b', 'c'):
+            writer.write(text)
+            now[0] += 0.1
+        self.assertEqual(stream.getvalue(), b'a\n\n\n')
+        self.assertEqual(writer.dropped, 1)
+        # The latest frame goes out on flush, only once
+        writer.flush()
+        writer.flush()
+        self.assertEqual(stream.getvalue(), b'a\n\n\nc\n\n\n')
+        now[0] = 5
+        writer.write('d')
+        self.assertEqual(stream.writes, 3)
+        self.assertRaises(ValueError, BufferedWriter, stream, -1)
+
+    def test_held_back_frame_written_after_interval(self):
+        stream = CountingStream()
+        writer = BufferedWriter(stream, max_fps=50)
+        writer.write('a')
+        writer.write('b')
+        time.sleep(0.2)
+        self.assertEqual(stream.getvalue(), b'a\n\n\nb\n\n\n')
+        writer.flush()
+        self.assertEqual(stream.writes, 2)
+
+
+if __name__ == '__main__':
+    t = AsciiFormatterTest()
@@ -7,9 +7,10 @@ the application operates on.
 
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional, Tuple
 
 from primitives import Command
+from viewport import Viewport, dominant, frame
 
 
 class Canvas(ABC):
@@ -17,6 +18,22 @@ class Canvas(ABC):
     The application state.
     """
 
+    @property
+    @abstractmethod
+    def width(self) -> int:
+        """
+        Canvas width getter
+        """
+        pass
+
+    @property
+    @abstractmethod
+    def height(self) -> int:
+        """
+        Canvas height getter
+        """
+        pass
+
     @abstractmethod
     def create(self, width: int, height: int):
         """
@@ -43,6 +60,46 @@ class Canvas(ABC):
         """
         pass
 
+    def to_bytes(self) -> bytes:
+        """
+        Serialize canvas contents into bytes, ready to be written to a binary stream without decoding
+        :return: serialized canvas contents
+        """
+        return self.to_string().encode('latin-1')
+
+    def rows_to_bytes(self, top: int, bottom: int) -> bytes:
+        """
+        Serialize a range of canvas rows framed with side borders, one line per row
+        :param top: first row to serialize (0-based)
+        :param bottom: row following the last one to serialize (0-based)
+        :return: serialized rows, each one terminated with a line break
+        """
+        lines = self.to_bytes().split(b'\n')[top + 1:bottom + 1]
+        return b''.join(line + b'\n' for line in lines)
+
+    def view_to_bytes(self, view: Viewport) -> bytes:
+        """
+        Serialize the part of the canvas seen through a viewport, framed with borders like the whole canvas.
+        A zoomed out cell shows the most frequent drawn color among the points sampled in its area.
+        Implementations are encouraged to override it with a version whose cost follows the viewport size
+        :param view: the viewport, fitted to the canvas by the call
+        :return: serialized viewport
+        """
+        lines = self.to_bytes().split(b'\n')
+        (ys, xs, k) = view.samples(self.width, self.height)
+        cells = [bytes(dominant(lines[y + 1][x + 1] for y in ys[i:i + k] for x in xs[j:j + k])
+                       for j in range(0, len(xs), k))
+                 for i in range(0, len(ys), k)]
+        return frame(cells, len(xs) // k)
+
+    def take_dirty_rows(self) -> Optional[Tuple[int, int]]:
+        """
+        Report the rows changed since the previous call and reset the tracking
+        :return: [top, bottom) range of changed rows (0-based), an empty range if nothing changed,
+         None if the implementation doesn't track changes
+        """
+        return None
+
     @abstractmethod
     def draw(self, *argv):
         """
@@ -52,6 +109,64 @@ class Canvas(ABC):
         """
         pass
 
+    def draw_many(self, shape, coords):
+        """
+        Batch drawing method; draws the same shape once per row of coordinates.
+        Implementations are encouraged to override it with a vectorized version
+        :param shape: concrete shape to draw
+        :param coords: sequence of coordinate rows
+        :return:
+        """
+        for row in coords:
+            self.draw(shape, *row)
+
+    def undo(self):
+        """
+        Revert the latest change
+        :return:
+        """
+        raise ValueError('Undo is not supported by this canvas')
+
+    def redo(self):
+        """
+        Apply the latest reverted change again
+        :return:
+        """
+        raise ValueError('Redo is not supported by this canvas')
+
+    def clone(self):
+        """
+        Independent copy of the canvas, the same kind of canvas whenever possible
+        :return: the copy
+        """
+        raise ValueError('Cloning is not supported by this canvas')
+
+    def restore(self, backup):
+        """
+        Bring the canvas back to the state of a clone of it taken earlier, e.g. to roll back a failed batch
+        of commands; the clone must not be used afterwards
+        :param backup: the clone
+        :return:
+        """
+        raise ValueError('Rollback is not supported by this canvas')
+
+    def save(self, path: str, compression: int = 0):
+        """
+        Write the canvas contents to a snapshot file (see snapshot module)
+        :param path: snapshot file
+        :param compression: payload compression method, one of snapshot.COMPRESSION_*
+        :return:
+        """
+        raise ValueError('Snapshots are not supported by this canvas')
+
+    def load(self, path: str):
+        """
+        Replace the canvas with the contents of a snapshot file, its dimensions included
+        :param path: snapshot file
+        :return:
+        """
+        raise ValueError('Snapshots are not supported by this canvas')
+
     @abstractmethod
     def fill(self, x: int, y: int, color: str):
         """
@@ -77,12 +192,34 @@ class Writer(ABC):
 
     Concrete implementations may include variants ranging from simple console printing to
     more sophisticated version with ASCII animaion etc.
+
+    A writer given a viewport prints the part of the canvas seen through it rather than the whole canvas.
     """
 
+    viewport: Optional[Viewport] = None
+
     @abstractmethod
     def write(self, data: str):
         pass
 
+    def render(self, canvas: Canvas):
+        """
+        Print out the canvas state
+        :param canvas: the canvas to print
+        :return:
+        """
+        if self.viewport is not None:
+            self.write(canvas.view_to_bytes(self.viewport).decode('latin-1'))
+            return
+        self.write(canvas.to_string())
+
+    def flush(self):
+        """
+        Print out the frames held back by the writer, if any; called once no more frames are coming
+        :return:
+        """
+        pass
+
 
 class CommandExecutor(ABC):
     """
@@ -0,0 +1,108 @@
+"""
+This module describes the window through which a large canvas is looked at.
+
+A viewport shows a fixed number of cells, each one standing for a square of zoom x zoom canvas points.
+Rendering only visits a bounded number of points per cell, so its cost follows the size of the viewport
+rather than the size of the canvas. The module doesn't depend on NumPy: canvases sample the points
+the viewport asks for and reduce them in their own way.
+"""
+
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+# Points sampled along each side of a zoomed out cell, zoom levels up to it look at every point
+SAMPLES = 4
+
+DASH = b'-'
+BAR = b'|'
+BLANK = ord(' ')
+
+
+class Viewport:
+    """
+    Window onto a canvas: its top left point, its size in cells and the number of points per cell side
+    """
+
+    def __init__(self, columns: int = 200, rows: int = 60, left: int = 0, top: int = 0, zoom: int = 1):
+        """
+        :param columns: number of cells across
+        :param rows: number of cells down
+        :param left: 0-based x coordinate of the first point shown
+        :param top: 0-based y coordinate of the first point shown
+        :param zoom: canvas points per cell side, 1 to show every point
+        """
+        if columns <= 0 or rows <= 0:
+            raise ValueError('Viewport must have a positive size')
+        if zoom <= 0:
+            raise ValueError('Zoom level must be a positive number of points per cell')
+        self.columns = columns
+        self.rows = rows
+        self.left = left
+        self.top = top
+        self.zoom = zoom
+
+    def pan(self, dx: int, dy: int):
+        """
+        Move the viewport
+        :param dx: number of cells to move right, negative to move left
+        :param dy: number of cells to move down, negative to move up
+        """
+        self.left += dx * self.zoom
+        self.top += dy * self.zoom
+
+    def set_zoom(self, zoom: int):
+        """
+        Change the number of points per cell side, keeping the same point at the center of the viewport
+        """
+        if zoom <= 0:
+            raise ValueError('Zoom level must be a positive number of points per cell')
+        center = (self.left + self.columns * self.zoom // 2, self.top + self.rows * self.zoom // 2)
+        self.zoom = zoom
+        self.left = center[0] - self.columns * zoom // 2
+        self.top = center[1] - self.rows * zoom // 2
+
+    def fit(self, width: int, height: int) -> Tuple[int, int]:
+        """
+        Keep the viewport within a canvas, shrinking it to the canvas if it is larger
+        :return: (columns, rows) of cells actually shown
+        """
+        columns = min(self.columns, -(-width // self.zoom))
+        rows = min(self.rows, -(-height // self.zoom))
+        self.left = max(min(self.left, width - columns * self.zoom), 0)
+        self.top = max(min(self.top, height - rows * self.zoom), 0)
+        return columns, rows
+
+    def samples(self, width: int, height: int) -> Tuple[List[int], List[int], int]:
+        """
+        Points to look at to render the viewport over a canvas, the viewport being fitted to it first
+        :return: (ys, xs, k) - 0-based coordinates of the sampled rows and columns of points, k consecutive ones
+         per cell, sorted
+        """
+        (columns, rows) = self.fit(width, height)
+        k = min(self.zoom, SAMPLES)
+        offsets = [i * self.zoom // k for i in range(k)]
+        xs = [min(self.left + c * self.zoom + offset, width - 1) for c in range(columns) for offset in offsets]
+        ys = [min(self.top + r * self.zoom + offset, height - 1) for r in range(rows) for offset in offsets]
+        return ys, xs, k
+
+
+def dominant(colors: Iterable[int]) -> int:
+    """
+    Color a zoomed out cell shows: the most frequent drawn color among its sampled points,
+    the highest one on ties, or blank if nothing is drawn there
+    :param colors: colors of the sampled points
+    :return: color of the cell
+    """
+    counts = Counter(color for color in colors if color != BLANK)
+    return max(counts, key=lambda color: (counts[color], color)) if counts else BLANK
+
+
+def frame(lines: Iterable[bytes], columns: int) -> bytes:
+    """
+    Lay out rows of cells the way a whole canvas is serialized: framed with borders, one line per row
+    :param lines: cells of every row
+    :param columns: number of cells per row
+    :return: the frame, without a line break after the bottom border
+    """
+    border = DASH * (columns + 2)
+    return b'\n'.join([border] + [BAR + line + BAR for line in lines] + [border])
@@ -3,13 +3,178 @@ This module contains concrete implementations of the Writer interface.
 Simplest possible implementation would just print the command prompt and wrap printing into stdout.
 """
 
-from traits import Writer
+import sys
+import threading
+import time
+from typing import BinaryIO, Callable, Optional, Tuple
+from traits import Writer, Canvas
+
+ANSI_HOME_CLEAR = b'\x1b[H\x1b[2J'
+ANSI_CLEAR_BELOW = b'\x1b[J'
+
+
+def ansi_move_to(line: int) -> bytes:
+    """
+    ANSI escape sequence moving the cursor to the beginning of a terminal line
+    :param line: 1-based terminal line number
+    """
+    return b'\x1b[%d;1H' % line
+
+
+def write_frame(stream: Optional[BinaryIO], frame: bytes):
+    """
+    Write a whole frame at once and flush it
+    :param stream: binary stream to write to, stdout by default
+    :param frame: the frame
+    """
+    if stream is None:
+        # Whatever has been printed through the text layer must go out first
+        sys.stdout.flush()
+        stream = sys.stdout.buffer
+    stream.write(frame)
+    stream.flush()
+
+
+def encode_frame(frame: bytes, encoding: Optional[str] = None) -> bytes:
+    """
+    Encode canvas contents for the terminal the way print() would
+    :param frame: contents serialized by the canvas, one latin-1 byte per point
+    :param encoding: encoding of the terminal, the one of stdout by default
+    """
+    if frame.isascii():
+        return frame
+    return frame.decode('latin-1').encode(terminal_encoding(encoding), errors='replace')
+
+
+def terminal_encoding(encoding: Optional[str] = None) -> str:
+    """
+    Encoding the frames are written in: the given one, otherwise the one of stdout
+    """
+    return encoding or getattr(sys.stdout, 'encoding', None) or 'utf-8'
+
 
 class SimpleWriter(Writer):
     def write(self, data: str):
         print(f'{data}\n\n')
 
 
+class BufferedWriter(Writer):
+    """
+    Writer printing the same frames as SimpleWriter, encoded once and written to the binary stream
+    in a single call rather than through the line buffered text layer.
+
+    With a maximum frame rate, a frame coming less than 1 / max_fps seconds after the previous one is held back
+    and replaced by any later one; the latest frame held back is written once the interval is over,
+    or right away by flush(), so the final state is always shown.
+    """
+
+    def __init__(self, stream: Optional[BinaryIO] = None, max_fps: float = 0,
+                 clock: Callable[[], float] = time.monotonic, encoding: Optional[str] = None):
+        """
+        :param stream: binary stream to write to, stdout by default
+        :param max_fps: maximum number of frames written per second, 0 for no limit
+        :param clock: source of the current time in seconds
+        :param encoding: encoding of the terminal, the one of stdout by default
+        """
+        if max_fps < 0:
+            raise ValueError('Frame rate must not be negative')
+        self.stream = stream
+        self.encoding = encoding
+        self.interval = 1 / max_fps if max_fps else 0
+        self.clock = clock
+        self.dropped = 0
+        self._last: Optional[float] = None
+        self._pending: Optional[bytes] = None
+        self._timer: Optional[threading.Timer] = None
+        # Held back frames are written from a timer thread
+        self._lock = threading.Lock()
+
+    def write(self, data: str):
+        self._submit(data.encode(terminal_encoding(self.encoding), errors='replace'))
+
+    def render(self, canvas: Canvas):
+        data = canvas.view_to_bytes(self.viewport) if self.viewport is not None else canvas.to_bytes()
+        self._submit(encode_frame(data, self.encoding))
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._release()
+
+    def _submit(self, data: bytes):
+        frame = data + b'\n\n\n'
+        with self._lock:
+            now = self.clock()
+            wait = self._last + self.interval - now if self._last is not None else 0
+            if wait <= 0:
+                self._pending = None
+                self._emit(frame, now)
+                return
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = frame
+            if self._timer is None:
+                self._timer = threading.Timer(wait, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+            self._release()
+
+    def _release(self):
+        if self._pending is not None:
+            self._emit(self._pending, self.clock())
+            self._pending = None
+
+    def _emit(self, frame: bytes, now: float):
+        write_frame(self.stream, frame)
+        self._last = now
+
+
 class AsciiFormatter(Writer):
+    """
+    Terminal writer that keeps the canvas at the top of the screen and repaints only the rows
+    changed since the previous frame, moving the cursor with ANSI escape sequences.
+    The prompt and messages go below the canvas and are wiped out by the next frame.
+    With a viewport, only the part of the canvas seen through it is shown.
+    """
+
+    def __init__(self, stream: Optional[BinaryIO] = None, encoding: Optional[str] = None):
+        """
+        :param stream: binary stream to write to, stdout by default
+        :param encoding: encoding of the terminal, the one of stdout by default
+        """
+        self.stream = stream
+        self.encoding = encoding
+        self.shape: Optional[Tuple[int, int]] = None
+
     def write(self, data: str):
-        pass
+        self.shape = None
+        self._emit(ANSI_HOME_CLEAR + data.encode(terminal_encoding(self.encoding), errors='replace') + b'\n')
+
+    def render(self, canvas: Canvas):
+        rows = canvas.take_dirty_rows()
+        if self.viewport is not None:
+            # The view is small by design, it is repainted as a whole
+            self.shape = None
+            self._emit(ANSI_HOME_CLEAR + encode_frame(canvas.view_to_bytes(self.viewport), self.encoding) + b'\n')
+            return
+        shape = (canvas.width, canvas.height)
+        if rows is None or shape != self.shape:
+            # Nothing is known about the screen contents - repaint everything
+            self._emit(ANSI_HOME_CLEAR + encode_frame(canvas.to_bytes(), self.encoding) + b'\n')
+            self.shape = shape
+            return
+
+        # Terminal line 1 is the top border, so canvas row i is on terminal line i + 2
+        (top, bottom) = rows
+        changed = encode_frame(canvas.rows_to_bytes(top, bottom), self.encoding)
+        frame = ansi_move_to(top + 2) + changed if top < bottom else b''
+        self._emit(frame + ansi_move_to(canvas.height + 3) + ANSI_CLEAR_BELOW)
+
+    def _emit(self, frame: bytes):
+        write_frame(self.stream, frame)